@@ -31,6 +31,9 @@ env = environ.Env(
     EMAIL_HOST_USER=(str, ''),
     EMAIL_HOST_PASSWORD=(str, ''),
     DEFAULT_FROM_EMAIL=(str, ''),
+    CACHE_URL=(str, 'filecache:///tmp/asistencias_cache'),
+    REPORTE_PROCESOS=(int, 4),
+    REPORTE_EMPLEADOS_MIN_PROCESOS=(int, 150),
 )
 
 # Read .env file
@@ -67,6 +70,8 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    # ETag por hash de contenido y 304 para GET sin cambios (reportes y dashboards)
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -110,6 +115,16 @@ DATABASES = {
 }
 
 
+# Caché compartida entre los workers de gunicorn (archivo por defecto; p. ej. rediscache:// en .env)
+CACHES = {
+    'default': env.cache('CACHE_URL'),
+}
+
+# Reportes: con al menos REPORTE_EMPLEADOS_MIN_PROCESOS empleados el análisis se reparte
+# en REPORTE_PROCESOS procesos (1 = siempre en el proceso del worker)
+REPORTE_PROCESOS = env('REPORTE_PROCESOS')
+REPORTE_EMPLEADOS_MIN_PROCESOS = env('REPORTE_EMPLEADOS_MIN_PROCESOS')
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
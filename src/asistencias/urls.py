@@ -13,6 +13,7 @@ urlpatterns = [
     path("manager-page/", views.manager_page, name="manager-page"),
     path("admin-gestion-empleados/", views.gestion_empleados, name="admin-gestion-empleados"),
     path("empleados/crear/", views.crear_empleado, name="guardar_empleado"),
+    path("api/empleados/importar/", views.api_importar_empleados, name="api_importar_empleados"),
     path("empleados/eliminar/<int:empleado_id>/", views.eliminar_empleado, name="eliminar-empleado"),
     # ----------------------------------------------------
     # 🟢 CAMBIO CRÍTICO 1: URL para Formulario 1 (Datos Personales/Email)
@@ -39,10 +40,13 @@ urlpatterns = [
     # === ¡AGREGA ESTAS DOS LÍNEAS AQUÍ! ===
     path('api/lista_sucursales/', views.api_lista_sucursales, name='api_lista_sucursales'),
     path('api/lista_horarios/', views.api_lista_horarios, name='api_lista_horarios'),
+    path('api/lista_empleados/', views.api_lista_empleados, name='api_lista_empleados'),
+    path('api/empleados/buscar/', views.api_buscar_empleados, name='api_buscar_empleados'),
     # ========================================
     path('api/empleado/<int:empleado_id>/horarios/', views.get_horarios_empleado, name='api_horarios_empleado'),
     # En urls.py, dentro de urlpatterns
     path('api/horarios/eliminar/<int:horario_id>/', views.api_eliminar_horario_flexible, name='api_eliminar_horario'),
+    path('api/horarios/reasignar/', views.api_reasignar_horarios, name='api_reasignar_horarios'),
     # 🟢 RUTA AÑADIDA PARA EXPORTAR EL EXCEL DE LA LISTA DE EMPLEADOS 🟢
     path("admin-gestion-empleados/exportar/excel/", views.exportar_lista_empleados_excel, name="exportar_lista_empleados_excel"),
     # ----------------------------------------------------
@@ -3,20 +3,117 @@
 """
 API client module for fetching data from external services.
 Handles communication with Frappe API for check-ins and leave applications.
+Requests go through requests (sync views) or httpx (async views).
 """
 
+import asyncio
+import contextvars
 import json
+import threading
+import time
+import httpx
 import requests
 import pytz
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import List, Dict, Any
 
-from .config import API_URL, LEAVE_API_URL, EMPLOYEE_API_URL, get_api_headers
+from .config import (
+    API_URL, LEAVE_API_URL, EMPLOYEE_API_URL, API_TIMEOUT,
+    ERP_CIRCUIT_FAILURE_THRESHOLD, ERP_CIRCUIT_COOLDOWN_SECONDS, get_api_headers
+)
 from .utils import normalize_leave_type
 
 
+class ERPUnavailableError(Exception):
+    """Raised when the ERP cannot be reached or answers with an unusable response."""
+
+
+class ERPRequestError(ERPUnavailableError):
+    """Raised when the ERP rejects the request itself (4xx): it is up, so the circuit stays closed."""
+
+
+# True inside a request already admitted by the circuit breaker (see CircuitBreaker.guard)
+_erp_admitted = contextvars.ContextVar("erp_admitted", default=False)
+
+
+class CircuitBreaker:
+    """
+    Skips ERP calls for a cool-down window after repeated consecutive failures.
+
+    The circuit is checked once per request (see guard), not per HTTP call. Once the
+    window expires a single trial request is let through with all of its calls; if
+    they fail the circuit opens again, if one succeeds the failure count is reset.
+    Only outages count as failures: timeouts, connection errors and 5xx answers.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown_seconds: int):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._failures = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """Raises ERPUnavailableError while the circuit is open."""
+        with self._lock:
+            remaining = self._open_until - time.monotonic()
+            if remaining > 0:
+                raise ERPUnavailableError(
+                    f"ERP unavailable (circuit open, next attempt in {int(remaining) + 1}s)")
+            if self._failures >= self.failure_threshold:
+                # Half-open: this call is the trial, the rest wait for its result
+                self._open_until = time.monotonic() + self.cooldown_seconds
+
+    @contextmanager
+    def guard(self):
+        """
+        Admits one request, which may issue many ERP calls, through the circuit.
+
+        Nested guards and the calls made inside it are not checked again, including
+        asyncio tasks started inside it and threads run with a copy of its context.
+
+        Raises:
+            ERPUnavailableError: While the circuit is open
+        """
+        if _erp_admitted.get():
+            yield
+            return
+        self.before_call()
+        token = _erp_admitted.set(True)
+        try:
+            yield
+        finally:
+            _erp_admitted.reset(token)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._open_until = 0.0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._open_until = time.monotonic() + self.cooldown_seconds
+                print(f"🚧 ERP circuit open for {self.cooldown_seconds}s after {self._failures} consecutive failures")
+
+
+# Shared by every APIClient in the process (one per gunicorn worker)
+erp_circuit = CircuitBreaker(ERP_CIRCUIT_FAILURE_THRESHOLD, ERP_CIRCUIT_COOLDOWN_SECONDS)
+
+
 class APIClient:
     """Client for handling API requests to Frappe/ERPNext."""
+
+    # Device-id patterns per branch key ("Villas", "31pte", ... as sent by main.py)
+    DEVICE_PATTERNS = {
+        "Todas": ["%"],
+        "Villas": ["%villas%", "%Villas%", "%VILLAS%", "%VLLA%"],
+        "31pte": ["%31pte%", "%31%pte%", "%31%", "%pte%", "%31PTE%"],
+        "Nave": ["%nave%", "%Nave%", "%NAVE%", "%NAV%"],
+        "RioBlanco": ["%rioblanco%", "%RioBlanco%", "%Rio%Blanco%", "%Rio%", "%Blanco%"]
+    }
     
     def __init__(self):
         """Initialize API client with default configuration."""
@@ -24,132 +121,83 @@ class APIClient:
         self.leave_url = LEAVE_API_URL
         self.employee_url = EMPLOYEE_API_URL
         self.page_length = 5000
-        self.timeout = 180
-    
-    def fetch_checkins(self, start_date: str, end_date: str, device_filter: str) -> List[Dict[str, Any]]:
-        """
-        Fetches all check-in records from the API for a date range.
-        """
-        print(f"📡 Obtaining check-ins from API for device '{device_filter}'...")
-        print(f"   - Date range: {start_date} to {end_date}")
-        
-        try:
-            headers = get_api_headers()
-            print(f"✅ Headers obtenidos correctamente")
-        except ValueError as e:
-            print(f"❌ Error validating API credentials: {e}")
-            return []
-        
-        # Mapeo mejorado de sucursales
-        device_patterns = {
-            "Todas": ["%"],
-            "Villas": ["%villas%", "%Villas%", "%VILLAS%", "%VLLA%"],
-            "31pte": ["%31pte%", "%31%pte%", "%31%", "%pte%", "%31PTE%"], 
-            "Nave": ["%nave%", "%Nave%", "%NAVE%", "%NAV%"],
-            "RioBlanco": ["%rioblanco%", "%RioBlanco%", "%Rio%Blanco%", "%Rio%", "%Blanco%"]
-        }
-        
-        # Obtener todos los patrones para la sucursal
-        # (Nota: este 'device_filter' es la clave "Villas", "31pte", etc. que viene de main.py)
-        sucursal_key = device_filter 
-        patterns = device_patterns.get(sucursal_key, [device_filter])
-        
-        all_records = []
-        
-        for pattern in patterns:
-            print(f"🔍 Trying pattern: '{pattern}'")
-            
-            filters = json.dumps([
+        self.timeout = API_TIMEOUT
+
+    # ------------------------------------------------------------------
+    # Request building and response handling (shared by sync and async)
+    # ------------------------------------------------------------------
+
+    def _checkin_params(self, start_date: str, end_date: str, pattern: str) -> Dict[str, Any]:
+        """Query parameters for the check-ins of one device pattern."""
+        return {
+            "fields": json.dumps(["employee", "employee_name", "time", "device_id"]),
+            "filters": json.dumps([
                 ["Employee Checkin", "time", "Between", [start_date, end_date]],
                 ["Employee Checkin", "device_id", "like", pattern],
-            ])
-            
-            params = {
-                "fields": json.dumps(["employee", "employee_name", "time", "device_id"]),
-                "filters": filters,
-            }
+            ]),
+        }
 
-            limit_start = 0
-            page = 1
-            pattern_records = []
-
-            while True:
-                params["limit_start"] = limit_start
-                params["limit_page_length"] = self.page_length
-                
-                try:
-                    print(f"🌐 Page {page}: Making API request with pattern '{pattern}'")
-                    
-                    response = requests.get(
-                        self.checkin_url, 
-                        headers=headers, 
-                        params=params,
-                        timeout=self.timeout
-                    )
-                    
-                    print(f"📥 Response status: {response.status_code}")
-                    
-                    if response.status_code != 200:
-                        print(f"❌ API returned status {response.status_code}")
-                        print(f"   - Response text: {response.text[:500]}...")
-                        break
-                    
-                    try:
-                        response_data = response.json()
-                        data = response_data.get("data", [])
-                    except json.JSONDecodeError as e:
-                        print(f"❌ Error decoding JSON response: {e}")
-                        print(f"   - Raw response: {response.text[:500]}...")
-                        break
-                    
-                    print(f"📊 Records in page {page}: {len(data)}")
-                    
-                    if not data:
-                        print("✅ No more data available for this pattern")
-                        break
-
-                    # Process and normalize timezone
-                    for record in data:
-                        try:
-                            time_str = record["time"]
-                            if time_str.endswith('Z'):
-                                time_utc = datetime.fromisoformat(time_str.replace("Z", "+00:00"))
-                            else:
-                                time_utc = datetime.fromisoformat(time_str)
-                                
-                            mexico_tz = pytz.timezone("America/Mexico_City")
-                            time_mexico = time_utc.astimezone(mexico_tz)
-                            record["time"] = time_mexico.isoformat()
-                        except Exception as e:
-                            print(f"❌ Error processing time for record {record.get('employee')}: {e}")
-                            continue
-
-                    pattern_records.extend(data)
-                    
-                    if len(data) < self.page_length:
-                        print("✅ Reached final page for this pattern")
-                        break
-                        
-                    limit_start += self.page_length
-                    page += 1
-                    
-                except requests.exceptions.Timeout:
-                    print("⏰ Timeout connecting to API")
-                    break
-                except requests.exceptions.ConnectionError:
-                    print("🔌 Connection error - API may be unreachable")
-                    break
-                except requests.exceptions.RequestException as e:
-                    print(f"❌ Request error: {e}")
-                    break
-                except Exception as e:
-                    print(f"❌ Unexpected error: {e}")
-                    break
+    def _leave_query_url(self, start_date: str, end_date: str) -> str:
+        """
+        Leave applications that overlap the range:
+        to_date >= start_date and from_date <= end_date.
+        """
+        return f'https://erp.asiatech.com.mx/api/resource/Leave Application?fields=["employee","employee_name","leave_type","from_date","to_date","status","half_day"]&filters=[["status","=","Approved"],["to_date",">=","{start_date}"],["from_date","<=","{end_date}"]]'
 
-            print(f"✅ Pattern '{pattern}' retrieved {len(pattern_records)} records")
-            all_records.extend(pattern_records)
+    def _page_data(self, response, label: str) -> List[Dict[str, Any]]:
+        """
+        Extracts the "data" list from a requests/httpx response.
 
-        # Eliminar duplicados por si hay overlap entre patrones
+        Raises:
+            ERPRequestError: 4xx status (bad credentials or filters)
+            ERPUnavailableError: Any other non-200 status
+            ValueError: Invalid JSON body
+        """
+        if response.status_code != 200:
+            print(f"❌ {label} API returned status {response.status_code}")
+            print(f"   - Response text: {response.text[:500]}...")
+            error = ERPRequestError if 400 <= response.status_code < 500 else ERPUnavailableError
+            raise error(f"{label} API returned status {response.status_code}")
+        return response.json().get("data", [])
+
+    def _page_failed(self, label: str, error: Exception) -> ERPUnavailableError:
+        """
+        Builds the error to raise for a failed page. Only outages (timeouts, connection
+        errors, 5xx) count in the circuit breaker; a 4xx means the ERP is answering.
+        """
+        if isinstance(error, ERPRequestError):
+            erp_circuit.record_success()
+            return error
+        if isinstance(error, ValueError):
+            # Invalid JSON (json.JSONDecodeError is a ValueError)
+            print(f"❌ Error decoding {label} JSON response: {error}")
+            return ERPUnavailableError(f"Invalid response from {label} API")
+        erp_circuit.record_failure()
+        if isinstance(error, ERPUnavailableError):
+            return error
+        if isinstance(error, (requests.exceptions.Timeout, httpx.TimeoutException)):
+            print(f"⏰ Timeout connecting to {label} API")
+            return ERPUnavailableError(f"Timeout connecting to {label} API")
+        print(f"🔌 Error calling {label} API: {error}")
+        return ERPUnavailableError(f"Error calling {label} API: {error}")
+
+    def _normalize_checkin_times(self, records: List[Dict[str, Any]]) -> None:
+        """Converts check-in times (UTC or naive) to Mexico City time, in place."""
+        mexico_tz = pytz.timezone("America/Mexico_City")
+        for record in records:
+            try:
+                time_str = record["time"]
+                if time_str.endswith('Z'):
+                    time_utc = datetime.fromisoformat(time_str.replace("Z", "+00:00"))
+                else:
+                    time_utc = datetime.fromisoformat(time_str)
+                record["time"] = time_utc.astimezone(mexico_tz).isoformat()
+            except Exception as e:
+                print(f"❌ Error processing time for record {record.get('employee')}: {e}")
+                continue
+
+    def _unique_checkins(self, all_records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Removes duplicates produced by overlapping device patterns."""
         unique_records = []
         seen_ids = set()
         
@@ -168,79 +216,111 @@ class APIClient:
         
         return unique_records
 
-    # --- INICIA CORRECCIÓN: fetch_leave_applications ---
-    def fetch_leave_applications(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+    # ------------------------------------------------------------------
+    # Synchronous transport (requests)
+    # ------------------------------------------------------------------
+
+    def _get_page(self, url: str, headers: Dict[str, str], params: Dict[str, Any], label: str) -> List[Dict[str, Any]]:
         """
-        Fetches all approved leave applications from the API for a date range.
+        Requests one page from the ERP; callers run inside erp_circuit.guard().
+
+        Args:
+            url: Resource URL
+            headers: Authentication headers
+            params: Query parameters (filters and pagination)
+            label: Resource name used in log messages
+
+        Returns:
+            The "data" list of the page
+
+        Raises:
+            ERPUnavailableError: If the request fails, so callers never mistake a failed
+                fetch for an empty (or partial) result
         """
-        print(f"📄 Obtaining approved leave applications from API for period {start_date} - {end_date}...")
+        try:
+            response = requests.get(url, headers=headers, params=params, timeout=self.timeout)
+            data = self._page_data(response, label)
+        except (requests.exceptions.RequestException, ValueError, ERPUnavailableError) as e:
+            raise self._page_failed(label, e)
+
+        erp_circuit.record_success()
+        return data
+
+    def _fetch_all(self, url: str, headers: Dict[str, str], params: Dict[str, Any], label: str) -> List[Dict[str, Any]]:
+        """Follows limit_start pagination until a short page is returned."""
+        records = []
+        limit_start = 0
+        page = 1
+
+        while True:
+            page_params = {**params, "limit_start": limit_start, "limit_page_length": self.page_length}
+            data = self._get_page(url, headers, page_params, label)
+            print(f"📊 {label} records in page {page}: {len(data)}")
+
+            records.extend(data)
+            if len(data) < self.page_length:
+                break
+
+            limit_start += self.page_length
+            page += 1
+
+        return records
+    
+    def fetch_checkins(self, start_date: str, end_date: str, device_filter: str) -> List[Dict[str, Any]]:
+        """
+        Fetches all check-in records from the API for a date range.
+
+        Raises:
+            ERPUnavailableError: If any page cannot be fetched (no partial results)
+        """
+        print(f"📡 Obtaining check-ins from API for device '{device_filter}'...")
+        print(f"   - Date range: {start_date} to {end_date}")
         
         try:
             headers = get_api_headers()
+            print(f"✅ Headers obtenidos correctamente")
         except ValueError as e:
             print(f"❌ Error validating API credentials: {e}")
             return []
         
-        # La lógica del filtro de fechas estaba incorrecta.
-        # La lógica NUEVA trae permisos que SE CRUZAN con el rango:
-        #   - La fecha de fin del permiso (to_date) debe ser >= a nuestro inicio (start_date)
-        #   - La fecha de inicio del permiso (from_date) debe ser <= a nuestro fin (end_date)
-        
-        url = f'https://erp.asiatech.com.mx/api/resource/Leave Application?fields=["employee","employee_name","leave_type","from_date","to_date","status","half_day"]&filters=[["status","=","Approved"],["to_date",">=","{start_date}"],["from_date","<=","{end_date}"]]'
+        all_records = []
+        with erp_circuit.guard():
+            for pattern in self.DEVICE_PATTERNS.get(device_filter, [device_filter]):
+                print(f"🔍 Trying pattern: '{pattern}'")
+                pattern_records = self._fetch_all(
+                    self.checkin_url, headers, self._checkin_params(start_date, end_date, pattern), "Check-in")
+                self._normalize_checkin_times(pattern_records)
+                print(f"✅ Pattern '{pattern}' retrieved {len(pattern_records)} records")
+                all_records.extend(pattern_records)
 
-        all_leave_records = []
-        limit_start = 0
-        page = 1
+        return self._unique_checkins(all_records)
 
-        while True:
-            params = {
-                "limit_start": limit_start,
-                "limit_page_length": self.page_length,
-            }
+    def fetch_leave_applications(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+        """
+        Fetches all approved leave applications from the API for a date range.
 
-            try:
-                response = requests.get(
-                    url, 
-                    headers=headers, 
-                    params=params, 
-                    timeout=self.timeout
-                )
-                
-                if response.status_code != 200:
-                    print(f"❌ Leave API returned status {response.status_code}")
-                    break
-                
-                response_data = response.json()
-                data = response_data.get("data", [])
-                
-                print(f"📄 Leave records in page {page}: {len(data)}")
-                
-                if not data:
-                    break
-
-                all_leave_records.extend(data)
-
-                if len(data) < self.page_length:
-                    break
-
-                limit_start += self.page_length
-                page += 1
-
-            except requests.exceptions.Timeout:
-                print("⏰ Timeout connecting to Leave API")
-                break
-            except requests.exceptions.RequestException as e:
-                print(f"❌ Error obtaining leave applications: {e}")
-                break
+        Raises:
+            ERPUnavailableError: If any page cannot be fetched (no partial results)
+        """
+        print(f"📄 Obtaining approved leave applications from API for period {start_date} - {end_date}...")
+        
+        try:
+            headers = get_api_headers()
+        except ValueError as e:
+            print(f"❌ Error validating API credentials: {e}")
+            return []
 
+        with erp_circuit.guard():
+            all_leave_records = self._fetch_all(self._leave_query_url(start_date, end_date), headers, {}, "Leave")
         print(f"✅ Retrieved {len(all_leave_records)} approved leave applications.")
         return all_leave_records
-    # --- FIN CORRECCIÓN ---
-
 
     def fetch_employee_joining_dates(self) -> List[Dict[str, Any]]:
         """
         Fetches all employee records from the API to get their joining dates.
+
+        Raises:
+            ERPUnavailableError: If any page cannot be fetched (no partial results)
         """
         print("👥 Obtaining all employee joining dates from API...")
 
@@ -253,49 +333,105 @@ class APIClient:
         params = {
             "fields": json.dumps(["employee", "date_of_joining"]),
         }
+        with erp_circuit.guard():
+            all_records = self._fetch_all(self.employee_url, headers, params, "Employee")
+        print(f"✅ Retrieved {len(all_records)} employee records.")
+        return all_records
 
-        all_records = []
+    # ------------------------------------------------------------------
+    # Asynchronous transport (httpx), used by the ASGI report views
+    # ------------------------------------------------------------------
+
+    def async_client(self) -> httpx.AsyncClient:
+        """Builds an httpx client with the same timeouts as the sync transport."""
+        connect_timeout, read_timeout = self.timeout
+        return httpx.AsyncClient(timeout=httpx.Timeout(read_timeout, connect=connect_timeout))
+
+    async def _aget_page(self, client: httpx.AsyncClient, url: str, headers: Dict[str, str],
+                         params: Dict[str, Any], label: str) -> List[Dict[str, Any]]:
+        """Async counterpart of _get_page (same circuit breaker and errors)."""
+        try:
+            response = await client.get(url, headers=headers, params=params)
+            data = self._page_data(response, label)
+        except (httpx.HTTPError, ValueError, ERPUnavailableError) as e:
+            raise self._page_failed(label, e)
+
+        erp_circuit.record_success()
+        return data
+
+    async def _afetch_all(self, client: httpx.AsyncClient, url: str, headers: Dict[str, str],
+                          params: Dict[str, Any], label: str) -> List[Dict[str, Any]]:
+        """Async counterpart of _fetch_all."""
+        records = []
         limit_start = 0
         page = 1
 
         while True:
-            params["limit_start"] = limit_start
-            params["limit_page_length"] = self.page_length
+            page_params = {**params, "limit_start": limit_start, "limit_page_length": self.page_length}
+            data = await self._aget_page(client, url, headers, page_params, label)
+            print(f"📊 {label} records in page {page}: {len(data)}")
 
-            try:
-                response = requests.get(
-                    self.employee_url,
-                    headers=headers,
-                    params=params,
-                    timeout=self.timeout
-                )
-                
-                if response.status_code != 200:
-                    print(f"❌ Employee API returned status {response.status_code}")
-                    break
-                
-                response_data = response.json()
-                data = response_data.get("data", [])
-                
-                print(f"👥 Employee records in page {page}: {len(data)}")
-                
-                if not data:
-                    break
-
-                all_records.extend(data)
-
-                if len(data) < self.page_length:
-                    break
-
-                limit_start += self.page_length
-                page += 1
-
-            except requests.exceptions.RequestException as e:
-                print(f"❌ Error calling Employee API: {e}")
+            records.extend(data)
+            if len(data) < self.page_length:
                 break
 
-        print(f"✅ Retrieved {len(all_records)} employee records.")
-        return all_records
+            limit_start += self.page_length
+            page += 1
+
+        return records
+
+    async def afetch_checkins(self, client: httpx.AsyncClient, start_date: str, end_date: str,
+                              device_filter: str) -> List[Dict[str, Any]]:
+        """
+        Async version of fetch_checkins; the device patterns are fetched concurrently.
+
+        Raises:
+            ERPUnavailableError: If any page cannot be fetched (no partial results)
+        """
+        print(f"📡 Obtaining check-ins from API for device '{device_filter}' (async)...")
+        try:
+            headers = get_api_headers()
+        except ValueError as e:
+            print(f"❌ Error validating API credentials: {e}")
+            return []
+
+        patterns = self.DEVICE_PATTERNS.get(device_filter, [device_filter])
+        # One guarded request: when half-open, every pattern belongs to the same trial
+        with erp_circuit.guard():
+            results = await asyncio.gather(*[
+                self._afetch_all(client, self.checkin_url, headers,
+                                 self._checkin_params(start_date, end_date, pattern), "Check-in")
+                for pattern in patterns
+            ])
+
+        all_records = []
+        for pattern, pattern_records in zip(patterns, results):
+            self._normalize_checkin_times(pattern_records)
+            print(f"✅ Pattern '{pattern}' retrieved {len(pattern_records)} records")
+            all_records.extend(pattern_records)
+
+        return self._unique_checkins(all_records)
+
+    async def afetch_leave_applications(self, client: httpx.AsyncClient, start_date: str,
+                                        end_date: str) -> List[Dict[str, Any]]:
+        """
+        Async version of fetch_leave_applications.
+
+        Raises:
+            ERPUnavailableError: If any page cannot be fetched (no partial results)
+        """
+        print(f"📄 Obtaining approved leave applications from API for period {start_date} - {end_date} (async)...")
+        try:
+            headers = get_api_headers()
+        except ValueError as e:
+            print(f"❌ Error validating API credentials: {e}")
+            return []
+
+        with erp_circuit.guard():
+            all_leave_records = await self._afetch_all(
+                client, self._leave_query_url(start_date, end_date), headers, {}, "Leave")
+        print(f"✅ Retrieved {len(all_leave_records)} approved leave applications.")
+        return all_leave_records
 
 
 def procesar_permisos_empleados(leave_data: List[Dict[str, Any]]) -> Dict[str, Dict]:
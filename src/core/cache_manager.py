@@ -0,0 +1,347 @@
+"""
+Cache helpers shared by the services.
+Values live in the configured Django cache (shared across gunicorn workers)
+and are invalidated explicitly from signals when their source data changes.
+"""
+
+import hashlib
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import connection, connections
+from django.db.models import F
+
+# Cache keys
+CLAVE_MAPA_ROLES = "core:mapa_roles"
+
+# Default lifetime; invalidation is explicit, this only bounds stale entries
+TIMEOUT_POR_DEFECTO = 60 * 60
+
+
+def obtener_o_calcular(clave: str, calcular: Callable[[], Any], timeout: int = TIMEOUT_POR_DEFECTO) -> Any:
+    """
+    Returns the cached value for a key, computing and storing it on a miss.
+
+    Args:
+        clave: Cache key
+        calcular: Zero-argument callable that builds the value
+        timeout: Lifetime in seconds
+
+    Returns:
+        The cached or freshly computed value
+    """
+    valor = cache.get(clave)
+    if valor is None:
+        valor = calcular()
+        cache.set(clave, valor, timeout)
+    return valor
+
+
+def invalidar(*claves: str) -> None:
+    """
+    Removes one or more keys from the cache.
+
+    Args:
+        claves: Cache keys to delete
+    """
+    cache.delete_many(list(claves))
+
+
+# =================================================================
+# Single-flight (one computation for N identical concurrent requests)
+# =================================================================
+
+# Max time a worker waits for another worker's computation before doing its own
+SEGUNDOS_ESPERA_ENTRE_WORKERS = 120
+
+_en_vuelo: Dict[str, Future] = {}
+_en_vuelo_lock = threading.Lock()
+
+
+@contextmanager
+def _bloqueo_entre_workers(clave: str, espera_maxima: int = SEGUNDOS_ESPERA_ENTRE_WORKERS):
+    """
+    Serializes a computation across gunicorn workers with a PostgreSQL advisory lock.
+    On other databases (or after espera_maxima) the block runs without the lock.
+    """
+    if connection.vendor != "postgresql":
+        yield
+        return
+
+    llave = int.from_bytes(hashlib.blake2b(clave.encode(), digest_size=8).digest(), "big", signed=True)
+    limite = time.monotonic() + espera_maxima
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [llave])
+            adquirido = cursor.fetchone()[0]
+            if adquirido or time.monotonic() >= limite:
+                break
+            time.sleep(0.2)
+    try:
+        yield
+    finally:
+        if adquirido:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [llave])
+
+
+def calcular_una_vez(clave: str, calcular: Callable[[], Any]) -> Any:
+    """
+    Runs calcular() once for all concurrent callers with the same key.
+
+    Within the process, the first caller computes and the rest wait on its Future.
+    Across workers, the first caller holds an advisory lock; calcular() should look
+    for a result stored meanwhile by another worker before recomputing.
+
+    Args:
+        clave: Key identifying the computation (normalized parameters)
+        calcular: Zero-argument callable
+
+    Returns:
+        The value returned (or the exception raised) by the single computation
+    """
+    with _en_vuelo_lock:
+        futuro = _en_vuelo.get(clave)
+        lider = futuro is None
+        if lider:
+            futuro = Future()
+            _en_vuelo[clave] = futuro
+
+    if not lider:
+        return futuro.result()
+
+    try:
+        with _bloqueo_entre_workers(clave):
+            valor = calcular()
+    except BaseException as e:
+        futuro.set_exception(e)
+        raise
+    else:
+        futuro.set_result(valor)
+        return valor
+    finally:
+        with _en_vuelo_lock:
+            _en_vuelo.pop(clave, None)
+
+
+# =================================================================
+# Stale-while-revalidate (report results)
+# =================================================================
+
+# Results older than this are still served, but trigger a background refresh
+SEGUNDOS_REPORTE_FRESCO = 5 * 60
+# How long a last good result is kept as fallback when the source is slow or down
+TIMEOUT_REPORTE_OBSOLETO = 7 * 24 * 60 * 60
+
+
+def _guardar_revalidable(clave: str, valor: Any, version: Any) -> None:
+    cache.set(clave, {"valor": valor, "version": version, "generado": time.time()}, TIMEOUT_REPORTE_OBSOLETO)
+
+
+def _revalidar_en_segundo_plano(clave: str, calcular: Callable[[], Any], version: Any,
+                                es_cacheable: Callable[[Any], bool]) -> None:
+    """Recomputes an entry in a daemon thread; one refresh per key across all workers."""
+    clave_lock = f"{clave}:revalidando"
+    if not cache.add(clave_lock, True, SEGUNDOS_REPORTE_FRESCO):
+        return
+
+    def revalidar():
+        try:
+            valor = calcular()
+            if es_cacheable(valor):
+                _guardar_revalidable(clave, valor, version)
+        except Exception as e:
+            print(f"⚠️ Background refresh of '{clave}' failed: {e}")
+        finally:
+            cache.delete(clave_lock)
+            # The thread opened its own DB connections
+            connections.close_all()
+
+    threading.Thread(target=revalidar, daemon=True).start()
+
+
+def obtener_con_revalidacion(clave: str, calcular: Callable[[], Any], version: Any = None,
+                             es_cacheable: Callable[[Any], bool] = bool,
+                             segundos_fresco: int = SEGUNDOS_REPORTE_FRESCO) -> Tuple[Any, Optional[float]]:
+    """
+    Stale-while-revalidate lookup.
+
+    A fresh entry is returned as is. A stale entry is returned immediately while a
+    background thread recomputes it. An entry built for another data version is
+    recomputed synchronously, and is only served if that computation fails.
+    Synchronous computations are single-flight: concurrent identical requests share one.
+
+    Args:
+        clave: Cache key
+        calcular: Zero-argument callable that builds the value
+        version: Version of the source data (e.g. schedule assignments)
+        es_cacheable: Tells whether a computed value is a good result worth keeping
+        segundos_fresco: Age after which a background refresh is triggered
+
+    Returns:
+        Tuple (value, age in seconds); the age is None when the value was not cached
+    """
+    entrada = cache.get(clave)
+    ahora = time.time()
+
+    if entrada is not None and entrada["version"] == version:
+        edad = ahora - entrada["generado"]
+        if edad >= segundos_fresco:
+            _revalidar_en_segundo_plano(clave, calcular, version, es_cacheable)
+        return entrada["valor"], edad
+
+    def calcular_y_guardar():
+        reciente = cache.get(clave)
+        if reciente is not None and reciente["version"] == version and reciente["generado"] >= ahora:
+            # Another worker finished it while we waited on the advisory lock
+            return reciente["valor"], True
+        valor = calcular()
+        cacheable = es_cacheable(valor)
+        if cacheable:
+            _guardar_revalidable(clave, valor, version)
+        return valor, cacheable
+
+    valor, cacheable = calcular_una_vez(clave, calcular_y_guardar)
+    if cacheable:
+        return valor, 0.0
+    if entrada is not None:
+        # Last good result, even if it was built before the latest data change
+        return entrada["valor"], ahora - entrada["generado"]
+    return valor, None
+
+
+# =================================================================
+# Reference tables (DiaSemana, Sucursal, Horario, TipoTurno)
+# =================================================================
+
+NOMBRE_VERSION_CATALOGOS = "catalogos"
+NOMBRE_VERSION_ASIGNACIONES = "asignaciones"
+
+# How often (seconds) a worker checks the DB version row for changes made elsewhere
+SEGUNDOS_VERIFICACION_CATALOGOS = 5
+
+_catalogos: Dict[str, Any] = {"version": None, "verificado": 0.0, "datos": None}
+_catalogos_lock = threading.Lock()
+
+
+def obtener_version(nombre: str) -> int:
+    """
+    Reads a data-version counter from the VersionCatalogos table.
+
+    Args:
+        nombre: Counter name (e.g. NOMBRE_VERSION_ASIGNACIONES)
+
+    Returns:
+        Current version, 0 if the counter does not exist yet
+    """
+    from .models import VersionCatalogo
+
+    version = VersionCatalogo.objects.filter(nombre=nombre).values_list("version", flat=True).first()
+    return version or 0
+
+
+def incrementar_version(nombre: str) -> None:
+    """
+    Atomically bumps a data-version counter, creating it if missing.
+
+    Args:
+        nombre: Counter name
+    """
+    from .models import VersionCatalogo
+
+    actualizadas = VersionCatalogo.objects.filter(nombre=nombre).update(version=F("version") + 1)
+    if not actualizadas:
+        VersionCatalogo.objects.get_or_create(nombre=nombre)
+
+
+def _cargar_catalogos() -> Dict[str, Any]:
+    from .models import DiaSemana, Horario, Sucursal, TipoTurno
+
+    dias = list(DiaSemana.objects.order_by("dia_id"))
+    sucursales = list(Sucursal.objects.order_by("sucursal_id"))
+    horarios = list(Horario.objects.order_by("hora_entrada", "horario_id"))
+    tipos_turno = list(TipoTurno.objects.order_by("tipo_turno_id"))
+    return {
+        "dias": dias,
+        "sucursales": sucursales,
+        "horarios": horarios,
+        "tipos_turno": tipos_turno,
+        "horarios_por_id": {h.horario_id: h for h in horarios},
+        "sucursales_por_id": {s.sucursal_id: s for s in sucursales},
+    }
+
+
+def obtener_catalogos() -> Dict[str, Any]:
+    """
+    Returns the in-process copy of the reference tables, reloading it only when the
+    DB version row changed. The version is checked at most every
+    SEGUNDOS_VERIFICACION_CATALOGOS seconds, so most calls run no query at all.
+
+    Returns:
+        Dict with lists "dias", "sucursales", "horarios", "tipos_turno" and the
+        lookups "horarios_por_id" and "sucursales_por_id"
+    """
+    ahora = time.monotonic()
+    datos = _catalogos["datos"]
+    if datos is not None and ahora - _catalogos["verificado"] < SEGUNDOS_VERIFICACION_CATALOGOS:
+        return datos
+
+    with _catalogos_lock:
+        if _catalogos["datos"] is not None and ahora - _catalogos["verificado"] < SEGUNDOS_VERIFICACION_CATALOGOS:
+            return _catalogos["datos"]
+        version = obtener_version(NOMBRE_VERSION_CATALOGOS)
+        if _catalogos["datos"] is None or version != _catalogos["version"]:
+            _catalogos["datos"] = _cargar_catalogos()
+            _catalogos["version"] = version
+        _catalogos["verificado"] = ahora
+        return _catalogos["datos"]
+
+
+def invalidar_catalogos() -> None:
+    """
+    Bumps the DB version row (so every worker reloads) and drops this worker's copy.
+    """
+    incrementar_version(NOMBRE_VERSION_CATALOGOS)
+    with _catalogos_lock:
+        _catalogos["datos"] = None
+        _catalogos["version"] = None
+
+
+def obtener_version_catalogos() -> int:
+    """Returns the catalog version this worker is serving (used for ETags)."""
+    obtener_catalogos()
+    return _catalogos["version"] or 0
+
+
+def obtener_dias_semana() -> List:
+    """Returns the DiaSemana rows ordered by dia_id (1=Lunes ... 7=Domingo)."""
+    return obtener_catalogos()["dias"]
+
+
+def obtener_sucursales() -> List:
+    """Returns all Sucursal rows."""
+    return obtener_catalogos()["sucursales"]
+
+
+def obtener_horarios() -> List:
+    """Returns all Horario rows ordered by entry time."""
+    return obtener_catalogos()["horarios"]
+
+
+def obtener_tipos_turno() -> List:
+    """Returns all TipoTurno rows."""
+    return obtener_catalogos()["tipos_turno"]
+
+
+def obtener_horario(horario_id: int) -> Optional[Any]:
+    """Returns the Horario with that id, or None."""
+    return obtener_catalogos()["horarios_por_id"].get(horario_id)
+
+
+def obtener_sucursal(sucursal_id: int) -> Optional[Any]:
+    """Returns the Sucursal with that id, or None."""
+    return obtener_catalogos()["sucursales_por_id"].get(sucursal_id)
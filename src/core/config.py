@@ -20,6 +20,13 @@ API_URL = "https://erp.asiatech.com.mx/api/resource/Employee Checkin"
 LEAVE_API_URL = "https://erp.asiatech.com.mx/api/resource/Leave Application"
 EMPLOYEE_API_URL = "https://erp.asiatech.com.mx/api/resource/Employee"
 
+# Request timeout (connect, read) in seconds; a slow ERP must not hold a worker thread for minutes
+API_TIMEOUT = (5, 60)
+
+# Circuit breaker: after this many consecutive failures ERP calls are skipped for the cool-down window
+ERP_CIRCUIT_FAILURE_THRESHOLD = 3
+ERP_CIRCUIT_COOLDOWN_SECONDS = 60
+
 # ==============================================================================
 # VALIDATION FUNCTIONS
 # ==============================================================================
@@ -78,6 +85,10 @@ OUTPUT_DETAILED_REPORT = "reporte_asistencia_analizado.csv"
 OUTPUT_SUMMARY_REPORT = "resumen_periodo.csv" 
 OUTPUT_HTML_DASHBOARD = "dashboard_asistencia.html"
 
+# Detail report: at most this many checado_N columns per day; punches beyond it
+# are only counted in the checados_extra column (the last one is still checado_ultimo)
+MAX_CHECADAS_DETALLE = 8
+
 # ==============================================================================
 # SPANISH DAY NAMES MAPPING
 # ==============================================================================
@@ -90,4 +101,16 @@ DIAS_ESPANOL = {
     "Friday": "Viernes",
     "Saturday": "Sábado",
     "Sunday": "Domingo",
-}
\ No newline at end of file
+}
+
+# Spanish day names indexed by weekday number (0 = Monday ... 6 = Sunday),
+# the same numbering returned by DatetimeIndex.weekday
+DIAS_SEMANA_ES = (
+    "Lunes",
+    "Martes",
+    "Miércoles",
+    "Jueves",
+    "Viernes",
+    "Sábado",
+    "Domingo",
+)
@@ -2,14 +2,22 @@
 Conexión a BD PostgreSQL - VERSIÓN FINAL OPTIMIZADA Y SIMPLIFICADA
 """
 from datetime import datetime, timedelta, time # Importar 'time' explícitamente
-from typing import Dict, List
-from django.db.models import Q, Case, When, IntegerField
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+import pandas as pd
+from django.db import connection, transaction
+from django.db.models import FloatField, TextField
+from django.db.models.expressions import RawSQL
 
-from .models import Empleado, AsignacionHorario, DiaSemana
+from .utils import normalizar_texto_busqueda, permisos_por_dia
+from .cache_manager import obtener_dias_semana, incrementar_version, NOMBRE_VERSION_ASIGNACIONES
+from .models import Empleado, CalendarioHorario, HorarioSemanal, RollupAsistencia
 
 def obtener_horario_empleado_completo(employee_code: str, fecha: str = None) -> Dict:
     """
-    Obtiene el horario de un solo empleado consultando las tablas directamente.
+    Obtiene el horario de un solo empleado desde la vista materializada de horarios
+    semanales, la misma que alimenta el calendario y f_tabla_horarios_multi_quincena:
+    las reglas de prioridad entre asignaciones viven solo en la vista.
     """
     try:
         empleado_obj = Empleado.objects.get(codigo_frappe=employee_code)
@@ -23,45 +31,12 @@ def obtener_horario_empleado_completo(employee_code: str, fecha: str = None) ->
         except: pass
     
     horarios_detallados = {}
-    dias_semana = DiaSemana.objects.all().order_by('dia_id')
-
-    # Mapa de abreviaturas para descripciones de turno
-    mapa_dia_abrev = {1: 'L', 2: 'M', 3: 'X', 4: 'J', 5: 'V', 6: 'S', 7: 'D'}
-
-    for dia in dias_semana:
-        # Lógica de filtrado para encontrar el turno correcto
-        filtro_dia_general = Q()
-        abrev_dia = mapa_dia_abrev.get(dia.dia_id)
-        if abrev_dia:
-            filtro_dia_general = Q(tipo_turno__descripcion__icontains=abrev_dia)
-        
-        # Casos especiales de rangos
-        if dia.dia_id in range(1, 6): filtro_dia_general |= Q(tipo_turno__descripcion='L-V')
-        if dia.dia_id in range(1, 5): filtro_dia_general |= Q(tipo_turno__descripcion='L-J')
-        if dia.dia_id in range(2, 6): filtro_dia_general |= Q(tipo_turno__descripcion='M-V')
-        
-        # Construimos la consulta priorizada con el ORM
-        asignacion = AsignacionHorario.objects.filter(
-            Q(empleado=empleado_obj) & (Q(dia_especifico_id=dia.dia_id) | filtro_dia_general)
-        ).annotate(
-            prioridad=Case(
-                When(dia_especifico_id=dia.dia_id, es_primera_quincena=es_primera_quincena, then=1),
-                When(dia_especifico_id=dia.dia_id, es_primera_quincena__isnull=True, then=2),
-                When(dia_especifico_id__isnull=True, es_primera_quincena=es_primera_quincena, then=3),
-                When(dia_especifico_id__isnull=True, es_primera_quincena__isnull=True, then=4),
-                default=5,
-                output_field=IntegerField(),
-            )
-        ).select_related('horario', 'tipo_turno').order_by('prioridad').first()
-
-        if asignacion:
-            if asignacion.dia_especifico_id:
-                entrada, salida, cruza = asignacion.hora_entrada_especifica, asignacion.hora_salida_especifica, asignacion.hora_salida_especifica_cruza_medianoche
-            elif asignacion.horario:
-                entrada, salida, cruza = asignacion.horario.hora_entrada, asignacion.horario.hora_salida, asignacion.horario.cruza_medianoche
-            else:
-                entrada, salida, cruza = None, None, False
-            
+    semana = obtener_semanas_empleados([empleado_obj.empleado_id]).get(empleado_obj.empleado_id, {})
+
+    for dia in obtener_dias_semana():
+        turno = semana.get((es_primera_quincena, dia.dia_id))
+        if turno:
+            entrada, salida, cruza, _ = turno
             horarios_detallados[dia.nombre_dia] = {"entrada": entrada, "salida": salida, "cruza_medianoche": cruza, "tiene_horario": True}
         else:
             horarios_detallados[dia.nombre_dia] = {"tiene_horario": False}
@@ -122,4 +97,455 @@ def _formatear_resultado_desde_python(horarios_detallados: dict, empleado: Emple
 
 def _crear_horario_vacio(employee_code=None) -> Dict:
     print(f"⚠️  Empleado {employee_code} sin horario válido en la base de datos.")
-    return {'dias_con_horario': 0}
\ No newline at end of file
+    return {'dias_con_horario': 0}
+
+
+# =================================================================
+# === CALENDARIO DE HORARIOS POR EMPLEADO Y FECHA (MATERIALIZADO) ===
+# =================================================================
+
+def refrescar_horarios_semanales() -> None:
+    """Refresca la vista materializada de horarios semanales sin bloquear lecturas."""
+    with connection.cursor() as cursor:
+        cursor.execute('REFRESH MATERIALIZED VIEW CONCURRENTLY "mv_horarios_semanales"')
+
+
+def obtener_semanas_empleados(empleado_ids: Iterable[int]) -> Dict[int, Dict[Tuple[bool, int], Tuple]]:
+    """
+    Lee de la vista materializada el turno de cada (es_primera_quincena, dia_id) por
+    empleado. Si el empleado tiene turnos en varias sucursales se toma el de mayor
+    prioridad (a igual prioridad, el de la sucursal con menor id).
+    Devuelve (entrada, salida, cruza_medianoche, horas_totales).
+    """
+    semanas = {}
+    filas = HorarioSemanal.objects.filter(empleado_id__in=list(empleado_ids)).order_by('prioridad', 'sucursal_id').values_list(
+        'empleado_id', 'es_primera_quincena', 'dia_id', 'hora_entrada', 'hora_salida', 'cruza_medianoche', 'horas_totales'
+    )
+    for empleado_id, quincena, dia_id, entrada, salida, cruza, horas in filas:
+        semanas.setdefault(empleado_id, {}).setdefault((quincena, dia_id), (entrada, salida, bool(cruza), horas))
+    return semanas
+
+
+def _filas_calendario(empleado_id: int, semana: Dict, fechas: pd.DatetimeIndex) -> List[CalendarioHorario]:
+    filas = []
+    for fecha in fechas:
+        quincena = fecha.day <= 15
+        turno = semana.get((quincena, fecha.weekday() + 1))
+        fila = CalendarioHorario(empleado_id=empleado_id, fecha=fecha.date(), es_primera_quincena=quincena)
+        if turno is not None and turno[0] and turno[1]:
+            entrada, salida, cruza, horas = turno
+            fila.tiene_horario = True
+            fila.hora_entrada, fila.hora_salida, fila.cruza_medianoche = entrada, salida, cruza
+            fila.segundos_esperados = round(float(horas or 0) * 3600)
+        filas.append(fila)
+    return filas
+
+
+def materializar_calendario(empleado_ids: Iterable[int], start_date: str, end_date: str) -> int:
+    """
+    Completa CalendarioHorario para los empleados y el rango dados. Solo se calculan
+    las fechas que aún no existen (p. ej. tras una invalidación), leyendo los turnos
+    semanales ya resueltos de la vista materializada en una sola consulta.
+    Devuelve el número de filas insertadas.
+    """
+    empleado_ids = list(empleado_ids)
+    fechas = pd.date_range(start=start_date, end=end_date, freq='D')
+    if not empleado_ids or len(fechas) == 0:
+        return 0
+
+    existentes = {}
+    for empleado_id, fecha in CalendarioHorario.objects.filter(
+            empleado_id__in=empleado_ids, fecha__range=(fechas[0].date(), fechas[-1].date())
+    ).values_list('empleado_id', 'fecha'):
+        existentes.setdefault(empleado_id, set()).add(fecha)
+
+    incompletos = [e for e in empleado_ids if len(existentes.get(e, ())) < len(fechas)]
+    if not incompletos:
+        return 0
+
+    semanas = obtener_semanas_empleados(incompletos)
+
+    nuevas = []
+    for empleado_id in incompletos:
+        ya_calculadas = existentes.get(empleado_id, set())
+        faltantes = fechas[~fechas.to_series().dt.date.isin(ya_calculadas).to_numpy()]
+        nuevas.extend(_filas_calendario(empleado_id, semanas.get(empleado_id, {}), faltantes))
+
+    CalendarioHorario.objects.bulk_create(nuevas, batch_size=2000, ignore_conflicts=True)
+    return len(nuevas)
+
+
+def obtener_calendario_horarios(employee_codes: Iterable[int], start_date: str, end_date: str) -> pd.DataFrame:
+    """
+    Horario esperado por (employee, dia) para un rango, leído de CalendarioHorario.
+
+    Columnas: employee (int64, codigo_frappe), dia (datetime64), horas_esperadas
+    (timedelta), horario_entrada y horario_salida (datetime.time o None).
+    """
+    columnas = ['employee', 'dia', 'horas_esperadas', 'horario_entrada', 'horario_salida']
+    codigos = [int(c) for c in employee_codes]
+    mapa_ids = dict(Empleado.objects.filter(codigo_frappe__in=codigos).values_list('empleado_id', 'codigo_frappe'))
+    if not mapa_ids:
+        return pd.DataFrame(columns=columnas)
+
+    materializar_calendario(mapa_ids.keys(), start_date, end_date)
+
+    filas = CalendarioHorario.objects.filter(
+        empleado_id__in=list(mapa_ids), fecha__range=(start_date, end_date), tiene_horario=True
+    ).values_list('empleado_id', 'fecha', 'segundos_esperados', 'hora_entrada', 'hora_salida')
+    calendario = pd.DataFrame(list(filas), columns=['empleado_id', 'dia', 'segundos', 'horario_entrada', 'horario_salida'])
+    if calendario.empty:
+        return pd.DataFrame(columns=columnas)
+
+    calendario['employee'] = calendario['empleado_id'].map(mapa_ids).astype('int64')
+    calendario['dia'] = pd.to_datetime(calendario['dia'])
+    calendario['horas_esperadas'] = pd.to_timedelta(calendario['segundos'], unit='s')
+    return calendario[columnas]
+
+
+def invalidar_calendario_horarios(empleado_ids: Optional[Iterable[int]] = None) -> None:
+    """Borra el calendario materializado (de ciertos empleados o completo) para recalcularlo."""
+    calendario = CalendarioHorario.objects.all()
+    if empleado_ids is not None:
+        calendario = calendario.filter(empleado_id__in=list(empleado_ids))
+    calendario.delete()
+
+
+# Empleados con cambios de horario pendientes de aplicar, por hilo (cada hilo usa su
+# propia conexión y, por lo tanto, su propia transacción)
+_horarios_pendientes = threading.local()
+
+
+def _aplicar_refresco_horarios() -> None:
+    """Callback de on_commit: aplica de una vez todo lo acumulado en la transacción."""
+    pendiente = getattr(_horarios_pendientes, 'valor', None)
+    if pendiente is None:
+        return  # Otro callback de la misma transacción ya lo aplicó
+    _horarios_pendientes.valor = None
+    todos = pendiente['todos']
+    # Primero la vista semanal: el calendario se vuelve a llenar a partir de ella
+    refrescar_horarios_semanales()
+    invalidar_calendario_horarios(None if todos else pendiente['empleados'])
+    # Los rollups de asistencia se calcularon con el horario anterior
+    invalidar_rollups_asistencia(None if todos else pendiente['empleados'])
+    # Nueva versión de asignaciones: invalida los ETag de las respuestas de horarios
+    incrementar_version(NOMBRE_VERSION_ASIGNACIONES)
+
+
+def programar_refresco_horarios(empleado_ids: Optional[Iterable[int]] = None) -> None:
+    """
+    Programa, para cuando confirme la transacción actual, el refresco de la vista
+    semanal y la invalidación del calendario. Las llamadas dentro de una misma
+    transacción se acumulan en un solo refresco (p. ej. al borrar o reescribir
+    todas las asignaciones de un empleado). None significa "todos los empleados".
+
+    El refresco corre en la misma petición que guardó los horarios, después del
+    commit: agrega la duración de REFRESH MATERIALIZED VIEW CONCURRENTLY (del orden
+    de las asignaciones × 14 filas, sin bloquear lecturas) solo a las pantallas de
+    administración que modifican horarios; así la respuesta ya refleja el cambio.
+    """
+    pendiente = getattr(_horarios_pendientes, 'valor', None)
+    if pendiente is None:
+        pendiente = _horarios_pendientes.valor = {'empleados': set(), 'todos': False}
+
+    if empleado_ids is None:
+        pendiente['todos'] = True
+    else:
+        pendiente['empleados'].update(empleado_ids)
+
+    # Un callback por llamada: el primero aplica lo acumulado y los demás no hacen nada.
+    # Si la transacción se revierte, lo acumulado se aplica con el siguiente commit
+    # (invalidar de más no cambia resultados). Fuera de un bloque atómico corre de inmediato.
+    transaction.on_commit(_aplicar_refresco_horarios)
+
+
+# =================================================================
+# === ROLLUPS DE ASISTENCIA (día → semana → quincena → mes) ===
+# =================================================================
+
+# Los días recientes aún pueden cambiar en el ERP (checadas tardías, permisos
+# aprobados después); solo se guardan los días anteriores a este margen.
+DIAS_ROLLUP_ABIERTOS = 3
+
+CONTADORES_ROLLUP = ['segundos_trabajados', 'segundos_esperados', 'segundos_permiso', 'dias_laborables',
+                     'asistencias', 'permisos', 'faltas', 'faltas_justificadas', 'retardos', 'salidas_anticipadas']
+
+
+def fecha_cierre_rollups():
+    """Primer día que todavía no se guarda en los rollups."""
+    return datetime.now().date() - timedelta(days=DIAS_ROLLUP_ABIERTOS)
+
+
+def _periodos_rollup(fechas: pd.Series) -> Dict[str, Tuple[pd.Series, pd.Series]]:
+    """
+    (inicio, fin) del periodo de cada fecha en cada nivel. La semana (Lunes a
+    Domingo) se recorta a la quincena para que los niveles anidados sumen exacto.
+    """
+    fechas = pd.to_datetime(fechas)
+    dia = fechas.dt.day
+    fin_mes = fechas + pd.offsets.MonthEnd(0)
+    es_primera = dia <= 15
+    inicio_quincena = fechas - pd.to_timedelta(dia.where(~es_primera, dia + 15) - 16, unit='D')
+    fin_quincena = (inicio_quincena + pd.Timedelta(days=14)).where(es_primera, fin_mes)
+    lunes = fechas - pd.to_timedelta(fechas.dt.weekday, unit='D')
+    domingo = lunes + pd.Timedelta(days=6)
+    return {
+        'dia': (fechas, fechas),
+        'semana': (lunes.where(lunes > inicio_quincena, inicio_quincena), domingo.where(domingo < fin_quincena, fin_quincena)),
+        'quincena': (inicio_quincena, fin_quincena),
+        'mes': (fechas - pd.to_timedelta(dia - 1, unit='D'), fin_mes),
+    }
+
+
+def _plan_rollup(start_date: str, end_date: str) -> List[Tuple[str, datetime]]:
+    """
+    Descompone el rango en el menor número de periodos (mes, quincena, semana,
+    día) que lo cubren exactamente, tomando siempre el mayor que quepa.
+    """
+    inicio, fin = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    plan = []
+    while inicio <= fin:
+        periodos = _periodos_rollup(pd.Series([inicio]))
+        for nivel in ('mes', 'quincena', 'semana', 'dia'):
+            p_inicio, p_fin = periodos[nivel][0].iloc[0], periodos[nivel][1].iloc[0]
+            if p_inicio == inicio and p_fin <= fin:
+                plan.append((nivel, inicio.date()))
+                inicio = p_fin + pd.Timedelta(days=1)
+                break
+    return plan
+
+
+def _bloquear_rollups() -> None:
+    """
+    Serializa entre workers, hasta el fin de la transacción actual, toda escritura de
+    rollups: dos dashboards que cierran el mismo mes no rehacen sus filas a la vez.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('RollupAsistencia'))")
+
+
+def guardar_rollups_asistencia(df_contadores: pd.DataFrame, alcance: str = 'Todas') -> int:
+    """
+    Guarda los contadores diarios (ver services.contadores_diarios) de los días ya
+    cerrados que no existen o que cambiaron (checadas tardías, permisos aprobados
+    después) y reconstruye las semanas, quincenas y meses afectados que queden
+    completos. 'alcance' es la sucursal del dashboard ('Todas' = general).
+    Devuelve el número de días nuevos o reescritos.
+    """
+    df = df_contadores[df_contadores['dia'].dt.date < fecha_cierre_rollups()]
+    if df.empty:
+        return 0
+
+    mapa_ids = dict(Empleado.objects.filter(codigo_frappe__in=df['employee'].unique().tolist())
+                    .values_list('codigo_frappe', 'empleado_id'))
+    df = df.assign(empleado_id=df['employee'].map(mapa_ids)).dropna(subset=['empleado_id'])
+    df = df.astype({'empleado_id': 'int64'})
+    if df.empty:
+        return 0
+
+    columnas = ['empleado_id', 'dia', 'Sucursal'] + CONTADORES_ROLLUP
+    with transaction.atomic():
+        _bloquear_rollups()
+        # Se leen ya con el candado: lo que guardó otro worker mientras tanto cuenta
+        desde, hasta = df['dia'].min().date(), df['dia'].max().date()
+        existentes = pd.DataFrame(list(RollupAsistencia.objects.filter(
+            alcance=alcance, nivel='dia', empleado_id__in=df['empleado_id'].unique().tolist(),
+            inicio__range=(desde, hasta)
+        ).values_list('rollup_id', 'empleado_id', 'inicio', 'sucursal', *CONTADORES_ROLLUP)),
+            columns=['rollup_id'] + columnas)
+        obsoletos = []
+        if not existentes.empty:
+            existentes['dia'] = pd.to_datetime(existentes['dia'])
+            sin_cambios = pd.MultiIndex.from_frame(df[columnas]).isin(pd.MultiIndex.from_frame(existentes[columnas]))
+            df = df[~sin_cambios]
+            cambiados = pd.MultiIndex.from_frame(existentes[['empleado_id', 'dia']]).isin(
+                pd.MultiIndex.from_frame(df[['empleado_id', 'dia']]))
+            obsoletos = existentes.loc[cambiados, 'rollup_id'].tolist()
+        if df.empty:
+            return 0
+
+        nuevos = [RollupAsistencia(empleado_id=fila['empleado_id'], alcance=alcance, sucursal=fila['Sucursal'],
+                                   nivel='dia', inicio=fila['dia'].date(), fin=fila['dia'].date(),
+                                   **{c: int(fila[c]) for c in CONTADORES_ROLLUP})
+                  for fila in df.to_dict('records')]
+        RollupAsistencia.objects.filter(pk__in=obsoletos).delete()
+        RollupAsistencia.objects.bulk_create(nuevos, batch_size=2000)
+
+        # Los niveles superiores se rehacen completos para los meses tocados
+        empleado_ids = df['empleado_id'].unique().tolist()
+        desde = df['dia'].min().date().replace(day=1)
+        hasta = (df['dia'].max() + pd.offsets.MonthEnd(0)).date()
+        dias = pd.DataFrame(list(RollupAsistencia.objects.filter(
+            alcance=alcance, nivel='dia', empleado_id__in=empleado_ids, inicio__range=(desde, hasta)
+        ).values_list('empleado_id', 'sucursal', 'inicio', *CONTADORES_ROLLUP)),
+            columns=['empleado_id', 'sucursal', 'dia'] + CONTADORES_ROLLUP)
+        dias['dia'] = pd.to_datetime(dias['dia'])
+
+        superiores = []
+        for nivel, (inicios, fines) in _periodos_rollup(dias['dia']).items():
+            if nivel == 'dia':
+                continue
+            periodo = dias.assign(inicio=inicios, fin=fines)
+            # Un periodo solo se guarda si el empleado tiene todos sus días
+            cubiertos = periodo.groupby(['empleado_id', 'inicio', 'fin'])['dia'].transform('nunique')
+            completo = cubiertos == (periodo['fin'] - periodo['inicio']).dt.days + 1
+            sumas = periodo[completo].groupby(['empleado_id', 'sucursal', 'inicio', 'fin'])[CONTADORES_ROLLUP].sum().reset_index()
+            superiores.extend(
+                RollupAsistencia(empleado_id=fila['empleado_id'], alcance=alcance, sucursal=fila['sucursal'],
+                                 nivel=nivel, inicio=fila['inicio'].date(), fin=fila['fin'].date(),
+                                 **{c: int(fila[c]) for c in CONTADORES_ROLLUP})
+                for fila in sumas.to_dict('records'))
+
+        RollupAsistencia.objects.filter(
+            alcance=alcance, empleado_id__in=empleado_ids, inicio__range=(desde, hasta)
+        ).exclude(nivel='dia').delete()
+        RollupAsistencia.objects.bulk_create(superiores, batch_size=2000)
+    return len(nuevos)
+
+
+def resumen_desde_rollups(employee_codes: Iterable[int], start_date: str, end_date: str,
+                          sucursal: str = 'Todas') -> Optional[pd.DataFrame]:
+    """
+    Resumen por (employee, Sucursal) sumando los rollups que cubren el rango, solo
+    los que guardó el dashboard de 'sucursal' ('Todas' = general). Devuelve
+    None si el rango incluye días abiertos o si a algún empleado le falta un periodo;
+    en ese caso el reporte se calcula desde las checadas.
+    """
+    if pd.Timestamp(end_date).date() >= fecha_cierre_rollups():
+        return None
+
+    codigos = [int(c) for c in employee_codes]
+    empleados = list(Empleado.objects.filter(codigo_frappe__in=codigos).values_list(
+        'empleado_id', 'codigo_frappe', 'nombre', 'apellido_paterno'))
+    if not empleados or len(empleados) < len(set(codigos)):
+        return None
+
+    plan = _plan_rollup(start_date, end_date)
+    filas = pd.DataFrame(list(RollupAsistencia.objects.filter(
+        alcance=sucursal, empleado_id__in=[e[0] for e in empleados], inicio__range=(start_date, end_date),
+        nivel__in={nivel for nivel, _ in plan}
+    ).values_list('empleado_id', 'sucursal', 'nivel', 'inicio', *CONTADORES_ROLLUP)),
+        columns=['empleado_id', 'Sucursal', 'nivel', 'inicio'] + CONTADORES_ROLLUP)
+
+    filas = filas[pd.MultiIndex.from_frame(filas[['nivel', 'inicio']]).isin(plan)]
+    periodos_por_empleado = filas.drop_duplicates(['empleado_id', 'nivel', 'inicio']).groupby('empleado_id').size()
+    if len(periodos_por_empleado) < len(empleados) or (periodos_por_empleado < len(plan)).any():
+        return None
+
+    resumen = filas.groupby(['empleado_id', 'Sucursal'])[CONTADORES_ROLLUP].sum().reset_index()
+    codigo_por_id = {e[0]: e[1] for e in empleados}
+    nombres = {e[1]: f"{e[2]} {e[3]}" for e in empleados}
+    resumen['employee'] = resumen['empleado_id'].map(codigo_por_id).astype('int64')
+    resumen['Nombre'] = resumen['employee'].map(nombres)
+
+    # Mismas columnas que AttendanceProcessor.calcular_resumen_final (más los contadores diarios)
+    trabajadas = pd.to_timedelta(resumen['segundos_trabajados'], unit='s')
+    esperadas = pd.to_timedelta(resumen['segundos_esperados'], unit='s')
+    return pd.DataFrame({
+        'employee': resumen['employee'], 'Nombre': resumen['Nombre'], 'Sucursal': resumen['Sucursal'],
+        'total_horas_trabajadas_td': trabajadas, 'total_horas_esperadas_td': esperadas,
+        'total_horas_td': esperadas - pd.to_timedelta(resumen['segundos_permiso'], unit='s'),
+        'total_retardos': resumen['retardos'], 'faltas_del_periodo': resumen['faltas'],
+        'total_salidas_anticipadas': resumen['salidas_anticipadas'],
+        'faltas_justificadas': resumen['faltas_justificadas'], 'episodios_ausencia': resumen['faltas'],
+        'dias_laborables': resumen['dias_laborables'], 'asistencias': resumen['asistencias'],
+        'permisos': resumen['permisos'],
+    }).sort_values(['employee', 'Sucursal'], ignore_index=True)
+
+
+def invalidar_rollups_asistencia(empleado_ids: Optional[Iterable[int]] = None) -> None:
+    """Borra los rollups (de ciertos empleados o todos); dependen del horario y de los permisos."""
+    rollups = RollupAsistencia.objects.all()
+    if empleado_ids is not None:
+        rollups = rollups.filter(empleado_id__in=list(empleado_ids))
+    with transaction.atomic():
+        _bloquear_rollups()
+        rollups.delete()
+
+
+def invalidar_rollups_por_permisos(permisos_dict: dict, employee_codes: Iterable[int], start_date: str,
+                                   end_date: str) -> int:
+    """
+    Compara los permisos vigentes del ERP con los que quedaron en los rollups diarios
+    del rango y borra los rollups de los empleados cuyo permiso cambió (p. ej. uno
+    aprobado después de cerrar el día), igual que al cambiar su horario.
+    Devuelve el número de empleados invalidados.
+    """
+    mapa_ids = dict(Empleado.objects.filter(codigo_frappe__in=[int(c) for c in employee_codes])
+                    .values_list('empleado_id', 'codigo_frappe'))
+    dias = pd.DataFrame(list(RollupAsistencia.objects.filter(
+        nivel='dia', empleado_id__in=list(mapa_ids), inicio__range=(start_date, end_date)
+    ).values_list('empleado_id', 'inicio', 'permisos', 'segundos_permiso', 'segundos_esperados')),
+        columns=['empleado_id', 'dia', 'permisos', 'segundos_permiso', 'segundos_esperados'])
+    if dias.empty:
+        return 0
+
+    dias['employee'] = dias['empleado_id'].map(mapa_ids).astype('int64')
+    dias['dia'] = pd.to_datetime(dias['dia'])
+    cruce = dias.merge(permisos_por_dia(permisos_dict), on=['employee', 'dia'], how='left')
+
+    # Medio día solo se distingue si el día tenía horas esperadas (horas_permiso = la mitad)
+    laborable = cruce['segundos_esperados'] > 0
+    con_permiso = cruce['medio_dia'].notna()
+    guardado_con_permiso = cruce['permisos'] > 0
+    medio_dia = con_permiso & cruce['medio_dia'].eq(True) & laborable
+    guardado_medio_dia = guardado_con_permiso & laborable & (cruce['segundos_permiso'] < cruce['segundos_esperados'])
+    afectados = cruce.loc[(con_permiso != guardado_con_permiso) | (medio_dia != guardado_medio_dia),
+                          'empleado_id'].unique().tolist()
+    if afectados:
+        print(f"[INFO Rollups] Permisos modificados en el ERP: se invalidan {len(afectados)} empleados")
+        invalidar_rollups_asistencia(afectados)
+    return len(afectados)
+
+
+# =================================================================
+# === BÚSQUEDA DE EMPLEADOS (pg_trgm + unaccent, índice GIN) ===
+# =================================================================
+
+# Debe coincidir EXACTAMENTE con la expresión del índice "empleados_busqueda_trgm_idx"
+# (migración 0021) para que PostgreSQL lo use.
+EXPRESION_BUSQUEDA_EMPLEADO = (
+    "f_unaccent(lower(\"Empleados\".\"nombre\" || ' ' || \"Empleados\".\"apellido_paterno\" || ' ' || "
+    "coalesce(\"Empleados\".\"apellido_materno\", '') || ' ' || coalesce(\"Empleados\".\"email\", '') || ' ' || "
+    "\"Empleados\".\"codigo_frappe\"::text || ' ' || \"Empleados\".\"codigo_checador\"::text))"
+)
+
+
+def filtrar_busqueda_empleados(empleados_qs, texto: str):
+    """
+    Filtra un queryset de Empleado sin acentos ni mayúsculas sobre nombre, apellidos,
+    email y códigos. Cada palabra debe aparecer (LIKE '%palabra%'), lo que resuelve
+    el índice trigram en lugar de seis icontains.
+    """
+    palabras = normalizar_texto_busqueda(texto).split()
+    if not palabras:
+        return empleados_qs
+    empleados_qs = empleados_qs.annotate(texto_busqueda=RawSQL(EXPRESION_BUSQUEDA_EMPLEADO, (), output_field=TextField()))
+    for palabra in palabras:
+        empleados_qs = empleados_qs.filter(texto_busqueda__contains=palabra)
+    return empleados_qs
+
+
+def buscar_empleados(texto: str, limite: int = 20, pagina: int = 1, incluir_bajas: bool = False) -> Dict:
+    """
+    Búsqueda para autocompletar: resultados ordenados por similitud (word_similarity)
+    y paginados. Devuelve {"resultados": [...], "pagina": n, "hay_mas": bool}.
+    """
+    normalizado = normalizar_texto_busqueda(texto)
+    if not normalizado:
+        return {"resultados": [], "pagina": pagina, "hay_mas": False}
+
+    base = Empleado.all_objects if incluir_bajas else Empleado.objects
+    empleados_qs = filtrar_busqueda_empleados(base.all(), normalizado).annotate(
+        relevancia=RawSQL(f"word_similarity(%s, {EXPRESION_BUSQUEDA_EMPLEADO})", (normalizado,), output_field=FloatField())
+    ).order_by('-relevancia', 'empleado_id')
+
+    inicio = (pagina - 1) * limite
+    filas = list(empleados_qs.values(
+        'empleado_id', 'codigo_frappe', 'codigo_checador', 'nombre', 'apellido_paterno',
+        'apellido_materno', 'email', 'is_deleted', 'relevancia',
+    )[inicio:inicio + limite + 1])
+
+    return {"resultados": filas[:limite], "pagina": pagina, "hay_mas": len(filas) > limite}
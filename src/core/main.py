@@ -1,17 +1,20 @@
 from datetime import datetime
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
 from typing import List, Dict
 import os
 from dotenv import load_dotenv
 import pandas as pd
-import numpy as np # Asegúrate de que numpy esté importado aquí
 from .utils import td_to_str # Asegúrate de que td_to_str esté importado
 
-from .api_client import APIClient, procesar_permisos_empleados
+from .api_client import APIClient, erp_circuit, procesar_permisos_empleados
 # Se importan la clase y las nuevas funciones de services
-from .services import AttendanceProcessor, calcular_metricas_adicionales, agregar_datos_dashboard_por_sucursal
+from .services import (AttendanceProcessor, calcular_kpis, calcular_metricas_adicionales,
+                       agregar_datos_dashboard_por_sucursal, contadores_diarios)
+from .db_postgres_connection import guardar_rollups_asistencia, invalidar_rollups_por_permisos, resumen_desde_rollups
 from .models import Empleado
-# Asegúrate que estén importadas
-from .services import calcular_metricas_adicionales, agregar_datos_dashboard_por_sucursal
 
 class AttendanceReportManager:
     """Clase de ayuda para obtener datos, ya no genera el reporte directamente."""
@@ -20,12 +23,13 @@ class AttendanceReportManager:
         """ ✅ CORREGIDO: Constructor usa doble guion bajo _init_ """
         self.api_client = APIClient()
 
-    def _prepare_report_data(self, start_date: str, end_date: str, sucursal: str):
-        """Método unificado para obtener datos base para cualquier reporte."""
+    def _validar_credenciales(self):
         load_dotenv()
         if not all([os.getenv("ASIATECH_API_KEY"), os.getenv("ASIATECH_API_SECRET")]):
             raise ValueError("Credenciales de API no configuradas")
 
+    def _codigos_empleados(self, sucursal: str) -> list:
+        """Códigos de los empleados activos de la sucursal ('Todas' = todos)."""
         if sucursal != 'Todas':
             """ ✅ CORREGIDO: Filtro de Django usa doble guion bajo __ """
             empleados = Empleado.objects.filter(
@@ -33,34 +37,130 @@ class AttendanceReportManager:
         else:
             empleados = Empleado.objects.all()
 
-        codigos_empleados = [str(
-            emp.codigo_frappe) for emp in empleados if emp.codigo_frappe is not None]
+        # Llave canónica entera (codigo_frappe) asignada una sola vez en la ingesta
+        return list(empleados.filter(codigo_frappe__isnull=False)
+                    .values_list('codigo_frappe', flat=True))
 
+    def _device_filter(self, sucursal: str) -> str:
         # Este Mapeo ahora está en api_client.py, solo pasamos el filtro
         device_map = {"Villas": "Villas", "31pte": "31pte",
                       "Nave": "Nave", "RioBlanco": "RioBlanco", "Todas": "Todas"}
-        device_filter_key = device_map.get(sucursal, "Todas")
+        return device_map.get(sucursal, "Todas")
+
+    def _prepare_report_data(self, start_date: str, end_date: str, sucursal: str):
+        """Método unificado para obtener datos base para cualquier reporte."""
+        self._validar_credenciales()
+        device_filter_key = self._device_filter(sucursal)
+
+        # Las descargas del ERP son independientes: se lanzan en paralelo y mientras
+        # tanto se consulta la BD, así la latencia es la de la descarga más lenta.
+        # El circuito del ERP se revisa una sola vez para toda la petición; cada hilo
+        # corre con una copia del contexto para heredar esa admisión.
+        with erp_circuit.guard(), ThreadPoolExecutor(max_workers=2) as executor:
+            futuro_checkins = executor.submit(contextvars.copy_context().run,
+                self.api_client.fetch_checkins, start_date, end_date, device_filter_key) # Pasamos la clave, no el patrón
+            futuro_permisos = executor.submit(contextvars.copy_context().run,
+                self.api_client.fetch_leave_applications, start_date, end_date)
+
+            codigos_empleados = self._codigos_empleados(sucursal)
+
+            checkin_records = futuro_checkins.result()
+            leave_records = futuro_permisos.result()
+        permisos_dict = procesar_permisos_empleados(leave_records)
 
+        return codigos_empleados, checkin_records, permisos_dict
 
-        checkin_records = self.api_client.fetch_checkins(
-            start_date, end_date, device_filter_key) # Pasamos la clave, no el patrón
-        leave_records = self.api_client.fetch_leave_applications(
-            start_date, end_date)
+    async def _aprepare_report_data(self, start_date: str, end_date: str, sucursal: str):
+        """
+        Versión async de _prepare_report_data: las descargas del ERP se esperan sin
+        ocupar hilos (httpx) y la consulta a la BD corre en el executor de Django.
+        """
+        self._validar_credenciales()
+        device_filter_key = self._device_filter(sucursal)
+
+        # Una sola revisión del circuito del ERP para las dos descargas
+        with erp_circuit.guard():
+            async with self.api_client.async_client() as client:
+                checkin_records, leave_records, codigos_empleados = await asyncio.gather(
+                    self.api_client.afetch_checkins(client, start_date, end_date, device_filter_key),
+                    self.api_client.afetch_leave_applications(client, start_date, end_date),
+                    sync_to_async(self._codigos_empleados)(sucursal),
+                )
         permisos_dict = procesar_permisos_empleados(leave_records)
 
         return codigos_empleados, checkin_records, permisos_dict
 
+def proyectar_dashboard(resultado: dict, secciones=None, campos=None) -> dict:
+    """
+    Deja solo las secciones (?sections=) y, en las tablas por empleado, las columnas
+    (?fields=) pedidas. Se aplica sobre el dashboard completo que guarda la caché,
+    así todas las combinaciones comparten un solo cálculo por rango y sucursal.
+    """
+    datos = resultado.get("data")
+    if not resultado.get("success") or not isinstance(datos, dict) or not (secciones or campos):
+        return resultado
+    datos = {k: v for k, v in datos.items() if not secciones or k in secciones}
+    if campos:
+        for seccion in ("employee_summary_kpis", "employee_performance_kpis"):
+            if seccion in datos:
+                datos[seccion] = [{k: v for k, v in fila.items() if k in campos} for fila in datos[seccion]]
+    return {**resultado, "data": datos}
+
+
 # =================================================================
 # === FUNCIONES QUE FALTABAN (RE-AGREGADAS) ===
 # =================================================================
 
-def generar_reporte_completo(start_date: str, end_date: str, sucursal: str) -> dict:
+# Rangos más largos se procesan por meses para acotar la memoria a una ventana
+DIAS_MAXIMOS_SIN_VENTANAS = 62
+
+def requiere_ventanas(start_date: str, end_date: str) -> bool:
+    return (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days + 1 > DIAS_MAXIMOS_SIN_VENTANAS
+
+def ventanas_mensuales(start_date: str, end_date: str) -> List[tuple]:
+    """Parte el rango en (inicio, fin) por mes calendario, recortando los extremos."""
+    inicio, fin = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    ventanas = []
+    while inicio <= fin:
+        fin_ventana = min(inicio + pd.offsets.MonthEnd(0), fin)
+        ventanas.append((inicio.strftime('%Y-%m-%d'), fin_ventana.strftime('%Y-%m-%d')))
+        inicio = fin_ventana + pd.Timedelta(days=1)
+    return ventanas
+
+def _resumen_por_ventanas(manager, processor, start_date: str, end_date: str, sucursal: str) -> pd.DataFrame:
+    """
+    Resumen de un rango largo: cada mes se descarga y analiza por separado y solo se
+    conservan sus contadores sumados, así el pico de memoria es el de una ventana.
+    """
+    parciales = []
+    for inicio, fin in ventanas_mensuales(start_date, end_date):
+        print(f"[INFO Reporte] Ventana {inicio} a {fin}")
+        codigos, checkins, permisos = manager._prepare_report_data(inicio, fin, sucursal)
+        if not codigos:
+            return pd.DataFrame()
+        df_detalle = processor.analizar_periodo(checkins, permisos, inicio, fin, codigos)
+        if not df_detalle.empty:
+            parciales.append(processor.sumar_resumen(df_detalle))
+        del checkins, permisos, df_detalle
+    if not parciales:
+        return pd.DataFrame()
+    return processor.formatear_resumen(processor.combinar_resumenes(parciales))
+
+def generar_reporte_completo(start_date: str, end_date: str, sucursal: str, datos: tuple = None) -> dict:
     """Orquestador para el Reporte de Horas (Resumen)."""
     try:
         manager = AttendanceReportManager()
         processor = AttendanceProcessor()
 
-        codigos, checkins, permisos = manager._prepare_report_data(
+        if datos is None and requiere_ventanas(start_date, end_date):
+            df_resumen = _resumen_por_ventanas(manager, processor, start_date, end_date, sucursal)
+            if df_resumen.empty:
+                return {"success": True, "data": []}
+            df_resumen['employee'] = df_resumen['employee'].astype(str)
+            return {"success": True, "data": df_resumen}
+
+        # 'datos' ya descargados por quien llama o se descargan aquí
+        codigos, checkins, permisos = datos or manager._prepare_report_data(
             start_date, end_date, sucursal)
         if not codigos:
             return {"success": True, "data": []}
@@ -72,18 +172,21 @@ def generar_reporte_completo(start_date: str, end_date: str, sucursal: str) -> d
             end_date=end_date,
             employee_codes=codigos
         )
-        return {"success": True, "data": df_resumen.to_dict('records')}
+        df_resumen['employee'] = df_resumen['employee'].astype(str)
+        # El DataFrame se serializa directo a JSON en la vista (sin dict por fila)
+        return {"success": True, "data": df_resumen}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
-def generar_reporte_detalle_completo(start_date: str, end_date: str, sucursal: str) -> dict:
+def generar_reporte_detalle_completo(start_date: str, end_date: str, sucursal: str, datos: tuple = None) -> dict:
     """Orquestador para la Lista de Asistencias (Detalle)."""
     try:
         manager = AttendanceReportManager()
         processor = AttendanceProcessor()
 
-        codigos, checkins, permisos = manager._prepare_report_data(
+        # 'datos' ya descargados (vista async) o se descargan aquí
+        codigos, checkins, permisos = datos or manager._prepare_report_data(
             start_date, end_date, sucursal)
         if not codigos:
             return {"success": True, "data": []}
@@ -95,11 +198,48 @@ def generar_reporte_detalle_completo(start_date: str, end_date: str, sucursal: s
             end_date=end_date,
             employee_codes=codigos
         )
-        return {"success": True, "data": df_final.to_dict('records')}
+        return {"success": True, "data": df_final}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def generar_datos_dashboard_general(start_date: str, end_date: str) -> dict:
+# =================================================================
+# === DASHBOARDS (un solo motor de KPIs para todas las sucursales) ===
+# =================================================================
+def _nombres_completos(codigos) -> dict:
+    """Nombre completo de BD por codigo_frappe; vacío si la consulta falla."""
+    try:
+        empleados_db = Empleado.objects.filter(codigo_frappe__in=list(codigos)).values_list(
+            'codigo_frappe', 'nombre', 'apellido_paterno', 'apellido_materno')
+        return {codigo: f"{nombre} {paterno} {materno or ''}".strip()
+                for codigo, nombre, paterno, materno in empleados_db}
+    except Exception:
+        return {}
+
+def _permisos_modificados(manager, codigos, start_date: str, end_date: str) -> bool:
+    """
+    Los permisos se aprueban en el ERP aun después de cerrado el día: antes de responder
+    desde rollups se descargan (una sola consulta ligera) y se invalidan los rollups que
+    ya no coinciden. Si el ERP no responde se usan los rollups tal cual.
+    """
+    try:
+        permisos = procesar_permisos_empleados(manager.api_client.fetch_leave_applications(start_date, end_date))
+        return invalidar_rollups_por_permisos(permisos, codigos, start_date, end_date) > 0
+    except Exception as e:
+        print(f"Advertencia al verificar permisos de rollups: {e}")
+        return False
+
+def generar_datos_dashboard(start_date: str, end_date: str, sucursal: str = 'Todas', datos: tuple = None,
+        nombres_completos: bool = False) -> dict:
+    """
+    Dashboard de cualquier sucursal ('Todas' = general). Todos los KPIs por empleado
+    salen de services.calcular_kpis, así que agregar una sucursal no requiere código nuevo.
+    'nombres_completos' cambia el nombre del resumen por el nombre completo de la BD.
+
+    Si el rango ya está cerrado se responde sumando los rollups de asistencia de esta
+    misma sucursal; si no, se calcula desde las checadas y se guardan los días nuevos
+    o modificados.
+    """
+    etiqueta = "General" if sucursal == 'Todas' else sucursal
     empty_summary = {"total_attendances": 0, "total_permissions": 0,
                      "total_absences": 0, "total_justified_absences": 0}
     empty_data = {"branches": [], "period_summary": empty_summary,
@@ -109,74 +249,63 @@ def generar_datos_dashboard_general(start_date: str, end_date: str) -> dict:
         manager = AttendanceReportManager()
         processor = AttendanceProcessor()
 
-        # 1. Obtener datos
-        codigos, checkins, permisos = manager._prepare_report_data(
-            start_date, end_date, sucursal='Todas')
-        if not codigos:
-            return {"success": True, "data": empty_data}
+        df_resumen = df_detalle = None
+        if datos is None:
+            # Rango cerrado: unas cuantas filas de rollups, sin descargar checadas
+            codigos = manager._codigos_empleados(sucursal)
+            df_resumen = resumen_desde_rollups(codigos, start_date, end_date, sucursal)
+            if df_resumen is not None and _permisos_modificados(manager, codigos, start_date, end_date):
+                df_resumen = None
+        if df_resumen is None:
+            print(f"[INFO Dashboard {etiqueta}] Obteniendo datos {start_date} a {end_date}")
+            # 'datos' ya descargados por quien llama o se descargan aquí
+            codigos, checkins, permisos = datos or manager._prepare_report_data(
+                start_date, end_date, sucursal=sucursal)
+            if not codigos:
+                return {"success": True, "data": empty_data}
 
-        # 2. Procesar reportes
-        df_detalle, df_resumen = processor.procesar_reporte_completo(
-            checkin_data=checkins, permisos_dict=permisos, start_date=start_date,
-            end_date=end_date, employee_codes=codigos
-        )
-        if df_resumen.empty or df_detalle.empty:
-            return {"success": True, "data": empty_data}
-
-        # =========================================================
-        # 🔥🔥🔥 BLOQUE NUEVO: FILTRADO DE EMPLEADOS ACTIVOS 🔥🔥🔥
-        # =========================================================
-        # Esto elimina a los "borrados" (Elvis) de TODO el dashboard (totales y listas)
-        try:
-            from core.models import Empleado
-            
-            # Recolectamos todos los IDs que vienen de los relojes checadores
-            ids_raw = pd.concat([df_resumen['employee'], df_detalle['employee']]).unique()
-            ids_ints = []
-            for x in ids_raw:
-                try: ids_ints.append(int(float(x)))
-                except: pass
-            
-            # 🔥 CAMBIO CLAVE 1: Usamos .objects (no all_objects) y forzamos is_active=True
-            # Esto asegura que SOLO traiga a los que existen en Admin como activos.
-            empleados_activos = Empleado.objects.filter(empleado_id__in=ids_ints, is_active=True)
-            
-            # Creamos un set de IDs válidos (convertidos a string para comparar con el DataFrame)
-            ids_validos_str = set(str(emp.empleado_id) for emp in empleados_activos)
-            
-            # Función auxiliar para normalizar el ID del DF y ver si está en la lista de activos
-            def es_activo(valor_id):
-                try: 
-                    val_str = str(int(float(valor_id)))
-                    return val_str in ids_validos_str
-                except: 
-                    return False
-
-            # 🔥 CAMBIO CLAVE 2: Recortamos los DataFrames. Si no es activo, se va.
-            df_resumen = df_resumen[df_resumen['employee'].apply(es_activo)]
-            df_detalle = df_detalle[df_detalle['employee'].apply(es_activo)]
-            
-            # Si después de filtrar no queda nadie, retornamos vacío
+            df_detalle, df_resumen = processor.procesar_reporte_completo(
+                checkin_data=checkins, permisos_dict=permisos, start_date=start_date,
+                end_date=end_date, employee_codes=codigos
+            )
             if df_resumen.empty or df_detalle.empty:
                 return {"success": True, "data": empty_data}
 
-        except Exception as e:
-            # Si falla el filtrado (ej. error de DB), imprimimos pero continuamos con lo que haya
-            print(f"Advertencia al filtrar activos: {e}")
-        # =========================================================
+            # Solo empleados activos (los borrados no cuentan en totales ni listas)
+            try:
+                # Llave entera en ambos lados: el filtro de activos es un isin() vectorizado
+                ids_reporte = pd.concat([df_resumen['employee'], df_detalle['employee']]).unique().tolist()
+                codigos_activos = list(Empleado.objects.filter(codigo_frappe__in=ids_reporte)
+                                       .values_list('codigo_frappe', flat=True))
+                df_resumen = df_resumen[df_resumen['employee'].isin(codigos_activos)]
+                df_detalle = df_detalle[df_detalle['employee'].isin(codigos_activos)]
+                if df_resumen.empty or df_detalle.empty:
+                    return {"success": True, "data": empty_data}
+            except Exception as e:
+                # Si falla el filtrado (ej. error de DB), imprimimos pero continuamos con lo que haya
+                print(f"Advertencia al filtrar activos: {e}")
+
+            try:
+                guardar_rollups_asistencia(contadores_diarios(df_detalle), sucursal)
+            except Exception as e:
+                # Los rollups son una optimización: si fallan, el dashboard se responde igual
+                print(f"Advertencia al guardar rollups: {e}")
+        else:
+            print(f"[INFO Dashboard {etiqueta}] Respondiendo desde rollups {start_date} a {end_date}")
 
+        df_metricas = calcular_metricas_adicionales(df_resumen, df_detalle)
+        datos_agregados = agregar_datos_dashboard_por_sucursal(df_metricas)
 
-        # 3. Métricas y Agregados (Ahora ya limpios sin el empleado borrado)
-        df_metricas = calcular_metricas_adicionales(df_resumen.copy(), df_detalle.copy())
-        datos_agregados = agregar_datos_dashboard_por_sucursal(df_metricas.copy())
+        if df_detalle is not None:
+            total_attendances = int(df_detalle[(df_detalle['horas_esperadas'].dt.total_seconds() > 0) & (
+                df_detalle['checados_count'] > 0) & (df_detalle['tiene_permiso'] == False)].shape[0])
+            total_permissions = int(df_detalle['tiene_permiso'].sum())
+        else:
+            total_attendances = int(df_resumen['asistencias'].sum())
+            total_permissions = int(df_resumen['permisos'].sum())
+        total_unjustified_absences = int(df_resumen['faltas_del_periodo'].sum())
+        total_justified_absences = int(df_resumen['faltas_justificadas'].sum())
 
-        # 4. Resumen del periodo
-        total_attendances = int(df_detalle[(df_detalle['horas_esperadas'].dt.total_seconds() > 0) & (
-            df_detalle['checados_count'] > 0) & (df_detalle['tiene_permiso'] == False)].shape[0])
-        total_permissions = int(df_detalle['tiene_permiso'].sum())
-        total_unjustified_absences = int(df_resumen['faltas_del_periodo'].sum()) if 'faltas_del_periodo' in df_resumen.columns else 0
-        total_justified_absences = int(df_resumen['faltas_justificadas'].sum()) if 'faltas_justificadas' in df_resumen.columns else 0
-        
         period_summary = {
             "total_attendances": total_attendances,
             "total_permissions": total_permissions,
@@ -184,244 +313,38 @@ def generar_datos_dashboard_general(start_date: str, end_date: str) -> dict:
             "total_justified_absences": total_justified_absences
         }
 
-        # ---------------------------------------------------------
-        # 5. PREPARACIÓN DE TABLA "RESUMEN HORAS"
-        # ---------------------------------------------------------
-        df_summary_kpis_agg = df_resumen.groupby('employee').agg(
-            Nombre=('Nombre', 'first'),
-            total_horas_trabajadas_td=('total_horas_trabajadas_td', 'sum'),
-            total_horas_esperadas_td=('total_horas_esperadas_td', 'sum'), 
-            total_horas_td=('total_horas_td', 'sum'), 
-            total_retardos=('total_retardos', 'sum'),
-            faltas_del_periodo=('faltas_del_periodo', 'sum')
-        ).reset_index()
-
-        df_summary_kpis_agg['diferencia_td'] = df_summary_kpis_agg['total_horas_trabajadas_td'] - df_summary_kpis_agg['total_horas_td']
-        
-        df_summary_kpis_agg['total_horas_trabajadas'] = df_summary_kpis_agg['total_horas_trabajadas_td'].apply(td_to_str)
-        df_summary_kpis_agg['total_horas_esperadas'] = df_summary_kpis_agg['total_horas_esperadas_td'].apply(td_to_str)
-        df_summary_kpis_agg['diferencia_HHMMSS'] = df_summary_kpis_agg['diferencia_td'].apply(lambda x: f"-{td_to_str(abs(x))}" if x.total_seconds() < 0 else td_to_str(x))
-        
-        df_summary_kpis = df_summary_kpis_agg.copy() 
-
-        summary_rename_map = {
-            'employee': 'ID',
-            'Nombre': 'Empleado',
-            'total_horas_trabajadas': 'Hrs. Trabajadas',
-            'total_horas_esperadas': 'Hrs. Planificadas',
-            'diferencia_HHMMSS': 'Variación',
-            'total_retardos': 'Retardos',
-            'faltas_del_periodo': 'Ausencias'
-        }
-        df_summary_kpis = df_summary_kpis.rename(columns=summary_rename_map)
-
-        # =========================================================
-        # CARGA Y MAPEO DE NOMBRES COMPLETOS (SECCIÓN ORIGINAL REUTILIZADA)
-        # =========================================================
-        mapa_nombres = {}
-        try:
-            ids_ints = []
-            ids_raw = list(df_summary_kpis['ID'].unique())
-            for x in ids_raw:
-                try: ids_ints.append(int(float(x)))
-                except: pass
-            
-            # Reutilizamos el filtro correcto: objects + is_active
-            empleados_db = Empleado.objects.filter(empleado_id__in=ids_ints, is_active=True)
-            
-            mapa_nombres = {
-                str(emp.empleado_id): f"{emp.nombre} {emp.apellido_paterno} {emp.apellido_materno or ''}".strip()
-                for emp in empleados_db
-            }
-        except Exception:
-            pass
-
-        # FUNCIÓN DE INYECCIÓN
-        def aplicar_nombres_robusto(df_target):
-            def normalizar_id(valor):
-                try: return str(int(float(valor)))
-                except: return str(valor).strip()
-
-            ids_limpios = df_target['ID'].apply(normalizar_id)
-            nombres_series = ids_limpios.map(mapa_nombres)
-            
-            if 'Empleado' in df_target.columns:
-                 nombres_series = nombres_series.fillna(df_target['Empleado']).fillna("Sin Nombre")
-            elif 'Nombre' in df_target.columns:
-                 nombres_series = nombres_series.fillna(df_target['Nombre']).fillna("Sin Nombre")
-            else:
-                 nombres_series = nombres_series.fillna("Sin Nombre")
-            
-            df_target['Empleado'] = nombres_series 
-            df_target['Nombre'] = nombres_series   
-            df_target['nombre'] = nombres_series   
-            df_target['empleado'] = nombres_series 
-            df_target['employee'] = nombres_series 
-            return df_target
-
-        # APLICAMOS A TABLA 1 (RESUMEN)
-        df_summary_kpis = aplicar_nombres_robusto(df_summary_kpis)
-        
-        cols_seguras = ['ID', 'employee', 'Empleado', 'Nombre', 'Hrs. Trabajadas', 'Hrs. Planificadas', 'Variación', 'Retardos', 'Ausencias']
-        df_summary_kpis = df_summary_kpis[list(set(cols_seguras).intersection(df_summary_kpis.columns))]
-        summary_kpis_list = df_summary_kpis.to_dict('records')
-
-        # ---------------------------------------------------------
-        # 6. PREPARACIÓN DE TABLA "KPIs RENDIMIENTO"
-        # ---------------------------------------------------------
-        dias_laborables_total = df_detalle[df_detalle['horas_esperadas'].dt.total_seconds() > 0].groupby('employee').size()
-        dias_laborables_total.name = 'dias_laborables_total'
-
-        df_perf_agg = df_resumen.groupby('employee').agg(
-            Nombre=('Nombre', 'first'),
-            Faltas=('faltas_del_periodo', 'sum'),
-            Retardos=('total_retardos', 'sum'),
-            Salidas=('total_salidas_anticipadas', 'sum'),
-            Faltas_Justificadas=('faltas_justificadas', 'sum')
-        ).reset_index()
-        
-        df_perf_agg = df_perf_agg.merge(df_summary_kpis_agg[['employee', 'total_horas_trabajadas_td', 'total_horas_td']], on='employee', how='left')
-        df_perf_agg['employee'] = df_perf_agg['employee'].astype(str)
-        dias_laborables_total.index = dias_laborables_total.index.astype(str)
-        df_perf_agg = df_perf_agg.merge(dias_laborables_total, on='employee', how='left').fillna(0)
-
-        # Cálculos de porcentajes
-        mask_dlp_total = df_perf_agg['dias_laborables_total'] > 0
-        total_horas_trabajadas_s = df_perf_agg['total_horas_trabajadas_td'].dt.total_seconds()
-        total_horas_netas_s = df_perf_agg['total_horas_td'].dt.total_seconds()
-        
-        df_perf_agg['Eficiencia Horas (%)'] = 100.0
-        mask_hnp_total = total_horas_netas_s > 0
-        if mask_hnp_total.any():
-            df_perf_agg.loc[mask_hnp_total, 'Eficiencia Horas (%)'] = (total_horas_trabajadas_s[mask_hnp_total] / total_horas_netas_s[mask_hnp_total]) * 100
-
-        df_perf_agg['Índice Puntualidad (%)'] = 100.0
-        if mask_dlp_total.any():
-            denom = df_perf_agg.loc[mask_dlp_total, 'dias_laborables_total']
-            numer = denom - df_perf_agg.loc[mask_dlp_total, 'Retardos']
-            df_perf_agg.loc[mask_dlp_total, 'Índice Puntualidad (%)'] = (numer.clip(lower=0) / denom) * 100
-
-        df_perf_agg['SIC'] = 100.0
-        if mask_dlp_total.any():
-            denom = df_perf_agg.loc[mask_dlp_total, 'dias_laborables_total']
-            numer = denom - (df_perf_agg.loc[mask_dlp_total, 'Faltas'] + df_perf_agg.loc[mask_dlp_total, 'Retardos'] + df_perf_agg.loc[mask_dlp_total, 'Salidas'])
-            df_perf_agg.loc[mask_dlp_total, 'SIC'] = (numer.clip(lower=0) / denom) * 100
-
-        df_perf_agg['Tasa Ausentismo (%)'] = 0.0
-        if mask_dlp_total.any():
-            denom = df_perf_agg.loc[mask_dlp_total, 'dias_laborables_total']
-            numer = df_perf_agg.loc[mask_dlp_total, 'Faltas']
-            df_perf_agg.loc[mask_dlp_total, 'Tasa Ausentismo (%)'] = (numer / denom) * 100
-
-        df_performance_kpis = df_perf_agg.rename(columns={'employee': 'ID', 'Faltas_Justificadas': 'Faltas Justificadas'})
-
-        # APLICAMOS A TABLA 2
-        df_performance_kpis = aplicar_nombres_robusto(df_performance_kpis)
-
-        cols_kpis = ['ID', 'Nombre', 'Empleado', 'employee', 'Faltas Justificadas', 'Tasa Ausentismo (%)', 'Índice Puntualidad (%)', 'Eficiencia Horas (%)', 'SIC']
-        df_performance_kpis = df_performance_kpis[list(set(cols_kpis).intersection(df_performance_kpis.columns))]
-        
-        performance_kpis_list = df_performance_kpis.round(1).to_dict('records')
-
-        final_data = {
-            "branches": datos_agregados,
-            "period_summary": period_summary,
-            "employee_summary_kpis": summary_kpis_list,
-            "employee_performance_kpis": performance_kpis_list
-        }
-        
-        return {"success": True, "data": final_data}
-
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return {"success": False, "error": f"Error interno: {str(e)}", "data": empty_data}
-
-        # FUNCIÓN DE INYECCIÓN
-        def aplicar_nombres_robusto(df_target):
-            # Normalizador que coincide EXACTAMENTE con la llave generada arriba
-            def normalizar_id(valor):
-                try: return str(int(float(valor)))
-                except: return str(valor).strip()
-
-            ids_limpios = df_target['ID'].apply(normalizar_id)
-            nombres_series = ids_limpios.map(mapa_nombres)
-            
-            # Fallback: Si no hay match en el mapa, usa el nombre original (incompleto)
-            if 'Empleado' in df_target.columns:
-                 nombres_series = nombres_series.fillna(df_target['Empleado']).fillna("Sin Nombre")
-            elif 'Nombre' in df_target.columns:
-                 nombres_series = nombres_series.fillna(df_target['Nombre']).fillna("Sin Nombre")
-            else:
-                 nombres_series = nombres_series.fillna("Sin Nombre")
-            
-            df_target['Empleado'] = nombres_series 
-            df_target['Nombre'] = nombres_series   
-            # Actualizamos también las columnas de ID/employee para mantener consistencia visual si fuera necesario
-            return df_target
-
-        # APLICAMOS A TABLA 1 (RESUMEN)
-        df_summary_kpis = aplicar_nombres_robusto(df_summary_kpis)
-        
-        cols_seguras = ['ID', 'employee', 'Empleado', 'Nombre', 'Hrs. Trabajadas', 'Hrs. Planificadas', 'Variación', 'Retardos', 'Ausencias']
-        df_summary_kpis = df_summary_kpis[list(set(cols_seguras).intersection(df_summary_kpis.columns))]
+        # Una sola pasada groupby por empleado para ambas tablas
+        df_kpis = calcular_kpis(df_resumen, df_detalle)
+        nombres = df_kpis['Nombre']
+        if nombres_completos:
+            nombres = df_kpis['employee'].map(_nombres_completos(df_kpis['employee'])).fillna(nombres).fillna("Sin Nombre")
+        ids = df_kpis['employee'].astype(str)
+
+        df_summary_kpis = pd.DataFrame({
+            'ID': ids,
+            'Empleado': nombres,
+            'Hrs. Trabajadas': df_kpis['total_horas_trabajadas_td'].apply(td_to_str),
+            'Hrs. Planificadas': df_kpis['total_horas_esperadas_td'].apply(td_to_str),
+            'Variación': df_kpis['diferencia_td'].apply(lambda x: f"-{td_to_str(abs(x))}" if x.total_seconds() < 0 else td_to_str(x)),
+            'Retardos': df_kpis['total_retardos'],
+            'Ausencias': df_kpis['faltas_del_periodo'],
+        })
+        if nombres_completos:
+            # El front general lee el nombre desde cualquiera de estas columnas
+            df_summary_kpis = df_summary_kpis.assign(Nombre=nombres, employee=nombres)
         summary_kpis_list = df_summary_kpis.to_dict('records')
 
-        # ---------------------------------------------------------
-        # 6. PREPARACIÓN DE TABLA "KPIs RENDIMIENTO"
-        # ---------------------------------------------------------
-        dias_laborables_total = df_detalle[df_detalle['horas_esperadas'].dt.total_seconds() > 0].groupby('employee').size()
-        dias_laborables_total.name = 'dias_laborables_total'
-
-        df_perf_agg = df_resumen.groupby('employee').agg(
-            Nombre=('Nombre', 'first'),
-            Faltas=('faltas_del_periodo', 'sum'),
-            Retardos=('total_retardos', 'sum'),
-            Salidas=('total_salidas_anticipadas', 'sum'),
-            Faltas_Justificadas=('faltas_justificadas', 'sum')
-        ).reset_index()
-        
-        df_perf_agg = df_perf_agg.merge(df_summary_kpis_agg[['employee', 'total_horas_trabajadas_td', 'total_horas_td']], on='employee', how='left')
-        df_perf_agg['employee'] = df_perf_agg['employee'].astype(str)
-        dias_laborables_total.index = dias_laborables_total.index.astype(str)
-        df_perf_agg = df_perf_agg.merge(dias_laborables_total, on='employee', how='left').fillna(0)
-
-        # Cálculos de porcentajes
-        mask_dlp_total = df_perf_agg['dias_laborables_total'] > 0
-        total_horas_trabajadas_s = df_perf_agg['total_horas_trabajadas_td'].dt.total_seconds()
-        total_horas_netas_s = df_perf_agg['total_horas_td'].dt.total_seconds()
-        
-        df_perf_agg['Eficiencia Horas (%)'] = 100.0
-        mask_hnp_total = total_horas_netas_s > 0
-        if mask_hnp_total.any():
-            df_perf_agg.loc[mask_hnp_total, 'Eficiencia Horas (%)'] = (total_horas_trabajadas_s[mask_hnp_total] / total_horas_netas_s[mask_hnp_total]) * 100
-
-        df_perf_agg['Índice Puntualidad (%)'] = 100.0
-        if mask_dlp_total.any():
-            denom = df_perf_agg.loc[mask_dlp_total, 'dias_laborables_total']
-            numer = denom - df_perf_agg.loc[mask_dlp_total, 'Retardos']
-            df_perf_agg.loc[mask_dlp_total, 'Índice Puntualidad (%)'] = (numer.clip(lower=0) / denom) * 100
-
-        df_perf_agg['SIC'] = 100.0
-        if mask_dlp_total.any():
-            denom = df_perf_agg.loc[mask_dlp_total, 'dias_laborables_total']
-            numer = denom - (df_perf_agg.loc[mask_dlp_total, 'Faltas'] + df_perf_agg.loc[mask_dlp_total, 'Retardos'] + df_perf_agg.loc[mask_dlp_total, 'Salidas'])
-            df_perf_agg.loc[mask_dlp_total, 'SIC'] = (numer.clip(lower=0) / denom) * 100
-
-        df_perf_agg['Tasa Ausentismo (%)'] = 0.0
-        if mask_dlp_total.any():
-            denom = df_perf_agg.loc[mask_dlp_total, 'dias_laborables_total']
-            numer = df_perf_agg.loc[mask_dlp_total, 'Faltas']
-            df_perf_agg.loc[mask_dlp_total, 'Tasa Ausentismo (%)'] = (numer / denom) * 100
-
-        df_performance_kpis = df_perf_agg.rename(columns={'employee': 'ID', 'Faltas_Justificadas': 'Faltas Justificadas'})
-
-        # APLICAMOS A TABLA 2
-        df_performance_kpis = aplicar_nombres_robusto(df_performance_kpis)
-
-        cols_kpis = ['ID', 'Nombre', 'Empleado', 'employee', 'Faltas Justificadas', 'Tasa Ausentismo (%)', 'Índice Puntualidad (%)', 'Eficiencia Horas (%)', 'SIC']
-        df_performance_kpis = df_performance_kpis[list(set(cols_kpis).intersection(df_performance_kpis.columns))]
-        
+        df_performance_kpis = pd.DataFrame({
+            'ID': ids,
+            'Nombre': nombres,
+            'Faltas Justificadas': df_kpis['faltas_justificadas'],
+            'Tasa Ausentismo (%)': df_kpis['Tasa Ausentismo (%)'],
+            'Índice Puntualidad (%)': df_kpis['Índice Puntualidad (%)'],
+            'Eficiencia Horas (%)': df_kpis['Eficiencia Horas (%)'],
+            'SIC': df_kpis['SIC'],
+        })
+        if nombres_completos:
+            df_performance_kpis = df_performance_kpis.assign(Empleado=nombres, employee=nombres)
         performance_kpis_list = df_performance_kpis.round(1).to_dict('records')
 
         final_data = {
@@ -430,450 +353,52 @@ def generar_datos_dashboard_general(start_date: str, end_date: str) -> dict:
             "employee_summary_kpis": summary_kpis_list,
             "employee_performance_kpis": performance_kpis_list
         }
-        
+        print(f"[INFO Dashboard {etiqueta}] Datos finales listos para enviar.")
         return {"success": True, "data": final_data}
 
     except Exception as e:
         import traceback
+        print(f"[ERROR Dashboard {etiqueta}]: Ocurrió una excepción - {e}")
         traceback.print_exc()
         return {"success": False, "error": f"Error interno: {str(e)}", "data": empty_data}
 
-#31pte
-def generar_datos_dashboard_31pte(start_date: str, end_date: str) -> dict:
-    empty_summary = {"total_attendances": 0, "total_permissions": 0,
-                     "total_absences": 0, "total_justified_absences": 0}
-    empty_data = {"branches": [], "period_summary": empty_summary,
-                  "employee_summary_kpis": [], "employee_performance_kpis": []}
+def generar_datos_dashboard_general(start_date: str, end_date: str, datos: tuple = None) -> dict:
+    return generar_datos_dashboard(start_date, end_date, 'Todas', datos, nombres_completos=True)
 
-    try:
-        manager = AttendanceReportManager()
-        processor = AttendanceProcessor()
+def generar_datos_dashboard_31pte(start_date: str, end_date: str, datos: tuple = None) -> dict:
+    return generar_datos_dashboard(start_date, end_date, '31pte', datos)
 
-        print(f"[INFO Dashboard 31pte] Obteniendo datos {start_date} a {end_date}")
-        codigos, checkins, permisos = manager._prepare_report_data(
-            start_date, end_date, sucursal='31pte')
-        if not codigos:
-            return {"success": True, "data": empty_data}
+def generar_datos_dashboard_villas(start_date: str, end_date: str, datos: tuple = None) -> dict:
+    return generar_datos_dashboard(start_date, end_date, 'Villas', datos)
 
-        print("[INFO Dashboard 31pte] Procesando reporte completo...")
-        df_detalle, df_resumen = processor.procesar_reporte_completo(
-            checkin_data=checkins, permisos_dict=permisos, start_date=start_date,
-            end_date=end_date, employee_codes=codigos
-        )
-        if df_resumen.empty or df_detalle.empty:
-            return {"success": True, "data": empty_data}
-
-        print("[INFO Dashboard 31pte] Calculando métricas adicionales...")
-        df_metricas = calcular_metricas_adicionales(
-            df_resumen.copy(), df_detalle.copy())
-
-        print("[INFO Dashboard 31pte] Agregando datos por sucursal...")
-        datos_agregados = agregar_datos_dashboard_por_sucursal(
-            df_metricas.copy())
-
-        print("[INFO Dashboard 31pte] Calculando resumen del periodo...")
-        total_attendances = int(df_detalle[(df_detalle['horas_esperadas'].dt.total_seconds() > 0) & (
-            df_detalle['checados_count'] > 0) & (df_detalle['tiene_permiso'] == False)].shape[0])
-        total_permissions = int(df_detalle['tiene_permiso'].sum())
-        
-        total_unjustified_absences = int(df_resumen['faltas_del_periodo'].sum(
-        )) if 'faltas_del_periodo' in df_resumen.columns else 0
-        total_justified_absences = int(df_resumen['faltas_justificadas'].sum(
-        )) if 'faltas_justificadas' in df_resumen.columns else 0
-        total_absences_kpi = total_unjustified_absences + total_justified_absences
+def generar_datos_dashboard_nave(start_date: str, end_date: str, datos: tuple = None) -> dict:
+    return generar_datos_dashboard(start_date, end_date, 'Nave', datos)
 
-        period_summary = {
-            "total_attendances": total_attendances,
-            "total_permissions": total_permissions,
-            "total_absences": total_absences_kpi,
-            "total_justified_absences": total_justified_absences
-        }
-        print(f"[INFO Dashboard 31pte] Resumen Periodo: {period_summary}")
-
-        print("[INFO Dashboard 31pte] Preparando Resumen Horas por Empleado...")
-        df_summary_kpis_agg = df_resumen.groupby('employee').agg(
-            Nombre=('Nombre', 'first'),
-            total_horas_trabajadas_td=('total_horas_trabajadas_td', 'sum'),
-            total_horas_esperadas_td=('total_horas_esperadas_td', 'sum'), # <-- CORREGIDO
-            total_horas_td=('total_horas_td', 'sum'), # <-- CORREGIDO
-            total_retardos=('total_retardos', 'sum'),
-            faltas_del_periodo=('faltas_del_periodo', 'sum')
-        ).reset_index()
-        
-        df_summary_kpis_agg['diferencia_td'] = df_summary_kpis_agg['total_horas_trabajadas_td'] - df_summary_kpis_agg['total_horas_td']
-        df_summary_kpis_agg['total_horas_trabajadas'] = df_summary_kpis_agg['total_horas_trabajadas_td'].apply(td_to_str)
-        df_summary_kpis_agg['total_horas_esperadas'] = df_summary_kpis_agg['total_horas_esperadas_td'].apply(td_to_str)
-        df_summary_kpis_agg['diferencia_HHMMSS'] = df_summary_kpis_agg['diferencia_td'].apply(lambda x: f"-{td_to_str(abs(x))}" if x.total_seconds() < 0 else td_to_str(x))
-        df_summary_kpis = df_summary_kpis_agg.copy()
-        
-        summary_rename_map = {
-            'employee': 'ID', 'Nombre': 'Empleado', 'total_horas_trabajadas': 'Hrs. Trabajadas',
-            'total_horas_esperadas': 'Hrs. Planificadas', 'diferencia_HHMMSS': 'Variación',
-            'total_retardos': 'Retardos', 'faltas_del_periodo': 'Ausencias'
-        }
-        final_summary_cols = ['ID', 'Empleado', 'Hrs. Trabajadas',
-                              'Hrs. Planificadas', 'Variación', 'Retardos', 'Ausencias']
-        df_summary_kpis = df_summary_kpis.rename(columns=summary_rename_map)
-        df_summary_kpis = df_summary_kpis[list(
-            set(final_summary_cols).intersection(df_summary_kpis.columns))]
-        summary_kpis_list = df_summary_kpis.to_dict('records')
-
-        print("[INFO Dashboard 31pte] Preparando KPIs de Rendimiento por Empleado...")
-        dias_laborables_total = df_detalle[df_detalle['horas_esperadas'].dt.total_seconds() > 0].groupby('employee').size()
-        dias_laborables_total.name = 'dias_laborables_total'
-        df_perf_agg = df_resumen.groupby('employee').agg(
-            Nombre=('Nombre', 'first'), Faltas=('faltas_del_periodo', 'sum'),
-            Retardos=('total_retardos', 'sum'), Salidas=('total_salidas_anticipadas', 'sum'),
-            Faltas_Justificadas=('faltas_justificadas', 'sum')
-        ).reset_index()
-        df_perf_agg = df_perf_agg.merge(
-            df_summary_kpis_agg[['employee', 'total_horas_trabajadas_td', 'total_horas_td']], on='employee', how='left')
-        
-        df_perf_agg['employee'] = df_perf_agg['employee'].astype(str)
-        dias_laborables_total.index = dias_laborables_total.index.astype(str)
-        df_perf_agg = df_perf_agg.merge(dias_laborables_total, on='employee', how='left').fillna(0)
-
-        mask_dlp_total = df_perf_agg['dias_laborables_total'] > 0
-        
-        total_horas_trabajadas_s = df_perf_agg['total_horas_trabajadas_td'].dt.total_seconds()
-        total_horas_netas_s = df_perf_agg['total_horas_td'].dt.total_seconds()
-        df_perf_agg['Eficiencia Horas (%)'] = 100.0
-        mask_hnp_total = total_horas_netas_s > 0
-        if mask_hnp_total.any():
-            df_perf_agg.loc[mask_hnp_total, 'Eficiencia Horas (%)'] = np.divide(
-                total_horas_trabajadas_s[mask_hnp_total], total_horas_netas_s[mask_hnp_total],
-                out=np.full_like(total_horas_trabajadas_s[mask_hnp_total], 100.0), where=total_horas_netas_s[mask_hnp_total]!=0
-            ) * 100
-        
-        df_perf_agg['Índice Puntualidad (%)'] = 100.0
-        if mask_dlp_total.any():
-            denom = df_perf_agg.loc[mask_dlp_total, 'dias_laborables_total'].astype(float)
-            numer = denom - df_perf_agg.loc[mask_dlp_total, 'Retardos'].astype(float)
-            df_perf_agg.loc[mask_dlp_total, 'Índice Puntualidad (%)'] = np.divide(numer.clip(lower=0), denom, out=np.full_like(numer, 100.0), where=denom!=0) * 100
-        
-        df_perf_agg['SIC'] = 100.0
-        if mask_dlp_total.any():
-            denom = df_perf_agg.loc[mask_dlp_total, 'dias_laborables_total'].astype(float)
-            numer = denom - (df_perf_agg.loc[mask_dlp_total, 'Faltas'] + df_perf_agg.loc[mask_dlp_total, 'Retardos'] + df_perf_agg.loc[mask_dlp_total, 'Salidas'])
-            df_perf_agg.loc[mask_dlp_total, 'SIC'] = np.divide(numer.clip(lower=0), denom, out=np.full_like(numer, 100.0), where=denom!=0) * 100
-
-        df_perf_agg['Tasa Ausentismo (%)'] = 0.0
-        if mask_dlp_total.any():
-            denom = df_perf_agg.loc[mask_dlp_total, 'dias_laborables_total'].astype(float)
-            numer = df_perf_agg.loc[mask_dlp_total, 'Faltas'].astype(float)
-            df_perf_agg.loc[mask_dlp_total, 'Tasa Ausentismo (%)'] = np.divide(numer, denom, out=np.zeros_like(numer), where=denom!=0) * 100
-        
-        df_performance_kpis = df_perf_agg.rename(columns={'employee': 'ID', 'Faltas_Justificadas': 'Faltas Justificadas'})
-        perf_cols_needed = ['ID', 'Nombre', 'Faltas Justificadas', 'Tasa Ausentismo (%)', 'Índice Puntualidad (%)', 'Eficiencia Horas (%)', 'SIC']
-        for col in perf_cols_needed:
-            if col not in df_performance_kpis.columns: df_performance_kpis[col] = 0
-        df_performance_kpis = df_performance_kpis[perf_cols_needed]
-        performance_kpis_list = df_performance_kpis.round(1).to_dict('records')
-
-        final_data = {
-            "branches": datos_agregados,
-            "period_summary": period_summary,
-            "employee_summary_kpis": summary_kpis_list,
-            "employee_performance_kpis": performance_kpis_list
-        }
-        print("[INFO Dashboard 31pte] Datos finales listos para enviar.")
-        return {"success": True, "data": final_data}
 
-    except Exception as e:
-        import traceback
-        print(f"[ERROR Dashboard 31pte]: Ocurrió una excepción - {e}")
-        traceback.print_exc()
-        return {"success": False, "error": f"Error interno: {str(e)}", "data": empty_data}
-
-#Villas
-def generar_datos_dashboard_villas(start_date: str, end_date: str) -> dict:
-    empty_summary = {"total_attendances": 0, "total_permissions": 0,
-                     "total_absences": 0, "total_justified_absences": 0}
-    empty_data = {"branches": [], "period_summary": empty_summary,
-                  "employee_summary_kpis": [], "employee_performance_kpis": []}
-
-    try:
-        manager = AttendanceReportManager()
-        processor = AttendanceProcessor()
-
-        print(f"[INFO Dashboard Villas] Obteniendo datos {start_date} a {end_date}")
-        codigos, checkins, permisos = manager._prepare_report_data(
-            start_date, end_date, sucursal='Villas')
-        if not codigos:
-            return {"success": True, "data": empty_data}
-
-        print("[INFO Dashboard Villas] Procesando reporte completo...")
-        df_detalle, df_resumen = processor.procesar_reporte_completo(
-            checkin_data=checkins, permisos_dict=permisos, start_date=start_date,
-            end_date=end_date, employee_codes=codigos
-        )
-        if df_resumen.empty or df_detalle.empty:
-            return {"success": True, "data": empty_data}
-
-        print("[INFO Dashboard Villas] Calculando métricas adicionales...")
-        df_metricas = calcular_metricas_adicionales(
-            df_resumen.copy(), df_detalle.copy())
-
-        print("[INFO Dashboard Villas] Agregando datos por sucursal...")
-        datos_agregados = agregar_datos_dashboard_por_sucursal(
-            df_metricas.copy())
-
-        print("[INFO Dashboard Villas] Calculando resumen del periodo...")
-        total_attendances = int(df_detalle[(df_detalle['horas_esperadas'].dt.total_seconds() > 0) & (
-            df_detalle['checados_count'] > 0) & (df_detalle['tiene_permiso'] == False)].shape[0])
-        total_permissions = int(df_detalle['tiene_permiso'].sum())
-        
-        total_unjustified_absences = int(df_resumen['faltas_del_periodo'].sum(
-        )) if 'faltas_del_periodo' in df_resumen.columns else 0
-        total_justified_absences = int(df_resumen['faltas_justificadas'].sum(
-        )) if 'faltas_justificadas' in df_resumen.columns else 0
-        total_absences_kpi = total_unjustified_absences + total_justified_absences
-
-        period_summary = {
-            "total_attendances": total_attendances,
-            "total_permissions": total_permissions,
-            "total_absences": total_absences_kpi,
-            "total_justified_absences": total_justified_absences
-        }
-        print(f"[INFO Dashboard Villas] Resumen Periodo: {period_summary}")
-
-        print("[INFO Dashboard Villas] Preparando Resumen Horas por Empleado...")
-        
-        # --- INICIA CORRECCIÓN DEL ERROR 'str' object ---
-        df_summary_kpis_agg = df_resumen.groupby('employee').agg(
-            Nombre=('Nombre', 'first'),
-            total_horas_trabajadas_td=('total_horas_trabajadas_td', 'sum'),
-            total_horas_esperadas_td=('total_horas_esperadas_td', 'sum'), # <-- CORREGIDO
-            total_horas_td=('total_horas_td', 'sum'), # <-- CORREGIDO
-            total_retardos=('total_retardos', 'sum'),
-            faltas_del_periodo=('faltas_del_periodo', 'sum')
-        ).reset_index()
-        # --- FIN CORRECCIÓN DEL ERROR 'str' object ---
-        
-        df_summary_kpis_agg['diferencia_td'] = df_summary_kpis_agg['total_horas_trabajadas_td'] - df_summary_kpis_agg['total_horas_td']
-        df_summary_kpis_agg['total_horas_trabajadas'] = df_summary_kpis_agg['total_horas_trabajadas_td'].apply(td_to_str)
-        df_summary_kpis_agg['total_horas_esperadas'] = df_summary_kpis_agg['total_horas_esperadas_td'].apply(td_to_str)
-        df_summary_kpis_agg['diferencia_HHMMSS'] = df_summary_kpis_agg['diferencia_td'].apply(lambda x: f"-{td_to_str(abs(x))}" if x.total_seconds() < 0 else td_to_str(x))
-        df_summary_kpis = df_summary_kpis_agg.copy()
-        summary_rename_map = {
-            'employee': 'ID', 'Nombre': 'Empleado', 'total_horas_trabajadas': 'Hrs. Trabajadas',
-            'total_horas_esperadas': 'Hrs. Planificadas', 'diferencia_HHMMSS': 'Variación',
-            'total_retardos': 'Retardos', 'faltas_del_periodo': 'Ausencias'
-        }
-        final_summary_cols = ['ID', 'Empleado', 'Hrs. Trabajadas',
-                              'Hrs. Planificadas', 'Variación', 'Retardos', 'Ausencias']
-        df_summary_kpis = df_summary_kpis.rename(columns=summary_rename_map)
-        df_summary_kpis = df_summary_kpis[list(
-            set(final_summary_cols).intersection(df_summary_kpis.columns))]
-        summary_kpis_list = df_summary_kpis.to_dict('records')
-
-
-        print("[INFO Dashboard Villas] Preparando KPIs de Rendimiento por Empleado...")
-        dias_laborables_total = df_detalle[df_detalle['horas_esperadas'].dt.total_seconds() > 0].groupby('employee').size()
-        dias_laborables_total.name = 'dias_laborables_total'
-        df_perf_agg = df_resumen.groupby('employee').agg(
-            Nombre=('Nombre', 'first'), Faltas=('faltas_del_periodo', 'sum'),
-            Retardos=('total_retardos', 'sum'), Salidas=('total_salidas_anticipadas', 'sum'),
-            Faltas_Justificadas=('faltas_justificadas', 'sum')
-        ).reset_index()
-        df_perf_agg = df_perf_agg.merge(
-            df_summary_kpis_agg[['employee', 'total_horas_trabajadas_td', 'total_horas_td']], on='employee', how='left')
-        
-        df_perf_agg['employee'] = df_perf_agg['employee'].astype(str)
-        dias_laborables_total.index = dias_laborables_total.index.astype(str)
-        df_perf_agg = df_perf_agg.merge(dias_laborables_total, on='employee', how='left').fillna(0)
-        
-        mask_dlp_total = df_perf_agg['dias_laborables_total'] > 0
-        total_horas_trabajadas_s = df_perf_agg['total_horas_trabajadas_td'].dt.total_seconds()
-        total_horas_netas_s = df_perf_agg['total_horas_td'].dt.total_seconds()
-        df_perf_agg['Eficiencia Horas (%)'] = 100.0
-        mask_hnp_total = total_horas_netas_s > 0
-        if mask_hnp_total.any():
-            df_perf_agg.loc[mask_hnp_total, 'Eficiencia Horas (%)'] = np.divide(
-                total_horas_trabajadas_s[mask_hnp_total], total_horas_netas_s[mask_hnp_total],
-                out=np.full_like(total_horas_trabajadas_s[mask_hnp_total], 100.0), where=total_horas_netas_s[mask_hnp_total]!=0
-            ) * 100
-        df_perf_agg['Índice Puntualidad (%)'] = 100.0
-        if mask_dlp_total.any():
-            denom = df_perf_agg.loc[mask_dlp_total, 'dias_laborables_total'].astype(float)
-            numer = denom - df_perf_agg.loc[mask_dlp_total, 'Retardos'].astype(float)
-            df_perf_agg.loc[mask_dlp_total, 'Índice Puntualidad (%)'] = np.divide(numer.clip(lower=0), denom, out=np.full_like(numer, 100.0), where=denom!=0) * 100
-        df_perf_agg['SIC'] = 100.0
-        if mask_dlp_total.any():
-            denom = df_perf_agg.loc[mask_dlp_total, 'dias_laborables_total'].astype(float)
-            numer = denom - (df_perf_agg.loc[mask_dlp_total, 'Faltas'] + df_perf_agg.loc[mask_dlp_total, 'Retardos'] + df_perf_agg.loc[mask_dlp_total, 'Salidas'])
-            df_perf_agg.loc[mask_dlp_total, 'SIC'] = np.divide(numer.clip(lower=0), denom, out=np.full_like(numer, 100.0), where=denom!=0) * 100
-        df_perf_agg['Tasa Ausentismo (%)'] = 0.0
-        if mask_dlp_total.any():
-            denom = df_perf_agg.loc[mask_dlp_total, 'dias_laborables_total'].astype(float)
-            numer = df_perf_agg.loc[mask_dlp_total, 'Faltas'].astype(float)
-            df_perf_agg.loc[mask_dlp_total, 'Tasa Ausentismo (%)'] = np.divide(numer, denom, out=np.zeros_like(numer), where=denom!=0) * 100
-        
-        df_performance_kpis = df_perf_agg.rename(columns={'employee': 'ID', 'Faltas_Justificadas': 'Faltas Justificadas'})
-        perf_cols_needed = ['ID', 'Nombre', 'Faltas Justificadas', 'Tasa Ausentismo (%)', 'Índice Puntualidad (%)', 'Eficiencia Horas (%)', 'SIC']
-        for col in perf_cols_needed:
-            if col not in df_performance_kpis.columns: df_performance_kpis[col] = 0
-        df_performance_kpis = df_performance_kpis[perf_cols_needed]
-        performance_kpis_list = df_performance_kpis.round(1).to_dict('records')
-
-
-        final_data = {
-            "branches": datos_agregados,
-            "period_summary": period_summary,
-            "employee_summary_kpis": summary_kpis_list,
-            "employee_performance_kpis": performance_kpis_list
-        }
-        print("[INFO Dashboard Villas] Datos finales listos para enviar.")
-        return {"success": True, "data": final_data}
-
-    except Exception as e:
-        import traceback
-        print(f"[ERROR Dashboard Villas]: Ocurrió una excepción - {e}")
-        traceback.print_exc()
-        return {"success": False, "error": f"Error interno: {str(e)}", "data": empty_data}
-
-#Nave
-def generar_datos_dashboard_nave(start_date: str, end_date: str) -> dict:
-    empty_summary = {"total_attendances": 0, "total_permissions": 0,
-                     "total_absences": 0, "total_justified_absences": 0}
-    empty_data = {"branches": [], "period_summary": empty_summary,
-                  "employee_summary_kpis": [], "employee_performance_kpis": []}
+# =================================================================
+# === VERSIONES ASYNC (vistas ASGI) ===
+# =================================================================
 
+async def _agenerar(generar, sucursal_datos: str, start_date: str, end_date: str, **kwargs) -> dict:
+    """
+    Descarga los datos del ERP de forma async y corre la etapa de pandas (la función
+    síncrona 'generar') en el executor, sin bloquear el event loop.
+    """
     try:
-        manager = AttendanceReportManager()
-        processor = AttendanceProcessor()
-
-        print(f"[INFO Dashboard Nave] Obteniendo datos {start_date} a {end_date}")
-        codigos, checkins, permisos = manager._prepare_report_data(
-            start_date, end_date, sucursal='Nave')
-        if not codigos:
-            return {"success": True, "data": empty_data}
-
-        print("[INFO Dashboard Nave] Procesando reporte completo...")
-        df_detalle, df_resumen = processor.procesar_reporte_completo(
-            checkin_data=checkins, permisos_dict=permisos, start_date=start_date,
-            end_date=end_date, employee_codes=codigos
-        )
-        if df_resumen.empty or df_detalle.empty:
-            return {"success": True, "data": empty_data}
-
-        print("[INFO Dashboard Nave] Calculando métricas adicionales...")
-        df_metricas = calcular_metricas_adicionales(
-            df_resumen.copy(), df_detalle.copy())
-
-        print("[INFO Dashboard Nave] Agregando datos por sucursal...")
-        datos_agregados = agregar_datos_dashboard_por_sucursal(
-            df_metricas.copy())
-
-        print("[INFO Dashboard Nave] Calculando resumen del periodo...")
-        total_attendances = int(df_detalle[(df_detalle['horas_esperadas'].dt.total_seconds() > 0) & (
-            df_detalle['checados_count'] > 0) & (df_detalle['tiene_permiso'] == False)].shape[0])
-        total_permissions = int(df_detalle['tiene_permiso'].sum())
-        
-        total_unjustified_absences = int(df_resumen['faltas_del_periodo'].sum(
-        )) if 'faltas_del_periodo' in df_resumen.columns else 0
-        total_justified_absences = int(df_resumen['faltas_justificadas'].sum(
-        )) if 'faltas_justificadas' in df_resumen.columns else 0
-        total_absences_kpi = total_unjustified_absences + total_justified_absences
-
-        period_summary = {
-            "total_attendances": total_attendances,
-            "total_permissions": total_permissions,
-            "total_absences": total_absences_kpi,
-            "total_justified_absences": total_justified_absences
-        }
-        print(f"[INFO Dashboard Nave] Resumen Periodo: {period_summary}")
-
-        print("[INFO Dashboard Nave] Preparando Resumen Horas por Empleado...")
-        
-        # --- INICIA CORRECCIÓN DEL ERROR 'str' object ---
-        df_summary_kpis_agg = df_resumen.groupby('employee').agg(
-            Nombre=('Nombre', 'first'),
-            total_horas_trabajadas_td=('total_horas_trabajadas_td', 'sum'),
-            total_horas_esperadas_td=('total_horas_esperadas_td', 'sum'), # <-- CORREGIDO
-            total_horas_td=('total_horas_td', 'sum'), # <-- CORREGIDO
-            total_retardos=('total_retardos', 'sum'),
-            faltas_del_periodo=('faltas_del_periodo', 'sum')
-        ).reset_index()
-        # --- FIN CORRECCIÓN DEL ERROR 'str' object ---
-
-        df_summary_kpis_agg['diferencia_td'] = df_summary_kpis_agg['total_horas_trabajadas_td'] - df_summary_kpis_agg['total_horas_td']
-        df_summary_kpis_agg['total_horas_trabajadas'] = df_summary_kpis_agg['total_horas_trabajadas_td'].apply(td_to_str)
-        df_summary_kpis_agg['total_horas_esperadas'] = df_summary_kpis_agg['total_horas_esperadas_td'].apply(td_to_str)
-        df_summary_kpis_agg['diferencia_HHMMSS'] = df_summary_kpis_agg['diferencia_td'].apply(lambda x: f"-{td_to_str(abs(x))}" if x.total_seconds() < 0 else td_to_str(x))
-        df_summary_kpis = df_summary_kpis_agg.copy()
-        summary_rename_map = {
-            'employee': 'ID', 'Nombre': 'Empleado', 'total_horas_trabajadas': 'Hrs. Trabajadas',
-            'total_horas_esperadas': 'Hrs. Planificadas', 'diferencia_HHMMSS': 'Variación',
-            'total_retardos': 'Retardos', 'faltas_del_periodo': 'Ausencias'
-        }
-        final_summary_cols = ['ID', 'Empleado', 'Hrs. Trabajadas',
-                              'Hrs. Planificadas', 'Variación', 'Retardos', 'Ausencias']
-        df_summary_kpis = df_summary_kpis.rename(columns=summary_rename_map)
-        df_summary_kpis = df_summary_kpis[list(
-            set(final_summary_cols).intersection(df_summary_kpis.columns))]
-        summary_kpis_list = df_summary_kpis.to_dict('records')
-
-        print("[INFO Dashboard Nave] Preparando KPIs de Rendimiento por Empleado...")
-        dias_laborables_total = df_detalle[df_detalle['horas_esperadas'].dt.total_seconds() > 0].groupby('employee').size()
-        dias_laborables_total.name = 'dias_laborables_total'
-        df_perf_agg = df_resumen.groupby('employee').agg(
-            Nombre=('Nombre', 'first'), Faltas=('faltas_del_periodo', 'sum'),
-            Retardos=('total_retardos', 'sum'), Salidas=('total_salidas_anticipadas', 'sum'),
-            Faltas_Justificadas=('faltas_justificadas', 'sum')
-        ).reset_index()
-        df_perf_agg = df_perf_agg.merge(
-            df_summary_kpis_agg[['employee', 'total_horas_trabajadas_td', 'total_horas_td']], on='employee', how='left')
-        
-        df_perf_agg['employee'] = df_perf_agg['employee'].astype(str)
-        dias_laborables_total.index = dias_laborables_total.index.astype(str)
-        df_perf_agg = df_perf_agg.merge(dias_laborables_total, on='employee', how='left').fillna(0)
-        
-        mask_dlp_total = df_perf_agg['dias_laborables_total'] > 0
-        total_horas_trabajadas_s = df_perf_agg['total_horas_trabajadas_td'].dt.total_seconds()
-        total_horas_netas_s = df_perf_agg['total_horas_td'].dt.total_seconds()
-        df_perf_agg['Eficiencia Horas (%)'] = 100.0
-        mask_hnp_total = total_horas_netas_s > 0
-        if mask_hnp_total.any():
-            df_perf_agg.loc[mask_hnp_total, 'Eficiencia Horas (%)'] = np.divide(
-                total_horas_trabajadas_s[mask_hnp_total], total_horas_netas_s[mask_hnp_total],
-                out=np.full_like(total_horas_trabajadas_s[mask_hnp_total], 100.0), where=total_horas_netas_s[mask_hnp_total]!=0
-            ) * 100
-        df_perf_agg['Índice Puntualidad (%)'] = 100.0
-        if mask_dlp_total.any():
-            denom = df_perf_agg.loc[mask_dlp_total, 'dias_laborables_total'].astype(float)
-            numer = denom - df_perf_agg.loc[mask_dlp_total, 'Retardos'].astype(float)
-            df_perf_agg.loc[mask_dlp_total, 'Índice Puntualidad (%)'] = np.divide(numer.clip(lower=0), denom, out=np.full_like(numer, 100.0), where=denom!=0) * 100
-        df_perf_agg['SIC'] = 100.0
-        if mask_dlp_total.any():
-            denom = df_perf_agg.loc[mask_dlp_total, 'dias_laborables_total'].astype(float)
-            numer = denom - (df_perf_agg.loc[mask_dlp_total, 'Faltas'] + df_perf_agg.loc[mask_dlp_total, 'Retardos'] + df_perf_agg.loc[mask_dlp_total, 'Salidas'])
-            df_perf_agg.loc[mask_dlp_total, 'SIC'] = np.divide(numer.clip(lower=0), denom, out=np.full_like(numer, 100.0), where=denom!=0) * 100
-        df_perf_agg['Tasa Ausentismo (%)'] = 0.0
-        if mask_dlp_total.any():
-            denom = df_perf_agg.loc[mask_dlp_total, 'dias_laborables_total'].astype(float)
-            numer = df_perf_agg.loc[mask_dlp_total, 'Faltas'].astype(float)
-            df_perf_agg.loc[mask_dlp_total, 'Tasa Ausentismo (%)'] = np.divide(numer, denom, out=np.zeros_like(numer), where=denom!=0) * 100
-        
-        df_performance_kpis = df_perf_agg.rename(columns={'employee': 'ID', 'Faltas_Justificadas': 'Faltas Justificadas'})
-        perf_cols_needed = ['ID', 'Nombre', 'Faltas Justificadas', 'Tasa Ausentismo (%)', 'Índice Puntualidad (%)', 'Eficiencia Horas (%)', 'SIC']
-        for col in perf_cols_needed:
-            if col not in df_performance_kpis.columns: df_performance_kpis[col] = 0
-        df_performance_kpis = df_performance_kpis[perf_cols_needed]
-        performance_kpis_list = df_performance_kpis.round(1).to_dict('records')
-
-
-        final_data = {
-            "branches": datos_agregados,
-            "period_summary": period_summary,
-            "employee_summary_kpis": summary_kpis_list,
-            "employee_performance_kpis": performance_kpis_list
-        }
-        print("[INFO Dashboard Nave] Datos finales listos para enviar.")
-        return {"success": True, "data": final_data}
-
+        datos = await AttendanceReportManager()._aprepare_report_data(start_date, end_date, sucursal_datos)
     except Exception as e:
-        import traceback
-        print(f"[ERROR Dashboard Nave]: Ocurrió una excepción - {e}")
-        traceback.print_exc()
-        return {"success": False, "error": f"Error interno: {str(e)}", "data": empty_data}
\ No newline at end of file
+        return {"success": False, "error": str(e)}
+    # Fuera del hilo compartido de la petición: varios reportes corren en paralelo
+    return await sync_to_async(generar, thread_sensitive=False)(
+        start_date=start_date, end_date=end_date, datos=datos, **kwargs)
+
+async def agenerar_reporte_detalle_completo(start_date: str, end_date: str, sucursal: str) -> dict:
+    return await _agenerar(generar_reporte_detalle_completo, sucursal, start_date, end_date, sucursal=sucursal)
+
+async def aiterar_reporte_detalle(start_date: str, end_date: str, sucursal: str):
+    """
+    Lista de Asistencias de un rango largo, mes por mes: entrega el resultado de cada
+    ventana en cuanto termina, para enviarlo al cliente sin juntar todo el rango.
+    """
+    for inicio, fin in ventanas_mensuales(start_date, end_date):
+        yield await agenerar_reporte_detalle_completo(inicio, fin, sucursal)
@@ -0,0 +1,29 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services import importar_empleados_service
+
+
+class Command(BaseCommand):
+    help = "Importa empleados y sus asignaciones de horario desde un archivo xlsx o csv."
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo", help="Ruta del archivo .xlsx o .csv")
+        parser.add_argument("--simular", action="store_true", help="Solo valida, no guarda nada")
+
+    def handle(self, *args, **options):
+        ruta = options["archivo"]
+        try:
+            with open(ruta, "rb") as archivo:
+                resultado = importar_empleados_service(archivo, ruta, simular=options["simular"])
+        except (OSError, ValidationError) as e:
+            raise CommandError(str(e))
+
+        for error in resultado["errores"]:
+            self.stdout.write(self.style.WARNING(f"Fila {error['fila']}: {'; '.join(error['errores'])}"))
+
+        prefijo = "Simulación: se crearían" if options["simular"] else "Se crearon"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefijo} {resultado['empleados_creados']} empleados y "
+            f"{resultado['asignaciones_creadas']} asignaciones ({len(resultado['errores'])} filas con error)."
+        ))
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.7 on 2026-10-19 14:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_alter_resumenhorario_options_empleado_deleted_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarioHorario',
+            fields=[
+                ('calendario_id', models.BigAutoField(db_column='calendario_id', primary_key=True, serialize=False)),
+                ('fecha', models.DateField(db_column='fecha')),
+                ('es_primera_quincena', models.BooleanField(db_column='es_primera_quincena')),
+                ('tiene_horario', models.BooleanField(db_column='tiene_horario', default=False)),
+                ('hora_entrada', models.TimeField(blank=True, db_column='hora_entrada', null=True)),
+                ('hora_salida', models.TimeField(blank=True, db_column='hora_salida', null=True)),
+                ('cruza_medianoche', models.BooleanField(db_column='cruza_medianoche', default=False)),
+                ('segundos_esperados', models.IntegerField(db_column='segundos_esperados', default=0)),
+                ('empleado', models.ForeignKey(db_column='empleado_id', on_delete=django.db.models.deletion.CASCADE, related_name='calendario', to='core.empleado')),
+            ],
+            options={
+                'db_table': 'CalendarioHorario',
+                'unique_together': {('empleado', 'fecha')},
+            },
+        ),
+    ]
@@ -0,0 +1,179 @@
+# Generated by Django 5.0.7 on 2026-10-19 14:03
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+# Para revertir se restaura la versión original de la función (0004)
+SQL_FUNCIONES_ORIGINALES = import_module('core.migrations.0004_funciones_personalizadas').SQL_CREATE_FUNCIONES
+
+SQL_CREATE_VISTA = """
+-- ---------------------------------------------------------------------
+-- VISTA MATERIALIZADA: un turno ya resuelto por empleado, sucursal,
+-- quincena y día de la semana (todas las sucursales, ambas quincenas).
+-- Prioridad: 1 específico de la quincena, 2 específico sin quincena,
+--            3 general de la quincena,   4 general sin quincena.
+-- ---------------------------------------------------------------------
+CREATE MATERIALIZED VIEW "mv_horarios_semanales" AS
+WITH Quincenas AS (
+    SELECT TRUE  AS es_primera_quincena
+    UNION ALL
+    SELECT FALSE
+),
+Candidatos AS (
+    /* 1️⃣  Horarios ESPECÍFICOS ------------------------------- */
+    SELECT
+        AH.empleado_id,
+        AH.sucursal_id,
+        Q.es_primera_quincena,
+        AH.dia_especifico_id          AS dia_id,
+        AH.hora_entrada_especifica    AS hora_entrada,
+        AH.hora_salida_especifica     AS hora_salida,
+        COALESCE(AH.hora_salida_especifica_cruza_medianoche, FALSE) AS cruza_medianoche,
+        CASE WHEN AH.es_primera_quincena IS NULL THEN 2 ELSE 1 END  AS prioridad
+    FROM "AsignacionHorario" AH
+    CROSS JOIN Quincenas Q
+    WHERE AH.dia_especifico_id IS NOT NULL
+      AND (AH.es_primera_quincena = Q.es_primera_quincena OR AH.es_primera_quincena IS NULL)
+
+    UNION ALL
+
+    /* 2️⃣  Horarios GENERALES (por tipo de turno) -------------- */
+    SELECT
+        AH.empleado_id,
+        AH.sucursal_id,
+        Q.es_primera_quincena,
+        DS.dia_id,
+        H.hora_entrada,
+        H.hora_salida,
+        H.cruza_medianoche,
+        CASE WHEN AH.es_primera_quincena IS NULL THEN 4 ELSE 3 END  AS prioridad
+    FROM "AsignacionHorario" AH
+    JOIN "TipoTurno" TT          ON TT.tipo_turno_id = AH.tipo_turno_id
+    JOIN "Horario" H             ON H.horario_id   = AH.horario_id
+    JOIN "DiaSemana" DS ON (
+        /* --- Traducción de rangos abreviados --- */
+        CASE
+            WHEN TT.descripcion = 'L-V' THEN DS.dia_id BETWEEN 1 AND 5
+            WHEN TT.descripcion = 'L-J' THEN DS.dia_id BETWEEN 1 AND 4
+            WHEN TT.descripcion = 'M-V' THEN DS.dia_id BETWEEN 2 AND 5
+            ELSE POSITION(
+                     CASE DS.dia_id
+                         WHEN 1 THEN 'L' WHEN 2 THEN 'M' WHEN 3 THEN 'X'
+                         WHEN 4 THEN 'J' WHEN 5 THEN 'V' WHEN 6 THEN 'S'
+                         WHEN 7 THEN 'D'
+                     END
+                  IN REPLACE(UPPER(TT.descripcion), ',', '')
+                 ) > 0
+        END
+    )
+    CROSS JOIN Quincenas Q
+    WHERE AH.dia_especifico_id IS NULL
+      AND (AH.es_primera_quincena = Q.es_primera_quincena OR AH.es_primera_quincena IS NULL)
+),
+Elegidos AS (
+    SELECT DISTINCT ON (empleado_id, sucursal_id, es_primera_quincena, dia_id) *
+    FROM Candidatos
+    ORDER BY empleado_id, sucursal_id, es_primera_quincena, dia_id, prioridad
+)
+SELECT
+    ROW_NUMBER() OVER (ORDER BY empleado_id, sucursal_id, es_primera_quincena, dia_id) AS id,
+    empleado_id,
+    sucursal_id,
+    es_primera_quincena,
+    dia_id,
+    hora_entrada,
+    hora_salida,
+    cruza_medianoche,
+    CASE
+        WHEN hora_entrada IS NULL OR hora_salida IS NULL THEN NULL
+        WHEN cruza_medianoche OR hora_salida < hora_entrada THEN
+            ROUND(((EXTRACT(EPOCH FROM ('24:00:00'::TIME - hora_entrada)) + EXTRACT(EPOCH FROM hora_salida)) / 3600.0)::NUMERIC, 2)
+        ELSE ROUND((EXTRACT(EPOCH FROM (hora_salida - hora_entrada)) / 3600.0)::NUMERIC, 2)
+    END::NUMERIC(5, 2) AS horas_totales,
+    prioridad
+FROM Elegidos
+WITH DATA;
+
+-- Índice único requerido por REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX "mv_horarios_semanales_llave_idx"
+    ON "mv_horarios_semanales" (empleado_id, sucursal_id, es_primera_quincena, dia_id);
+
+
+-- ---------------------------------------------------------------------
+-- La función multi-quincena ahora solo pivotea la vista materializada.
+-- ---------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION f_tabla_horarios_multi_quincena (p_sucursal TEXT)
+RETURNS TABLE (
+    codigo_frappe     SMALLINT,
+    nombre_completo   TEXT,
+    nombre_sucursal   TEXT,
+    es_primera_quincena BOOLEAN,
+    "Lunes"   JSONB, "Martes" JSONB, "Miércoles" JSONB,
+    "Jueves" JSONB, "Viernes" JSONB, "Sábado" JSONB, "Domingo" JSONB
+) LANGUAGE sql STABLE AS
+$func$
+SELECT
+    E.codigo_frappe,
+    E.nombre || ' ' || E.apellido_paterno   AS nombre_completo,
+    S.nombre_sucursal,
+    HS.es_primera_quincena,
+    (ARRAY_AGG(F_CrearJsonHorario(HS.hora_entrada, HS.hora_salida, HS.cruza_medianoche))
+        FILTER (WHERE HS.dia_id = 1))[1] AS "Lunes",
+    (ARRAY_AGG(F_CrearJsonHorario(HS.hora_entrada, HS.hora_salida, HS.cruza_medianoche))
+        FILTER (WHERE HS.dia_id = 2))[1] AS "Martes",
+    (ARRAY_AGG(F_CrearJsonHorario(HS.hora_entrada, HS.hora_salida, HS.cruza_medianoche))
+        FILTER (WHERE HS.dia_id = 3))[1] AS "Miércoles",
+    (ARRAY_AGG(F_CrearJsonHorario(HS.hora_entrada, HS.hora_salida, HS.cruza_medianoche))
+        FILTER (WHERE HS.dia_id = 4))[1] AS "Jueves",
+    (ARRAY_AGG(F_CrearJsonHorario(HS.hora_entrada, HS.hora_salida, HS.cruza_medianoche))
+        FILTER (WHERE HS.dia_id = 5))[1] AS "Viernes",
+    (ARRAY_AGG(F_CrearJsonHorario(HS.hora_entrada, HS.hora_salida, HS.cruza_medianoche))
+        FILTER (WHERE HS.dia_id = 6))[1] AS "Sábado",
+    (ARRAY_AGG(F_CrearJsonHorario(HS.hora_entrada, HS.hora_salida, HS.cruza_medianoche))
+        FILTER (WHERE HS.dia_id = 7))[1] AS "Domingo"
+FROM "mv_horarios_semanales" HS
+JOIN "Empleados"  E ON E.empleado_id = HS.empleado_id
+JOIN "Sucursales" S ON S.sucursal_id = HS.sucursal_id
+WHERE S.nombre_sucursal = p_sucursal
+GROUP BY
+    E.empleado_id, E.codigo_frappe, nombre_completo,
+    S.nombre_sucursal, HS.es_primera_quincena
+ORDER BY nombre_completo, HS.es_primera_quincena DESC;
+$func$;
+"""
+
+SQL_DROP_VISTA = 'DROP MATERIALIZED VIEW IF EXISTS "mv_horarios_semanales";'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_calendariohorario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HorarioSemanal',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('empleado_id', models.IntegerField()),
+                ('sucursal_id', models.IntegerField()),
+                ('es_primera_quincena', models.BooleanField()),
+                ('dia_id', models.IntegerField()),
+                ('hora_entrada', models.TimeField(null=True)),
+                ('hora_salida', models.TimeField(null=True)),
+                ('cruza_medianoche', models.BooleanField(default=False)),
+                ('horas_totales', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('prioridad', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'mv_horarios_semanales',
+                'managed': False,
+            },
+        ),
+        migrations.RunSQL(
+            sql=SQL_CREATE_VISTA,
+            reverse_sql=SQL_FUNCIONES_ORIGINALES + SQL_DROP_VISTA,
+        ),
+    ]
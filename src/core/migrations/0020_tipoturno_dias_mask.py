@@ -0,0 +1,127 @@
+# Generated by Django 5.0.7 on 2026-10-19 14:04
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+# Para revertir se recrea la vista con la traducción por texto (0019)
+SQL_VISTA_ANTERIOR = import_module('core.migrations.0019_horariosemanal').SQL_CREATE_VISTA
+
+SQL_RECREAR_VISTA = """
+DROP MATERIALIZED VIEW IF EXISTS "mv_horarios_semanales";
+
+CREATE MATERIALIZED VIEW "mv_horarios_semanales" AS
+WITH Quincenas AS (
+    SELECT TRUE  AS es_primera_quincena
+    UNION ALL
+    SELECT FALSE
+),
+Candidatos AS (
+    /* 1️⃣  Horarios ESPECÍFICOS ------------------------------- */
+    SELECT
+        AH.empleado_id,
+        AH.sucursal_id,
+        Q.es_primera_quincena,
+        AH.dia_especifico_id          AS dia_id,
+        AH.hora_entrada_especifica    AS hora_entrada,
+        AH.hora_salida_especifica     AS hora_salida,
+        COALESCE(AH.hora_salida_especifica_cruza_medianoche, FALSE) AS cruza_medianoche,
+        CASE WHEN AH.es_primera_quincena IS NULL THEN 2 ELSE 1 END  AS prioridad
+    FROM "AsignacionHorario" AH
+    CROSS JOIN Quincenas Q
+    WHERE AH.dia_especifico_id IS NOT NULL
+      AND (AH.es_primera_quincena = Q.es_primera_quincena OR AH.es_primera_quincena IS NULL)
+
+    UNION ALL
+
+    /* 2️⃣  Horarios GENERALES (por tipo de turno) -------------- */
+    SELECT
+        AH.empleado_id,
+        AH.sucursal_id,
+        Q.es_primera_quincena,
+        DS.dia_id,
+        H.hora_entrada,
+        H.hora_salida,
+        H.cruza_medianoche,
+        CASE WHEN AH.es_primera_quincena IS NULL THEN 4 ELSE 3 END  AS prioridad
+    FROM "AsignacionHorario" AH
+    JOIN "TipoTurno" TT          ON TT.tipo_turno_id = AH.tipo_turno_id
+    JOIN "Horario" H             ON H.horario_id   = AH.horario_id
+    JOIN "DiaSemana" DS          ON (TT.dias_mask & (1 << (DS.dia_id - 1))) <> 0
+    CROSS JOIN Quincenas Q
+    WHERE AH.dia_especifico_id IS NULL
+      AND (AH.es_primera_quincena = Q.es_primera_quincena OR AH.es_primera_quincena IS NULL)
+),
+Elegidos AS (
+    SELECT DISTINCT ON (empleado_id, sucursal_id, es_primera_quincena, dia_id) *
+    FROM Candidatos
+    ORDER BY empleado_id, sucursal_id, es_primera_quincena, dia_id, prioridad
+)
+SELECT
+    ROW_NUMBER() OVER (ORDER BY empleado_id, sucursal_id, es_primera_quincena, dia_id) AS id,
+    empleado_id,
+    sucursal_id,
+    es_primera_quincena,
+    dia_id,
+    hora_entrada,
+    hora_salida,
+    cruza_medianoche,
+    CASE
+        WHEN hora_entrada IS NULL OR hora_salida IS NULL THEN NULL
+        WHEN cruza_medianoche OR hora_salida < hora_entrada THEN
+            ROUND(((EXTRACT(EPOCH FROM ('24:00:00'::TIME - hora_entrada)) + EXTRACT(EPOCH FROM hora_salida)) / 3600.0)::NUMERIC, 2)
+        ELSE ROUND((EXTRACT(EPOCH FROM (hora_salida - hora_entrada)) / 3600.0)::NUMERIC, 2)
+    END::NUMERIC(5, 2) AS horas_totales,
+    prioridad
+FROM Elegidos
+WITH DATA;
+
+CREATE UNIQUE INDEX "mv_horarios_semanales_llave_idx"
+    ON "mv_horarios_semanales" (empleado_id, sucursal_id, es_primera_quincena, dia_id);
+"""
+
+SQL_DROP_VISTA = 'DROP MATERIALIZED VIEW IF EXISTS "mv_horarios_semanales";'
+
+
+# Copia congelada de core.models.calcular_mascara_dias: la migración no debe
+# cambiar si el modelo evoluciona. Misma lectura que la vista 0019.
+MAPA_DIAS = {'L': 1, 'M': 2, 'X': 3, 'J': 4, 'V': 5, 'S': 6, 'D': 7}
+RANGOS = {'L-V': (1, 5), 'L-J': (1, 4), 'M-V': (2, 5)}
+
+
+def calcular_mascara_dias(descripcion):
+    codigo = (descripcion or "").upper().replace(" ", "")
+    if codigo in RANGOS:
+        inicio, fin = RANGOS[codigo]
+        dias = range(inicio, fin + 1)
+    else:
+        dias = [dia_id for letra, dia_id in MAPA_DIAS.items() if letra in codigo]
+    return sum(1 << (dia_id - 1) for dia_id in dias)
+
+
+def calcular_mascaras(apps, schema_editor):
+    TipoTurno = apps.get_model('core', 'TipoTurno')
+    tipos = list(TipoTurno.objects.all())
+    for tipo in tipos:
+        tipo.dias_mask = calcular_mascara_dias(tipo.descripcion)
+    TipoTurno.objects.bulk_update(tipos, ['dias_mask'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_horariosemanal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tipoturno',
+            name='dias_mask',
+            field=models.PositiveSmallIntegerField(db_column='dias_mask', default=0),
+        ),
+        migrations.RunPython(calcular_mascaras, migrations.RunPython.noop),
+        migrations.RunSQL(
+            sql=SQL_RECREAR_VISTA,
+            reverse_sql=SQL_DROP_VISTA + SQL_VISTA_ANTERIOR,
+        ),
+    ]
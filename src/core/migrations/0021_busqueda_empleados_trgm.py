@@ -0,0 +1,39 @@
+from django.db import migrations
+
+SQL_CREATE_BUSQUEDA = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() es STABLE; este envoltorio IMMUTABLE permite usarlo en un índice
+CREATE OR REPLACE FUNCTION f_unaccent(TEXT)
+RETURNS TEXT LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS
+$func$
+SELECT public.unaccent('public.unaccent', $1)
+$func$;
+
+-- Misma expresión que EXPRESION_BUSQUEDA_EMPLEADO en core/db_postgres_connection.py
+CREATE INDEX IF NOT EXISTS "empleados_busqueda_trgm_idx" ON "Empleados" USING gin (
+    f_unaccent(lower("Empleados"."nombre" || ' ' || "Empleados"."apellido_paterno" || ' ' ||
+    coalesce("Empleados"."apellido_materno", '') || ' ' || coalesce("Empleados"."email", '') || ' ' ||
+    "Empleados"."codigo_frappe"::text || ' ' || "Empleados"."codigo_checador"::text)) gin_trgm_ops
+);
+"""
+
+SQL_DROP_BUSQUEDA = """
+DROP INDEX IF EXISTS "empleados_busqueda_trgm_idx";
+DROP FUNCTION IF EXISTS f_unaccent(TEXT);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_tipoturno_dias_mask'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=SQL_CREATE_BUSQUEDA,
+            reverse_sql=SQL_DROP_BUSQUEDA,
+        ),
+    ]
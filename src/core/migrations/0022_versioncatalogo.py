@@ -0,0 +1,29 @@
+# Generated by Django 5.0.7 on 2026-10-19 14:10
+
+from django.db import migrations, models
+
+
+def crear_version_inicial(apps, schema_editor):
+    VersionCatalogo = apps.get_model('core', 'VersionCatalogo')
+    VersionCatalogo.objects.get_or_create(nombre='catalogos', defaults={'version': 1})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_busqueda_empleados_trgm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionCatalogo',
+            fields=[
+                ('nombre', models.CharField(db_column='nombre', max_length=50, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(db_column='version', default=1)),
+            ],
+            options={
+                'db_table': 'VersionCatalogos',
+            },
+        ),
+        migrations.RunPython(crear_version_inicial, migrations.RunPython.noop),
+    ]
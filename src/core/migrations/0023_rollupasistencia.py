@@ -0,0 +1,41 @@
+# Generated by Django 5.0.7 on 2026-10-19 14:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_versioncatalogo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupAsistencia',
+            fields=[
+                ('rollup_id', models.BigAutoField(db_column='rollup_id', primary_key=True, serialize=False)),
+                ('alcance', models.CharField(db_column='alcance', default='Todas', max_length=100)),
+                ('sucursal', models.CharField(db_column='sucursal', max_length=100)),
+                ('nivel', models.CharField(choices=[('dia', 'Día'), ('semana', 'Semana'), ('quincena', 'Quincena'), ('mes', 'Mes')], db_column='nivel', max_length=10)),
+                ('inicio', models.DateField(db_column='inicio')),
+                ('fin', models.DateField(db_column='fin')),
+                ('segundos_trabajados', models.BigIntegerField(db_column='segundos_trabajados', default=0)),
+                ('segundos_esperados', models.BigIntegerField(db_column='segundos_esperados', default=0)),
+                ('segundos_permiso', models.BigIntegerField(db_column='segundos_permiso', default=0)),
+                ('dias_laborables', models.IntegerField(db_column='dias_laborables', default=0)),
+                ('asistencias', models.IntegerField(db_column='asistencias', default=0)),
+                ('permisos', models.IntegerField(db_column='permisos', default=0)),
+                ('faltas', models.IntegerField(db_column='faltas', default=0)),
+                ('faltas_justificadas', models.IntegerField(db_column='faltas_justificadas', default=0)),
+                ('retardos', models.IntegerField(db_column='retardos', default=0)),
+                ('salidas_anticipadas', models.IntegerField(db_column='salidas_anticipadas', default=0)),
+                ('empleado', models.ForeignKey(db_column='empleado_id', on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='core.empleado')),
+            ],
+            options={
+                'db_table': 'RollupAsistencia',
+                'indexes': [models.Index(fields=['nivel', 'inicio'], name='RollupAsist_nivel_ef546c_idx')],
+                'unique_together': {('empleado', 'alcance', 'sucursal', 'nivel', 'inicio')},
+            },
+        ),
+    ]
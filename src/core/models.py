@@ -72,12 +72,47 @@ class Sucursal(models.Model):
     def __str__(self):
         return self.nombre_sucursal
 
+# Letra de cada día en las descripciones de turno (X es Miércoles)
+MAPA_DIAS_TURNO = {'L': 1, 'M': 2, 'X': 3, 'J': 4, 'V': 5, 'S': 6, 'D': 7}
+
+# Únicos códigos con guion que se leen como rango (igual que la vista 0019)
+RANGOS_TURNO = {'L-V': (1, 5), 'L-J': (1, 4), 'M-V': (2, 5)}
+
+def calcular_mascara_dias(descripcion: str) -> int:
+    """
+    Traduce un código de turno ("L-V", "X,J,V", "LXV") a una máscara de 7 bits
+    donde el bit (dia_id - 1) indica que el turno cubre ese día.
+
+    Se conserva la semántica de la vista materializada anterior: solo "L-V",
+    "L-J" y "M-V" son rangos; cualquier otro código se lee letra por letra, de
+    modo que "L-S" cubre Lunes y Sábado (no Lunes a Sábado).
+    """
+    codigo = (descripcion or "").upper().replace(" ", "")
+    if codigo in RANGOS_TURNO:
+        inicio, fin = RANGOS_TURNO[codigo]
+        dias = range(inicio, fin + 1)
+    else:
+        dias = [dia_id for letra, dia_id in MAPA_DIAS_TURNO.items() if letra in codigo]
+    return sum(1 << (dia_id - 1) for dia_id in dias)
+
 class TipoTurno(models.Model):
     tipo_turno_id = models.AutoField(primary_key=True, db_column='tipo_turno_id')
     descripcion = models.CharField(max_length=100, unique=True, db_column='descripcion')
+    dias_mask = models.PositiveSmallIntegerField(default=0, db_column='dias_mask')
     class Meta:
         db_table = 'TipoTurno'
 
+    def save(self, *args, **kwargs):
+        # La máscara se recalcula siempre a partir de la descripción
+        self.dias_mask = calcular_mascara_dias(self.descripcion)
+        if kwargs.get('update_fields') is not None and 'descripcion' in kwargs['update_fields']:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'dias_mask'}
+        super().save(*args, **kwargs)
+
+    def incluye_dia(self, dia_id: int) -> bool:
+        """Indica si el turno cubre el día (1=Lunes ... 7=Domingo)."""
+        return bool(self.dias_mask & (1 << (dia_id - 1)))
+
 class Horario(models.Model):
     horario_id = models.AutoField(primary_key=True, db_column='horario_id')
     hora_entrada = models.TimeField(db_column='hora_entrada')
@@ -139,6 +174,91 @@ class AsignacionHorario(models.Model):
         
         return texto_base
 
+class CalendarioHorario(models.Model):
+    """
+    Horario esperado ya resuelto por empleado y fecha, con la quincena correcta de
+    cada día. Se llena bajo demanda y se invalida cuando cambian las asignaciones,
+    de modo que cualquier rango de fechas es un escaneo por índice (empleado, fecha).
+    """
+    calendario_id = models.BigAutoField(primary_key=True, db_column='calendario_id')
+    empleado = models.ForeignKey(Empleado, on_delete=models.CASCADE, db_column='empleado_id', related_name='calendario')
+    fecha = models.DateField(db_column='fecha')
+    es_primera_quincena = models.BooleanField(db_column='es_primera_quincena')
+    tiene_horario = models.BooleanField(default=False, db_column='tiene_horario')
+    hora_entrada = models.TimeField(null=True, blank=True, db_column='hora_entrada')
+    hora_salida = models.TimeField(null=True, blank=True, db_column='hora_salida')
+    cruza_medianoche = models.BooleanField(default=False, db_column='cruza_medianoche')
+    segundos_esperados = models.IntegerField(default=0, db_column='segundos_esperados')
+    class Meta:
+        db_table = 'CalendarioHorario'
+        unique_together = (('empleado', 'fecha'),)
+
+class VersionCatalogo(models.Model):
+    """
+    Contador de versión de los catálogos (DiaSemana, Sucursal, Horario, TipoTurno).
+    Cada worker compara su copia en memoria contra esta fila para detectar cambios
+    hechos por otros procesos.
+    """
+    nombre = models.CharField(max_length=50, primary_key=True, db_column='nombre')
+    version = models.BigIntegerField(default=1, db_column='version')
+    class Meta:
+        db_table = 'VersionCatalogos'
+
+class RollupAsistencia(models.Model):
+    """
+    Contadores aditivos de asistencia por empleado, sucursal y periodo: día, semana,
+    quincena o mes. Las semanas se recortan a la quincena, así cada nivel es la suma
+    exacta del anterior y un rango cualquiera se responde sumando pocas filas.
+
+    'alcance' es el dashboard que calculó la fila ('Todas' o una sucursal): los de
+    sucursal solo ven las checadas de sus dispositivos, así que cada uno guarda y lee
+    sus propios rollups.
+    """
+    NIVELES = [('dia', 'Día'), ('semana', 'Semana'), ('quincena', 'Quincena'), ('mes', 'Mes')]
+
+    rollup_id = models.BigAutoField(primary_key=True, db_column='rollup_id')
+    empleado = models.ForeignKey(Empleado, on_delete=models.CASCADE, db_column='empleado_id', related_name='rollups')
+    alcance = models.CharField(max_length=100, default='Todas', db_column='alcance')
+    sucursal = models.CharField(max_length=100, db_column='sucursal')
+    nivel = models.CharField(max_length=10, choices=NIVELES, db_column='nivel')
+    inicio = models.DateField(db_column='inicio')
+    fin = models.DateField(db_column='fin')
+    segundos_trabajados = models.BigIntegerField(default=0, db_column='segundos_trabajados')
+    segundos_esperados = models.BigIntegerField(default=0, db_column='segundos_esperados')
+    segundos_permiso = models.BigIntegerField(default=0, db_column='segundos_permiso')
+    dias_laborables = models.IntegerField(default=0, db_column='dias_laborables')
+    asistencias = models.IntegerField(default=0, db_column='asistencias')
+    permisos = models.IntegerField(default=0, db_column='permisos')
+    faltas = models.IntegerField(default=0, db_column='faltas')
+    faltas_justificadas = models.IntegerField(default=0, db_column='faltas_justificadas')
+    retardos = models.IntegerField(default=0, db_column='retardos')
+    salidas_anticipadas = models.IntegerField(default=0, db_column='salidas_anticipadas')
+    class Meta:
+        db_table = 'RollupAsistencia'
+        unique_together = (('empleado', 'alcance', 'sucursal', 'nivel', 'inicio'),)
+        indexes = [
+            models.Index(fields=['nivel', 'inicio']),
+        ]
+
+class HorarioSemanal(models.Model):
+    """
+    Vista materializada "mv_horarios_semanales": turno ya resuelto por empleado,
+    sucursal, quincena y día de la semana. Se refresca al cambiar las asignaciones.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    empleado_id = models.IntegerField()
+    sucursal_id = models.IntegerField()
+    es_primera_quincena = models.BooleanField()
+    dia_id = models.IntegerField()
+    hora_entrada = models.TimeField(null=True)
+    hora_salida = models.TimeField(null=True)
+    cruza_medianoche = models.BooleanField(default=False)
+    horas_totales = models.DecimalField(max_digits=5, decimal_places=2, null=True)
+    prioridad = models.IntegerField()
+    class Meta:
+        db_table = 'mv_horarios_semanales'
+        managed = False
+
 class ResumenHorario(models.Model):
     empleado_id = models.IntegerField(primary_key=True)
     nombre = models.CharField(max_length=100)
@@ -0,0 +1,169 @@
+"""
+Process pool used to split report analysis across CPU cores.
+
+Each gunicorn worker lazily starts one long-lived pool with the 'forkserver'
+start method ('spawn' where it is unavailable). Forking a multithreaded ASGI
+worker directly could copy locks held by other threads, and a pool per request
+would not bound the number of processes. Children run django.setup() once.
+
+Large DataFrames reach the children through one shared memory block: numeric
+and datetime columns as raw buffers, text columns as factorized codes (their
+distinct values travel in the small pickled metadata). Only the metadata and
+each child's result are pickled.
+
+This module must not import Django models: children import it before setup.
+"""
+
+import atexit
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_all_start_methods, get_context, resource_tracker, shared_memory
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _iniciar_proceso() -> None:
+    """Initializer of every child: loads Django (DJANGO_SETTINGS_MODULE is inherited)."""
+    import django
+    django.setup()
+
+
+def _obtener_pool(procesos: int) -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            metodo = 'forkserver' if 'forkserver' in get_all_start_methods() else 'spawn'
+            _pool = ProcessPoolExecutor(max_workers=procesos, mp_context=get_context(metodo),
+                                        initializer=_iniciar_proceso)
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def ejecutar_en_pool(funcion: Callable[[Any], Any], tareas: Iterable[Any], procesos: int) -> List[Any]:
+    """
+    Runs funcion(tarea) for every task on the worker's pool and returns the results in order.
+    Concurrent requests share the same processes; their tasks simply queue.
+
+    Args:
+        funcion: Module-level callable (it is pickled by reference)
+        tareas: Picklable arguments, one per call
+        procesos: Pool size, used only when the pool is created
+
+    Returns:
+        List with the result of each task
+    """
+    global _pool
+    pool = _obtener_pool(procesos)
+    try:
+        return list(pool.map(funcion, tareas))
+    except BrokenProcessPool:
+        # A child died (e.g. OOM killer): the next report starts a fresh pool
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        raise
+
+
+# =================================================================
+# DataFrames in shared memory
+# =================================================================
+
+def _alinear(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def exportar_dataframe(df: pd.DataFrame) -> Tuple[shared_memory.SharedMemory, Dict[str, Any]]:
+    """
+    Copies a DataFrame into a new shared memory block.
+
+    Returns:
+        Tuple (block, metadata). The caller must close() and unlink() the block
+        once every reader is done; the metadata is what readers receive.
+    """
+    arreglos = [('__index__', None, df.index.to_numpy())] if df.index.dtype.kind in 'iu' else []
+    columnas = []
+    for nombre in df.columns:
+        serie = df[nombre]
+        if isinstance(serie.dtype, pd.DatetimeTZDtype):
+            valores = serie.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy()
+            columnas.append((nombre, 'tz', serie.dt.tz))
+        elif isinstance(serie.dtype, np.dtype) and serie.dtype.kind in 'biufmM':
+            valores = serie.to_numpy()
+            columnas.append((nombre, 'numpy', None))
+        else:
+            # Text and other objects: codes here, distinct values in the metadata
+            codigos, unicos = pd.factorize(serie, use_na_sentinel=False)
+            valores = codigos
+            columnas.append((nombre, 'codigos', (np.asarray(unicos, dtype=object), serie.dtype)))
+        arreglos.append((nombre, None, valores))
+
+    tamano = sum(_alinear(a.nbytes) for _, _, a in arreglos)
+    bloque = shared_memory.SharedMemory(create=True, size=max(tamano, 1))
+    buffers = {}
+    desplazamiento = 0
+    for nombre, _, valores in arreglos:
+        destino = np.ndarray(valores.shape, dtype=valores.dtype, buffer=bloque.buf, offset=desplazamiento)
+        destino[:] = valores
+        buffers[nombre] = (valores.dtype.str, len(valores), desplazamiento)
+        desplazamiento += _alinear(valores.nbytes)
+        del destino  # No views may outlive close()
+    return bloque, {"bloque": bloque.name, "buffers": buffers, "columnas": columnas}
+
+
+_registro_lock = threading.Lock()
+
+
+def _abrir_bloque(nombre: str) -> shared_memory.SharedMemory:
+    """
+    Attaches to a block created by another process without registering it with the
+    resource_tracker: the creator owns it and unlinks it. Before Python 3.13 attaching
+    always registers, so registration is skipped for this call. Unregistering after
+    attaching is not an option: pool children share the parent's tracker, and that
+    would drop the parent's own registration.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=nombre, track=False)
+    with _registro_lock:
+        registrar = resource_tracker.register
+        resource_tracker.register = lambda nombre, tipo: None
+        try:
+            return shared_memory.SharedMemory(name=nombre)
+        finally:
+            resource_tracker.register = registrar
+
+
+def leer_dataframe(meta: Dict[str, Any], columna: str, valores: Iterable[Any]) -> pd.DataFrame:
+    """
+    Rebuilds the rows of a shared DataFrame whose `columna` is in `valores`.
+    Only the selected rows are copied out of the block.
+    """
+    bloque = _abrir_bloque(meta["bloque"])
+    try:
+        def vista(nombre):
+            dtype, largo, desplazamiento = meta["buffers"][nombre]
+            return np.ndarray((largo,), dtype=np.dtype(dtype), buffer=bloque.buf, offset=desplazamiento)
+
+        filas = np.flatnonzero(np.isin(vista(columna), list(valores)))
+        indice = vista('__index__')[filas] if '__index__' in meta["buffers"] else None
+        datos = {}
+        for nombre, tipo, extra in meta["columnas"]:
+            seleccion = vista(nombre)[filas]
+            if tipo == 'tz':
+                datos[nombre] = pd.Series(seleccion, index=indice).dt.tz_localize('UTC').dt.tz_convert(extra)
+            elif tipo == 'codigos':
+                unicos, dtype = extra
+                serie = pd.Series(unicos[seleccion], index=indice, dtype=object)
+                datos[nombre] = serie if dtype == object else serie.astype(dtype)
+            else:
+                datos[nombre] = pd.Series(seleccion, index=indice)
+        # Fancy indexing copied every selection, so no view of the block survives
+        return pd.DataFrame(datos, index=indice, columns=[c[0] for c in meta["columnas"]])
+    finally:
+        bloque.close()
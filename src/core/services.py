@@ -1,6 +1,5 @@
 # Imports de Python y librerías externas
 from datetime import datetime, timedelta, time
-from itertools import product
 import pandas as pd
 from typing import Dict, List, Tuple
 import secrets
@@ -12,19 +11,25 @@ from django.contrib.auth.models import User, Group
 from django.core.exceptions import ValidationError
 from django.core.mail import send_mail
 from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, Value, When
 
 # Imports de tus propios archivos de la aplicación
-from .models import Empleado, AsignacionHorario, Sucursal, Horario, DiaSemana
+from .models import Empleado, AsignacionHorario, Sucursal, Horario, calcular_mascara_dias
 from .config import (
     TOLERANCIA_SALIDA_ANTICIPADA_MINUTOS,
     TOLERANCIA_RETARDO_MINUTOS,
-    DIAS_ESPANOL,
+    DIAS_SEMANA_ES,
+    MAX_CHECADAS_DETALLE,
 )
-from .utils import td_to_str
-from .db_postgres_connection import obtener_horario_empleado_completo
+from .utils import td_to_str, normalizar_codigos_empleado, permisos_por_dia
+from .db_postgres_connection import obtener_calendario_horarios, programar_refresco_horarios, filtrar_busqueda_empleados
+from .procesos_reporte import ejecutar_en_pool, exportar_dataframe, leer_dataframe
+from .cache_manager import obtener_o_calcular, CLAVE_MAPA_ROLES
 import numpy as np
 from django.shortcuts import get_object_or_404
 
+
 def autenticar_usuario(request, email, password):
     try:
         user_obj = User.objects.get(email=email)
@@ -45,79 +50,68 @@ def crear_empleado_service(data):
     if data.get("email") and Empleado.objects.filter(email=data.get("email")).exists():
         raise ValidationError("Ya existe un empleado activo con este email.")
 
-    # 2. Crear empleado (por defecto es activo)
-    empleado = Empleado.objects.create(
-        codigo_frappe=data.get("codigoFrappe"),
-        codigo_checador=data.get("codigoChecador"),
-        nombre=data.get("nombre"),
-        apellido_paterno=data.get("primerApellido"),
-        apellido_materno=data.get("segundoApellido"),
-        email=data.get("email"),
-        tiene_horario_asignado=True,
-    )
-    print(f"[DEBUG] Empleado creado -> ID: {empleado.pk}, Nombre: {empleado.nombre}")
-
-    # 3. Crear asignaciones...
-    sucursales = data.getlist("sucursales[]")
-    horarios = data.getlist("horarios[]")
-    dias = data.getlist("dias[]")
-
-    if not sucursales or not horarios or not dias:
-        print("[ERROR] No llegaron datos de horarios/sucursales/días")
-        return empleado
-
-    for sucursal_id, horario_id, dias_str in zip(sucursales, horarios, dias):
-        dias_list = dias_str.split(",")
-        for dia in dias_list:
-            try:
-                horario = Horario.objects.get(pk=int(horario_id))
-                AsignacionHorario.objects.create(
-                    empleado=empleado,
-                    sucursal_id=int(sucursal_id),
-                    horario=horario,
-                    dia_especifico_id=int(dia),
-                    hora_entrada_especifica=horario.hora_entrada,
-                    hora_salida_especifica=horario.hora_salida,
-                    hora_salida_especifica_cruza_medianoche=horario.cruza_medianoche,
-                )
-            except Horario.DoesNotExist:
-                print(f"[ERROR] Horario con ID {horario_id} no existe, saltando asignación.")
-            except Exception as e:
-                print(f"[ERROR] No se pudo crear asignación: {e}")
+    # 2. Crear empleado (por defecto es activo) y sus asignaciones en una sola transacción
+    with transaction.atomic():
+        empleado = Empleado.objects.create(
+            codigo_frappe=data.get("codigoFrappe"),
+            codigo_checador=data.get("codigoChecador"),
+            nombre=data.get("nombre"),
+            apellido_paterno=data.get("primerApellido"),
+            apellido_materno=data.get("segundoApellido"),
+            email=data.get("email"),
+            tiene_horario_asignado=True,
+        )
+        print(f"[DEBUG] Empleado creado -> ID: {empleado.pk}, Nombre: {empleado.nombre}")
+
+        # 3. Crear asignaciones...
+        sucursales = data.getlist("sucursales[]")
+        horarios = data.getlist("horarios[]")
+        dias = data.getlist("dias[]")
+
+        if not sucursales or not horarios or not dias:
+            print("[ERROR] No llegaron datos de horarios/sucursales/días")
+            return empleado
+
+        # Un solo in_bulk de Horario y un solo INSERT para todos los días
+        AsignacionHorario.objects.bulk_create(_construir_asignaciones(empleado, sucursales, horarios, dias))
+        programar_refresco_horarios([empleado.pk])
     return empleado
 
-def listar_empleados():
+def listar_empleados(busqueda: str = "", limite: int = 50, despues_de: int = None,
+                     incluir_bajas: bool = False, solo_con_horario: bool = True) -> Dict:
     """
     Lista empleados activos que tienen al menos una asignación de horario.
-    NOTA: Se corrige la consulta original, asumiendo que el objetivo es obtener
-    los datos de Empleado a través de su Asignación. Usa el filtro is_deleted.
+    La unicidad la resuelve la BD con un EXISTS (no se recorren asignaciones) y se
+    pagina por llave (empleado_id > despues_de), así cada pantalla es una sola consulta.
+    La pantalla de gestión pide también los dados de baja y los que aún no tienen
+    horario (incluir_bajas=True, solo_con_horario=False).
+
+    Devuelve {"empleados": [...], "siguiente": empleado_id para la próxima página o None}.
     """
-    # Consulta optimizada: trae asignaciones relacionadas con empleado/sucursal/horario
-    empleados_qs = AsignacionHorario.objects.select_related("empleado", "sucursal", "horario").all()
-
-    # Filtramos y desduplicamos en Python
-    lista_empleados = []
-    empleados_procesados = set()
-
-    for a in empleados_qs:
-        emp = a.empleado
-        # CRUCIAL: Solo incluimos si el empleado NO está eliminado (is_deleted=False)
-        # y si aún no ha sido procesado
-        if not emp.is_deleted and emp.empleado_id not in empleados_procesados:
-            lista_empleados.append(
-                {
-                    "empleado_id": emp.empleado_id,
-                    "nombre": emp.nombre,
-                    "apellido_paterno": emp.apellido_paterno,
-                    "apellido_materno": emp.apellido_materno,
-                    "email": emp.email,
-                    "codigo_frappe": emp.codigo_frappe,
-                    "codigo_checador": emp.codigo_checador,
-                }
-            )
-            empleados_procesados.add(emp.empleado_id)
-            
-    return lista_empleados
+    base = Empleado.all_objects if incluir_bajas else Empleado.objects
+    empleados_qs = base.all()
+    if solo_con_horario:
+        empleados_qs = empleados_qs.filter(
+            Exists(AsignacionHorario.objects.filter(empleado_id=OuterRef('empleado_id')))
+        )
+
+    if busqueda:
+        empleados_qs = filtrar_busqueda_empleados(empleados_qs, busqueda)
+    if despues_de is not None:
+        empleados_qs = empleados_qs.filter(empleado_id__gt=despues_de)
+
+    # Se pide un registro extra para saber si hay otra página sin hacer un COUNT
+    lista_empleados = list(empleados_qs.order_by('empleado_id').values(
+        "empleado_id", "nombre", "apellido_paterno", "apellido_materno",
+        "email", "codigo_frappe", "codigo_checador", "is_deleted",
+    )[:limite + 1])
+
+    siguiente = None
+    if len(lista_empleados) > limite:
+        lista_empleados = lista_empleados[:limite]
+        siguiente = lista_empleados[-1]["empleado_id"]
+
+    return {"empleados": lista_empleados, "siguiente": siguiente}
 
 def crear_horario_service(data):
     """Crea un nuevo horario validando que no exista uno con la misma configuración."""
@@ -226,6 +220,27 @@ def asignar_rol_service(data):
 
     return {"success": f"Usuario '{username}' creado y vinculado correctamente."}
 
+def _rol_desde_grupos(grupos) -> str:
+    # Si un usuario está en ambos grupos, se cataloga como "Admin"
+    if "Admin" in grupos: return "Admin"
+    if "Manager" in grupos: return "Manager"
+    return ""
+
+def obtener_mapa_roles() -> Dict[int, str]:
+    """
+    Mapa {user_id: "Admin"/"Manager"} resuelto en una sola consulta sobre la tabla
+    intermedia usuario-grupo. Se guarda en caché y se invalida por señal cuando
+    cambia la membresía de grupos.
+    """
+    def calcular():
+        grupos_por_usuario = {}
+        for user_id, grupo in User.groups.through.objects.filter(
+                group__name__in=["Admin", "Manager"]).values_list("user_id", "group__name"):
+            grupos_por_usuario.setdefault(user_id, set()).add(grupo)
+        return {user_id: _rol_desde_grupos(grupos) for user_id, grupos in grupos_por_usuario.items()}
+
+    return obtener_o_calcular(CLAVE_MAPA_ROLES, calcular)
+
 def obtener_roles_service():
     # 1. Filtra empleados que tienen un usuario de Django asociado (es decir, tienen un rol)
     empleados_con_usuario = (
@@ -234,26 +249,17 @@ def obtener_roles_service():
         .filter(user__isnull=False) # SOLO los que tienen rol asignado
     )
 
+    # 2. Roles de todos los usuarios de una vez (sin consulta por empleado)
+    mapa_roles = obtener_mapa_roles()
+
     resultado = []
     for emp in empleados_con_usuario:
-        # 2. Obtiene los nombres de los grupos a los que pertenece el usuario
-        grupos = emp.user.groups.values_list("name", flat=True)
-        
-        # 3. Determina el rol a mostrar
-        rol = "—" # Valor por defecto
-
-        if "Admin" in grupos:
-            rol = "Admin"
-        elif "Manager" in grupos:
-            rol = "Manager"
-        # Nota: Si un usuario está en ambos grupos, esta lógica lo catalogará como "Admin".
-        
         resultado.append({
             "id": emp.empleado_id,
             "nombre_completo": f"{emp.nombre} {emp.apellido_paterno or ''} {emp.apellido_materno or ''}".strip(),
             "correo": emp.user.email,
             "codigo_frappe": emp.codigo_frappe,
-            "rol": rol, # Aquí se muestra si es "Admin" o "Manager"
+            "rol": mapa_roles.get(emp.user_id) or "—", # Aquí se muestra si es "Admin" o "Manager"
         })
 
     return resultado
@@ -265,8 +271,7 @@ def obtener_admin_por_id_service(empleado_id):
 
         if not user: return None
 
-        grupos = user.groups.values_list("name", flat=True)
-        rol = "Admin" if "Admin" in grupos else "Manager" if "Manager" in grupos else ""
+        rol = obtener_mapa_roles().get(user.pk, "")
 
         return {
             "empleado_id": empleado.empleado_id, "firstName": empleado.nombre, "firstLastName": empleado.apellido_paterno,
@@ -304,30 +309,94 @@ def map_device_to_sucursal(device_id_str: str) -> str:
     return 'Desconocida'
 # --- FIN CORRECCIÓN 1 ---
 
+def _ejecutar_shard(tarea) -> pd.DataFrame:
+    """Corre en un proceso del pool: aplica una etapa a las checadas de un grupo de empleados."""
+    meta, metodo, codigos_shard, permisos_dict, start_date, end_date = tarea
+    try:
+        checadas_shard = leer_dataframe(meta, 'employee', codigos_shard)
+        if 'dia' in checadas_shard.columns:
+            checadas_shard['checado_time'] = checadas_shard['time'].dt.time
+        return getattr(AttendanceProcessor(), metodo)(checadas_shard, permisos_dict, start_date, end_date, codigos_shard)
+    finally:
+        # El proceso vive entre reportes: se descartan conexiones vencidas o rotas
+        close_old_connections()
+
 #Reporte de Horas y Lista de Asistencias
 class AttendanceProcessor:
-    
-    def process_checkins_to_dataframe(self, checkin_data, start_date, end_date, employee_codes=None):
+
+    @staticmethod
+    def _numero_procesos(employee_codes) -> int:
+        """Procesos a usar según el número de empleados (1 = sin repartir)."""
+        if employee_codes is None or len(employee_codes) < settings.REPORTE_EMPLEADOS_MIN_PROCESOS:
+            return 1
+        return max(1, min(settings.REPORTE_PROCESOS, len(employee_codes)))
+
+    def _en_procesos(self, metodo: str, procesos: int, checkin_data, permisos_dict, start_date, end_date, employee_codes) -> pd.DataFrame:
+        """
+        Reparte los empleados en grupos contiguos y corre 'metodo' de cada grupo en el
+        pool de procesos del worker (ver procesos_reporte). Los empleados son
+        independientes entre sí, así que concatenar los grupos en orden da el mismo
+        resultado que procesarlos juntos. Las checadas viajan en memoria compartida.
+        """
+        checadas = self.preparar_checadas(checkin_data)
+        shards = [s.tolist() for s in np.array_split(np.asarray(employee_codes, dtype='int64'), procesos)]
+        # checado_time (objetos time por fila) se reconstruye en el hijo a partir de 'time'
+        bloque, meta = exportar_dataframe(checadas.drop(columns=['checado_time'], errors='ignore'))
+        try:
+            partes = ejecutar_en_pool(
+                _ejecutar_shard,
+                [(meta, metodo, shard, permisos_dict, start_date, end_date) for shard in shards],
+                settings.REPORTE_PROCESOS,
+            )
+        finally:
+            bloque.close()
+            bloque.unlink()
+        partes = [parte for parte in partes if not parte.empty]
+        return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+
+    def preparar_checadas(self, checkin_data) -> pd.DataFrame:
+        """
+        Convierte las checadas crudas de la API en un DataFrame con la llave canónica
+        `employee` (int64). La conversión se hace una sola vez aquí; el resto del
+        pipeline hace merges/groupby sobre enteros y solo se generan strings al
+        serializar la respuesta.
+        """
+        if isinstance(checkin_data, pd.DataFrame) and 'dia' in checkin_data.columns:
+            return checkin_data  # Ya preparadas (p. ej. el grupo de un proceso hijo)
         df = pd.DataFrame(checkin_data) if checkin_data else pd.DataFrame(columns=['employee', 'time', 'device_id'])
-        
+        if 'employee' not in df.columns: df['employee'] = None
+        if 'device_id' not in df.columns: df['device_id'] = None
+
+        df['employee'] = normalizar_codigos_empleado(df['employee'])
+        df = df[df['employee'].notna()].copy()
+        df['employee'] = df['employee'].astype('int64')
+
         if 'time' in df.columns and not df.empty:
             df["time"] = pd.to_datetime(df["time"])
-            df["dia"] = df["time"].dt.date
+            # 'dia' es datetime64 (hora local a medianoche) para cruzar con la malla empleado × día
+            hora_local = df["time"].dt.tz_localize(None) if df["time"].dt.tz is not None else df["time"]
+            df["dia"] = hora_local.dt.normalize()
             df["checado_time"] = df["time"].dt.time
-            
-            if 'device_id' not in df.columns: df['device_id'] = None
-            df['Sucursal'] = df['device_id'].apply(map_device_to_sucursal)
-        else:
-            if 'device_id' not in df.columns: df['device_id'] = None
-            if 'Sucursal' not in df.columns: df['Sucursal'] = None
+            # Se mapea cada dispositivo distinto una sola vez (no por fila)
+            codigos, dispositivos = pd.factorize(df['device_id'])
+            nombres = np.array([map_device_to_sucursal(d) for d in dispositivos] + [map_device_to_sucursal(None)], dtype=object)
+            df['Sucursal'] = nombres[codigos]
+        elif 'Sucursal' not in df.columns:
+            df['Sucursal'] = None
+        return df
+
+    def process_checkins_to_dataframe(self, checkin_data, start_date, end_date, employee_codes=None):
+        df = checkin_data if isinstance(checkin_data, pd.DataFrame) else self.preparar_checadas(checkin_data)
 
-        all_employees = employee_codes if employee_codes else (df["employee"].unique() if not df.empty else [])
-        if not all_employees: return pd.DataFrame()
+        if employee_codes is not None and len(employee_codes) > 0:
+            all_employees = np.asarray(employee_codes, dtype='int64')
+        else:
+            all_employees = df["employee"].unique() if not df.empty else np.array([], dtype='int64')
+        if len(all_employees) == 0: return pd.DataFrame()
 
-        all_dates = pd.date_range(start=start_date, end=end_date, freq='D').date
-        base_df = pd.DataFrame(list(product(all_employees, all_dates)), columns=['employee', 'dia'])
+        base_df = self.construir_malla_empleado_dia(all_employees, start_date, end_date)
 
-        if not df.empty:
+        if not df.empty and 'time' in df.columns:
             stats = df.groupby(["employee", "dia"]).agg(
                 checado_primero=('checado_time', 'min'), checado_ultimo=('checado_time', 'max'),
                 checados_count=('time', 'count'), Sucursal=('Sucursal', 'first'), device_id=('device_id', 'first') 
@@ -355,61 +424,61 @@ class AttendanceProcessor:
         final_df['Sucursal'] = final_df.groupby('employee')['Sucursal'].ffill().bfill()
         final_df['Sucursal'] = final_df['Sucursal'].fillna('Sin Asignar')
 
-        # CRUCIAL: Solo mapear empleados ACTIVOS para los reportes
-        empleados_activos_qs = Empleado.objects.filter(codigo_frappe__in=all_employees)
-        emp_map = {str(e.codigo_frappe): f"{e.nombre} {e.apellido_paterno}" for e in empleados_activos_qs}
-        
-        final_df['Nombre'] = final_df['employee'].map(emp_map).fillna(final_df['employee'])
+        # CRUCIAL: Solo mapear empleados ACTIVOS para los reportes (llave entera, sin str())
+        empleados_activos_qs = Empleado.objects.filter(codigo_frappe__in=all_employees.tolist()).values_list(
+            'codigo_frappe', 'nombre', 'apellido_paterno')
+        emp_map = {codigo: f"{nombre} {apellido}" for codigo, nombre, apellido in empleados_activos_qs}
         
-        final_df["dia_obj"] = pd.to_datetime(final_df["dia"])
-        final_df["dia_semana"] = final_df["dia_obj"].dt.day_name()
+        final_df['Nombre'] = final_df['employee'].map(emp_map).fillna(final_df['employee'].astype(str))
         return final_df
 
+    @staticmethod
+    def construir_malla_empleado_dia(empleados, start_date, end_date) -> pd.DataFrame:
+        """
+        Construye la malla base empleado × día con arreglos NumPy (repeat/tile), sin
+        tuplas ni objetos Python por celda. Incluye el día de la semana como entero
+        (0 = Lunes) y la bandera de quincena de cada fecha.
+        """
+        empleados = np.asarray(empleados, dtype='int64')
+        fechas = pd.date_range(start=start_date, end=end_date, freq='D')
+        n_empleados, n_dias = len(empleados), len(fechas)
+
+        return pd.DataFrame({
+            'employee': np.repeat(empleados, n_dias),
+            'dia': np.tile(fechas.values, n_empleados),
+            'dia_semana_num': np.tile(fechas.weekday.values.astype('int8'), n_empleados),
+            'es_primera_quincena': np.tile(fechas.day.values <= 15, n_empleados),
+        })
+
 
     def analizar_asistencia_con_horarios(self, df: pd.DataFrame, start_date_str: str, end_date_str: str) -> pd.DataFrame:
         if df.empty: return df
-        
-        for col in ["horas_esperadas", "horario_entrada", "horario_salida"]:
-            if 'horas' in col: df[col] = pd.Timedelta(0)
-            else: df[col] = None
 
-        employees_to_fetch = df["employee"].unique()
-        if len(employees_to_fetch) == 0: return df
-        
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-        
-        try:
-             # Llama a tu función de conexión a la DB
-             horarios_periodo = {e: obtener_horario_empleado_completo(e, start_date.strftime('%Y-%m-%d')) for e in employees_to_fetch}
-        except NameError:
-             # Si el import de db_postgres_connection falla, usa un diccionario vacío
-             horarios_periodo = {}
-        
-        for idx, row in df.iterrows():
-            horario_emp = horarios_periodo.get(row['employee'])
-            if not horario_emp or horario_emp.get('dias_con_horario', 0) == 0: continue
-            
-            dia_nombre = DIAS_ESPANOL.get(row['dia_semana'], "")
-            dia_horario = horario_emp.get('horarios_detallados', {}).get(dia_nombre, {})
-            
-            if dia_horario.get('tiene_horario'):
-                horas_dia = dia_horario.get('horas_totales', 0)
-                df.at[idx, 'horas_esperadas'] = timedelta(hours=horas_dia)
-                df.at[idx, 'horario_entrada'] = dia_horario.get('entrada')
-                df.at[idx, 'horario_salida'] = dia_horario.get('salida')
+        # El horario se resuelve por fecha (quincena real de cada día) desde el calendario materializado
+        calendario = obtener_calendario_horarios(df["employee"].unique(), start_date_str, end_date_str)
+
+        df = df.drop(columns=["horas_esperadas", "horario_entrada", "horario_salida"], errors='ignore')
+        calendario = calendario.astype({'employee': 'int64', 'dia': 'datetime64[ns]'})
+        df = df.merge(calendario, on=['employee', 'dia'], how='left')
+        df['horas_esperadas'] = pd.to_timedelta(df['horas_esperadas']).fillna(pd.Timedelta(0))
+        for col in ["horario_entrada", "horario_salida"]:
+            df[col] = df[col].astype(object).where(df[col].notna(), None)
         return df
 
     def aplicar_permisos_detallados(self, df: pd.DataFrame, permisos_dict: dict) -> pd.DataFrame:
         df['horas_permiso'] = pd.Timedelta(0); df['tiene_permiso'] = False
         if df.empty or not permisos_dict: return df
-        for emp_code, permisos in permisos_dict.items():
-            for fecha, info in permisos.items():
-                mask = (df['employee'] == str(emp_code)) & (df['dia'] == pd.to_datetime(fecha).date())
-                if mask.any():
-                    idx = df[mask].index[0]
-                    df.loc[idx, 'tiene_permiso'] = True
-                    descuento = df.loc[idx, 'horas_esperadas'] / 2 if info.get('is_half_day', False) else df.loc[idx, 'horas_esperadas']
-                    df.loc[idx, 'horas_permiso'] = descuento
+
+        # Se aplanan los permisos a un DataFrame y se cruzan con un solo merge por llave entera
+        df_permisos = permisos_por_dia(permisos_dict)
+
+        cruce = df[['employee', 'dia']].merge(df_permisos, on=['employee', 'dia'], how='left')
+        con_permiso = pd.Series(cruce['medio_dia'].notna().to_numpy(), index=df.index)
+        medio_dia = pd.Series(cruce['medio_dia'].eq(True).to_numpy(), index=df.index)
+
+        df['tiene_permiso'] = con_permiso
+        df['horas_permiso'] = df['horas_esperadas'].where(con_permiso, pd.Timedelta(0))
+        df['horas_permiso'] = df['horas_permiso'].mask(medio_dia, df['horas_esperadas'] / 2)
         return df
 
     def analizar_incidencias(self, df: pd.DataFrame) -> pd.DataFrame:
@@ -432,7 +501,10 @@ class AttendanceProcessor:
 
     def calcular_resumen_final(self, df: pd.DataFrame) -> pd.DataFrame:
         if df.empty: return pd.DataFrame()
-        
+        return self.formatear_resumen(self.sumar_resumen(df))
+
+    def sumar_resumen(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Contadores aditivos (timedelta y conteos) por (employee, Sucursal) del detalle analizado."""
         df['horas_esperadas_netas'] = df['horas_esperadas'] - df.get('horas_permiso', pd.Timedelta(0))
         df['falta_justificada'] = df.apply(lambda x: 1 if x['tiene_permiso'] and x['horas_permiso'] == x['horas_esperadas'] else 0, axis=1)
         df['episodio_ausencia_diario'] = df['falta'] 
@@ -443,14 +515,23 @@ class AttendanceProcessor:
             'falta_justificada': 'sum', 'episodio_ausencia_diario': 'sum',
         }
         
-        df_resumen = df.groupby(['employee', 'Sucursal']).agg(agg_dict).reset_index().rename(columns={
+        return df.groupby(['employee', 'Sucursal']).agg(agg_dict).reset_index().rename(columns={
             'duration': 'total_horas_trabajadas_td', 'horas_esperadas': 'total_horas_esperadas_td',
             'horas_permiso': 'total_horas_descontadas_permiso_td', 'horas_descanso': 'total_horas_descanso_td',
             'falta': 'faltas_del_periodo', 'retardo': 'total_retardos', 
             'salida_anticipada': 'total_salidas_anticipadas', 'falta_justificada': 'faltas_justificadas', 
             'episodio_ausencia_diario': 'episodios_ausencia',
         })
-        
+
+    @staticmethod
+    def combinar_resumenes(parciales: List[pd.DataFrame]) -> pd.DataFrame:
+        """Suma los resultados de sumar_resumen de varias ventanas de fechas."""
+        df = pd.concat(parciales, ignore_index=True)
+        agg_dict = {col: 'sum' for col in df.columns if col not in ('employee', 'Sucursal', 'Nombre')}
+        return df.groupby(['employee', 'Sucursal']).agg({'Nombre': 'first', **agg_dict}).reset_index()
+
+    def formatear_resumen(self, df_resumen: pd.DataFrame) -> pd.DataFrame:
+        """Columnas derivadas y de texto del resumen a partir de los contadores sumados."""
         df_resumen['total_horas_td'] = df_resumen['total_horas_esperadas_td'] - df_resumen['total_horas_descontadas_permiso_td']
         df_resumen['diferencia_td'] = df_resumen['total_horas_trabajadas_td'] - df_resumen['total_horas_td']
         
@@ -489,14 +570,19 @@ class AttendanceProcessor:
             descansos_calculados.append({'employee': empleado, 'dia': dia, 'horas_descanso': total_descanso_dia})
         return pd.DataFrame(descansos_calculados)
 
-    def procesar_reporte_completo(self, checkin_data, permisos_dict, start_date, end_date, employee_codes=None):
-        df_checadas_original = pd.DataFrame(checkin_data) if checkin_data else pd.DataFrame()
-        if not df_checadas_original.empty and 'time' in df_checadas_original.columns:
-            df_checadas_original['time'] = pd.to_datetime(df_checadas_original['time'])
-            df_checadas_original['dia'] = df_checadas_original['time'].dt.date
+    def analizar_periodo(self, checkin_data, permisos_dict, start_date, end_date, employee_codes=None) -> pd.DataFrame:
+        """Detalle empleado × día con horario, permisos, descansos e incidencias."""
+        procesos = self._numero_procesos(employee_codes)
+        if procesos > 1:
+            return self._en_procesos('_analizar_periodo', procesos, checkin_data, permisos_dict,
+                                     start_date, end_date, employee_codes)
+        return self._analizar_periodo(checkin_data, permisos_dict, start_date, end_date, employee_codes)
 
-        df_detalle = self.process_checkins_to_dataframe(checkin_data, start_date, end_date, employee_codes)
-        if df_detalle.empty: return pd.DataFrame(), pd.DataFrame()
+    def _analizar_periodo(self, checkin_data, permisos_dict, start_date, end_date, employee_codes=None) -> pd.DataFrame:
+        df_checadas_original = self.preparar_checadas(checkin_data)
+
+        df_detalle = self.process_checkins_to_dataframe(df_checadas_original, start_date, end_date, employee_codes)
+        if df_detalle.empty: return pd.DataFrame()
         
         df_detalle = self.analizar_asistencia_con_horarios(df_detalle, start_date, end_date)
         df_detalle = self.aplicar_permisos_detallados(df_detalle, permisos_dict)
@@ -504,31 +590,42 @@ class AttendanceProcessor:
         df_descansos = self.calcular_descanso_real_detallado(df_checadas_original)
         
         if not df_descansos.empty:
-            df_descansos['dia'] = pd.to_datetime(df_descansos['dia']).dt.date
+            df_descansos['dia'] = pd.to_datetime(df_descansos['dia'])
             df_detalle = pd.merge(df_detalle, df_descansos, on=['employee', 'dia'], how='left')
             df_detalle['horas_descanso'] = df_detalle['horas_descanso'].fillna(pd.Timedelta(0))
         else:
             df_detalle['horas_descanso'] = pd.Timedelta(0)
 
-        df_detalle = self.analizar_incidencias(df_detalle)
+        return self.analizar_incidencias(df_detalle)
+
+    def procesar_reporte_completo(self, checkin_data, permisos_dict, start_date, end_date, employee_codes=None):
+        df_detalle = self.analizar_periodo(checkin_data, permisos_dict, start_date, end_date, employee_codes)
+        if df_detalle.empty: return pd.DataFrame(), pd.DataFrame()
+
         df_resumen = self.calcular_resumen_final(df_detalle)
         
         return df_detalle, df_resumen
 
     def pivot_checkins(self, df_checadas: pd.DataFrame) -> pd.DataFrame:
+        """
+        Checadas de cada (employee, dia) en columnas checado_1..checado_N por orden de
+        hora: rango dentro del día y set_index().unstack(), sin pasar por groupby-agg.
+        Se limita a MAX_CHECADAS_DETALLE columnas para acotar el ancho del detalle.
+        """
         if df_checadas.empty or 'time' not in df_checadas.columns: return pd.DataFrame()
-        
-        df = df_checadas.copy()
-        df['checado_time'] = pd.to_datetime(df['time']).dt.time
-        df = df.sort_values(['employee', 'time'])
-        df['checkin_rank'] = df.groupby(['employee', 'dia']).cumcount() + 1
-        
-        df_pivoted = df.pivot_table(index=['employee', 'dia'], columns='checkin_rank', values='checado_time', aggfunc='first').reset_index()
-        
-        max_checkins = max([col for col in df_pivoted.columns if isinstance(col, int)], default=0)
-        rename_dict = {i: f'checado_{i}' for i in range(1, max_checkins + 1)}
-        df_pivoted.rename(columns=rename_dict, inplace=True)
-        return df_pivoted
+
+        # Sin hora o sin día la checada no tiene lugar en la tabla (y su rango sería NaN)
+        df_checadas = df_checadas.dropna(subset=['employee', 'dia', 'time'])
+        if df_checadas.empty: return pd.DataFrame()
+
+        df = df_checadas[['employee', 'dia']].assign(checado_time=pd.to_datetime(df_checadas['time']).dt.time)
+        rango = df_checadas.groupby(['employee', 'dia'])['time'].rank(method='first').astype('int64')
+        visibles = (rango <= MAX_CHECADAS_DETALLE).to_numpy()
+
+        df_pivoted = (df[visibles].set_index(['employee', 'dia', rango[visibles].rename('checkin_rank')])['checado_time']
+                      .unstack().rename(columns=lambda i: f'checado_{i}'))
+        df_pivoted.columns.name = None
+        return df_pivoted.reset_index()
 
     def determinar_observaciones(self, df: pd.DataFrame) -> pd.DataFrame:
         df_copy = df.copy()
@@ -549,12 +646,18 @@ class AttendanceProcessor:
         return df_copy
     
     def procesar_reporte_detalle(self, checkin_data, permisos_dict, start_date, end_date, employee_codes=None):
-        df_checadas_original = pd.DataFrame(checkin_data) if checkin_data else pd.DataFrame(columns=['employee', 'time'])
-        if not df_checadas_original.empty and 'time' in df_checadas_original.columns:
-            df_checadas_original['time'] = pd.to_datetime(df_checadas_original['time'])
-            df_checadas_original['dia'] = df_checadas_original['time'].dt.date
-
-        df_detalle = self.process_checkins_to_dataframe(checkin_data, start_date, end_date, employee_codes)
+        procesos = self._numero_procesos(employee_codes)
+        if procesos > 1:
+            df_detalle = self._en_procesos('_procesar_reporte_detalle', procesos, checkin_data, permisos_dict,
+                                           start_date, end_date, employee_codes)
+            # Cada grupo trae sus propias columnas checado_N: las que no tenía quedan en '-'
+            return df_detalle.fillna('-')
+        return self._procesar_reporte_detalle(checkin_data, permisos_dict, start_date, end_date, employee_codes)
+
+    def _procesar_reporte_detalle(self, checkin_data, permisos_dict, start_date, end_date, employee_codes=None):
+        df_checadas_original = self.preparar_checadas(checkin_data)
+
+        df_detalle = self.process_checkins_to_dataframe(df_checadas_original, start_date, end_date, employee_codes)
         if df_detalle.empty: return pd.DataFrame()
 
         df_detalle = self.analizar_asistencia_con_horarios(df_detalle, start_date, end_date)
@@ -564,9 +667,10 @@ class AttendanceProcessor:
         df_pivoted = self.pivot_checkins(df_checadas_original)
 
         if not df_pivoted.empty:
-            df_pivoted['employee'] = df_pivoted['employee'].astype(str)
-            df_pivoted['dia'] = pd.to_datetime(df_pivoted['dia']).dt.date
+            df_pivoted['dia'] = pd.to_datetime(df_pivoted['dia'])
             df_detalle = pd.merge(df_detalle, df_pivoted, on=['employee', 'dia'], how='left')
+        # Resumen de las checadas que no caben en las columnas checado_N
+        df_detalle['checados_extra'] = (df_detalle['checados_count'] - MAX_CHECADAS_DETALLE).clip(lower=0)
 
         df_detalle = self.determinar_observaciones(df_detalle)
 
@@ -577,20 +681,107 @@ class AttendanceProcessor:
             if col.startswith('checado_') or col.startswith('horario_'):
                 df_detalle[col] = df_detalle[col].apply(lambda x: x.strftime('%H:%M:%S') if pd.notna(x) and not isinstance(x, str) else x)
 
-        df_detalle['dia_semana'] = df_detalle['dia_semana'].map(DIAS_ESPANOL).fillna(df_detalle['dia_semana'])
-        df_detalle['dia'] = df_detalle['dia'].astype(str)
+        # Las etiquetas de texto solo se generan aquí, al serializar la salida
+        df_detalle['dia_semana'] = np.array(DIAS_SEMANA_ES, dtype=object)[df_detalle['dia_semana_num'].to_numpy()]
+        df_detalle['dia'] = df_detalle['dia'].dt.strftime('%Y-%m-%d')
+        df_detalle['employee'] = df_detalle['employee'].astype(str)
         df_detalle.fillna('-', inplace=True)
         return df_detalle
 
 # --- FUNCIONES PARA GRÁFICA GENERAL (USAN PANDAS) ---
 
-def calcular_metricas_adicionales(df_resumen: pd.DataFrame, df_detalle: pd.DataFrame) -> pd.DataFrame:
+def contadores_diarios(df_detalle: pd.DataFrame) -> pd.DataFrame:
+    """
+    Contadores aditivos por (employee, Sucursal, dia) a partir del detalle ya
+    analizado; es la unidad que se guarda en los rollups de asistencia.
+    """
+    laborable = df_detalle['horas_esperadas'].dt.total_seconds() > 0
+    tiene_permiso = df_detalle['tiene_permiso'].astype(bool)
+
+    def segundos(col):
+        return df_detalle[col].dt.total_seconds().round().astype('int64')
+
+    return pd.DataFrame({
+        'employee': df_detalle['employee'], 'Sucursal': df_detalle['Sucursal'], 'dia': df_detalle['dia'],
+        'segundos_trabajados': segundos('duration'),
+        'segundos_esperados': segundos('horas_esperadas'),
+        'segundos_permiso': segundos('horas_permiso'),
+        'dias_laborables': laborable.astype(int),
+        'asistencias': (laborable & (df_detalle['checados_count'] > 0) & ~tiene_permiso).astype(int),
+        'permisos': tiene_permiso.astype(int),
+        'faltas': df_detalle['falta'].astype(int),
+        'faltas_justificadas': (tiene_permiso & (df_detalle['horas_permiso'] == df_detalle['horas_esperadas'])).astype(int),
+        'retardos': df_detalle['retardo'].astype(int),
+        'salidas_anticipadas': df_detalle['salida_anticipada'].astype(int),
+    })
+
+
+def _porcentaje_seguro(numerador, denominador, por_defecto: float) -> np.ndarray:
+    """(numerador / denominador) * 100 donde el denominador es > 0; 'por_defecto' en el resto."""
+    numerador = np.asarray(numerador, dtype=float)
+    denominador = np.asarray(denominador, dtype=float)
+    valido = denominador > 0
+    cociente = np.divide(numerador, denominador, out=np.zeros_like(numerador), where=valido)
+    return np.where(valido, cociente * 100, por_defecto)
+
+
+def calcular_kpis(df_resumen: pd.DataFrame, df_detalle: pd.DataFrame = None, por=('employee',)) -> pd.DataFrame:
+    """
+    Motor único de KPIs. Suma los contadores aditivos del resumen en una sola pasada
+    groupby por las llaves 'por' (empleado, o empleado + sucursal) y deriva los KPIs
+    sobre arreglos con división segura:
+
+    - Eficiencia Horas (%): horas trabajadas / horas netas esperadas (100 si no hay esperadas)
+    - Índice Puntualidad (%): (días laborables - retardos) / días laborables
+    - SIC: (días laborables - faltas - retardos - salidas anticipadas) / días laborables
+    - Tasa Ausentismo (%): faltas / días laborables (0 si no hay días laborables)
+
+    Los días laborables se cuentan en df_detalle, o se suman de la columna
+    'dias_laborables' cuando el resumen viene de los rollups (sin detalle).
+    """
+    por = list(por)
+    kpis = df_resumen.groupby(por).agg(
+        Nombre=('Nombre', 'first'),
+        total_horas_trabajadas_td=('total_horas_trabajadas_td', 'sum'),
+        total_horas_esperadas_td=('total_horas_esperadas_td', 'sum'),
+        total_horas_td=('total_horas_td', 'sum'),
+        total_retardos=('total_retardos', 'sum'),
+        faltas_del_periodo=('faltas_del_periodo', 'sum'),
+        total_salidas_anticipadas=('total_salidas_anticipadas', 'sum'),
+        faltas_justificadas=('faltas_justificadas', 'sum'),
+    )
+    if df_detalle is None:
+        dias_laborables = df_resumen.groupby(por)['dias_laborables'].sum()
+    else:
+        dias_laborables = df_detalle[df_detalle['horas_esperadas'].dt.total_seconds() > 0].groupby(por).size()
+    kpis['dias_laborables'] = dias_laborables.reindex(kpis.index, fill_value=0).astype(int)
+
+    dias = kpis['dias_laborables'].to_numpy(dtype=float)
+    faltas = kpis['faltas_del_periodo'].to_numpy(dtype=float)
+    retardos = kpis['total_retardos'].to_numpy(dtype=float)
+    salidas = kpis['total_salidas_anticipadas'].to_numpy(dtype=float)
+
+    kpis['diferencia_td'] = kpis['total_horas_trabajadas_td'] - kpis['total_horas_td']
+    kpis['Eficiencia Horas (%)'] = _porcentaje_seguro(
+        kpis['total_horas_trabajadas_td'].dt.total_seconds(), kpis['total_horas_td'].dt.total_seconds(), 100.0)
+    kpis['Índice Puntualidad (%)'] = _porcentaje_seguro(np.clip(dias - retardos, 0, None), dias, 100.0)
+    kpis['SIC'] = _porcentaje_seguro(np.clip(dias - (faltas + retardos + salidas), 0, None), dias, 100.0)
+    kpis['Tasa Ausentismo (%)'] = _porcentaje_seguro(faltas, dias, 0.0)
+
+    return kpis.reset_index()
+
+
+def calcular_metricas_adicionales(df_resumen: pd.DataFrame, df_detalle: pd.DataFrame = None) -> pd.DataFrame:
     columnas_finales = ['ID', 'Nombre', 'Faltas', 'Puntualidad (%)', 'Eficiencia (%)',
                         'SIC', 'Sucursal', 'dias_laborables', 'Tasa Ausentismo (%)', 'Índice Puntualidad (%)', 'Eficiencia Horas (%)',
                         'Faltas Justificadas'] 
     df_resumen_final_vacio = pd.DataFrame(columns=columnas_finales)
 
-    if df_resumen is None or df_detalle is None or df_resumen.empty or df_detalle.empty: return df_resumen_final_vacio
+    if df_resumen is None or df_resumen.empty: return df_resumen_final_vacio
+    # Sin detalle (resumen desde rollups) los días laborables ya vienen en el resumen
+    if df_detalle is None:
+        if 'dias_laborables' not in df_resumen.columns: return df_resumen_final_vacio
+    elif df_detalle.empty: return df_resumen_final_vacio
 
     required_cols_resumen = ['employee', 'total_horas_trabajadas_td', 'total_horas_td',
                              'total_retardos', 'faltas_del_periodo', 'episodios_ausencia',
@@ -599,96 +790,24 @@ def calcular_metricas_adicionales(df_resumen: pd.DataFrame, df_detalle: pd.DataF
     required_cols_detalle = ['employee', 'horas_esperadas', 'Sucursal'] 
     
     missing_resumen_cols = [col for col in required_cols_resumen if col not in df_resumen.columns]
-    missing_detalle_cols = [col for col in required_cols_detalle if col not in df_detalle.columns]
+    missing_detalle_cols = [col for col in required_cols_detalle if df_detalle is not None and col not in df_detalle.columns]
 
     if missing_resumen_cols or missing_detalle_cols: return df_resumen_final_vacio
-    
-    df_resumen_calc = df_resumen.copy(); df_detalle_calc = df_detalle.copy()
-
-    df_resumen_calc['total_horas_trabajadas_td'] = pd.to_timedelta(df_resumen_calc['total_horas_trabajadas_td'], errors='coerce').fillna(pd.Timedelta(0))
-    df_resumen_calc['total_horas_td'] = pd.to_timedelta(df_resumen_calc['total_horas_td'], errors='coerce').fillna(pd.Timedelta(0))
-    df_resumen_calc['total_retardos'] = pd.to_numeric(df_resumen_calc['total_retardos'], errors='coerce').fillna(0)
-    df_resumen_calc['faltas_del_periodo'] = pd.to_numeric(df_resumen_calc['faltas_del_periodo'], errors='coerce').fillna(0)
-    df_resumen_calc['total_salidas_anticipadas'] = pd.to_numeric(df_resumen_calc['total_salidas_anticipadas'], errors='coerce').fillna(0)
-    df_resumen_calc['episodios_ausencia'] = pd.to_numeric(df_resumen_calc['episodios_ausencia'], errors='coerce').fillna(0)
-    
-    if not pd.api.types.is_timedelta64_dtype(df_detalle_calc['horas_esperadas']):
-        df_detalle_calc['horas_esperadas'] = pd.to_timedelta(df_detalle_calc['horas_esperadas'], errors='coerce').fillna(pd.Timedelta(0))
 
-    dias_laborables = df_detalle_calc[df_detalle_calc['horas_esperadas'].dt.total_seconds() > 0].groupby(['employee', 'Sucursal']).size()
-    dias_laborables.name = 'dias_laborables'
-    
-    df_resumen_calc['employee'] = df_resumen_calc['employee'].astype(str)
-    df_resumen_calc['Sucursal'] = df_resumen_calc['Sucursal'].astype(str)
-    dias_laborables.index = dias_laborables.index.set_levels([dias_laborables.index.levels[0].astype(str), dias_laborables.index.levels[1].astype(str)])
-
-    df_resumen_calc = df_resumen_calc.merge(dias_laborables, on=['employee', 'Sucursal'], how='left')
-
-    df_resumen_calc['dias_laborables'] = df_resumen_calc['dias_laborables'].fillna(0).astype(int)
-    mask_dlp = df_resumen_calc['dias_laborables'] > 0
-
-    total_horas_trabajadas_s = df_resumen_calc['total_horas_trabajadas_td'].dt.total_seconds()
-    total_horas_netas_s = df_resumen_calc['total_horas_td'].dt.total_seconds()
-    df_resumen_calc['efficiency'] = 100.0
-    mask_hnp = total_horas_netas_s > 0
-    if mask_hnp.any():
-        df_resumen_calc.loc[mask_hnp, 'efficiency'] = np.divide(
-            total_horas_trabajadas_s[mask_hnp], total_horas_netas_s[mask_hnp],
-            out=np.full_like(total_horas_trabajadas_s[mask_hnp], 100.0), where=total_horas_netas_s[mask_hnp]!=0
-        ) * 100
-    df_resumen_calc['efficiency'] = df_resumen_calc['efficiency'].fillna(100)
-
-    df_resumen_calc['punctuality'] = 100.0
-    if mask_dlp.any():
-        denom = df_resumen_calc.loc[mask_dlp, 'dias_laborables'].astype(float)
-        numer = denom - df_resumen_calc.loc[mask_dlp, 'total_retardos'].astype(float)
-        df_resumen_calc.loc[mask_dlp, 'punctuality'] = np.divide(numer.clip(lower=0), denom, out=np.full_like(numer, 100.0), where=denom!=0) * 100
-    df_resumen_calc['punctuality'] = df_resumen_calc['punctuality'].fillna(100).clip(0, 100)
-
-    df_resumen_calc['sic'] = 100.0
-    if mask_dlp.any():
-        denom = df_resumen_calc.loc[mask_dlp, 'dias_laborables'].astype(float)
-        faltas = df_resumen_calc.loc[mask_dlp, 'faltas_del_periodo']
-        retardos = df_resumen_calc.loc[mask_dlp, 'total_retardos']
-        salidas = df_resumen_calc.loc[mask_dlp, 'total_salidas_anticipadas']
-        
-        numer = denom - (faltas + retardos + salidas)
-        
-        df_resumen_calc.loc[mask_dlp, 'sic'] = np.divide(numer.clip(lower=0), denom, out=np.full_like(numer, 100.0), where=denom!=0) * 100
-    
-    df_resumen_calc['sic'] = df_resumen_calc['sic'].fillna(100).clip(0, 100)
-
-    df_resumen_calc['tasa_ausentismo'] = 0.0
-    if mask_dlp.any():
-        denom = df_resumen_calc.loc[mask_dlp, 'dias_laborables'].astype(float)
-        numer = df_resumen_calc.loc[mask_dlp, 'faltas_del_periodo'].astype(float)
-        df_resumen_calc.loc[mask_dlp, 'tasa_ausentismo'] = np.divide(numer, denom, out=np.zeros_like(numer), where=denom!=0) * 100
-    df_resumen_calc['tasa_ausentismo'] = df_resumen_calc['tasa_ausentismo'].fillna(0).clip(0, 100)
-    
-    df_resumen_calc['productivity'] = df_resumen_calc['efficiency']
-
-    for col in ['efficiency', 'punctuality', 'sic', 'productivity', 'tasa_ausentismo']:
-          if col in df_resumen_calc.columns: df_resumen_calc[col] = df_resumen_calc[col].round(1)
-
-    rename_map = {
-          'employee': 'ID', 'Nombre': 'Nombre', 'faltas_del_periodo': 'Faltas',
-          'tasa_ausentismo': 'Tasa Ausentismo (%)', 'punctuality': 'Puntualidad (%)', 
-          'efficiency': 'Eficiencia (%)', 'punctuality': 'Índice Puntualidad (%)',
-          'efficiency': 'Eficiencia Horas (%)', 'sic': 'SIC', 'Sucursal': 'Sucursal', 
-          'dias_laborables': 'dias_laborables', 'total_retardos': 'Retardos',
-          'faltas_justificadas': 'Faltas Justificadas',
-    }
-    
-    cols_to_rename = {k: v for k, v in rename_map.items() if k in df_resumen_calc.columns}
-    df_resumen_final = df_resumen_calc.rename(columns=cols_to_rename)
-    
-    for col in columnas_finales:
-        if col not in df_resumen_final.columns:
-            if col in ['Faltas', 'dias_laborables', 'Faltas Justificadas']: df_resumen_final[col] = 0
-            elif col in ['Puntualidad (%)', 'Eficiencia (%)', 'SIC', 'Tasa Ausentismo (%)', 'Índice Puntualidad (%)', 'Eficiencia Horas (%)']: df_resumen_final[col] = 0.0
-            else: df_resumen_final[col] = 'N/A'
+    # KPIs por empleado y sucursal con el mismo motor que las tablas por empleado
+    df_kpis = calcular_kpis(df_resumen, df_detalle, por=('employee', 'Sucursal'))
+
+    df_kpis['Eficiencia Horas (%)'] = df_kpis['Eficiencia Horas (%)'].round(1)
+    for col in ['Índice Puntualidad (%)', 'SIC', 'Tasa Ausentismo (%)']:
+        df_kpis[col] = df_kpis[col].clip(0, 100).round(1)
+
+    df_resumen_final = df_kpis.rename(columns={
+        'employee': 'ID', 'faltas_del_periodo': 'Faltas', 'faltas_justificadas': 'Faltas Justificadas',
+    })
+    df_resumen_final['Puntualidad (%)'] = 0.0
+    df_resumen_final['Eficiencia (%)'] = 0.0
 
-    return df_resumen_final[list(set(df_resumen_final.columns).intersection(set(columnas_finales)))]
+    return df_resumen_final[columnas_finales]
 
 
 def agregar_datos_dashboard_por_sucursal(df_metricas: pd.DataFrame) -> List[Dict]:
@@ -734,28 +853,312 @@ def actualizar_datos_basicos_empleado_service(empleado_id, data):
     return empleado
 
 def actualizar_horarios_empleado_service(empleado_id, data):
-    """Borra y recrea las asignaciones de horario para un empleado activo."""
+    """
+    Sincroniza las asignaciones de horario de un empleado activo con las del formulario:
+    solo inserta, actualiza o borra las filas que cambiaron, todo en una transacción.
+    """
     from django.core.exceptions import ValidationError
     
     try:
         empleado = get_object_or_404(Empleado.objects, pk=empleado_id) # Usa objects para buscar activo
 
-        AsignacionHorario.objects.filter(empleado=empleado).delete()
-        
         sucursales = data.getlist("sucursales[]"); horarios = data.getlist("horarios[]"); dias = data.getlist("dias[]")
-        if not sucursales: return empleado 
-
-        for sucursal_id, horario_id, dias_str in zip(sucursales, horarios, dias):
-            dias_list = dias_str.split(",")
-            for dia in dias_list:
-                horario_obj = Horario.objects.get(pk=int(horario_id))
-                AsignacionHorario.objects.create(
-                    empleado=empleado, sucursal_id=int(sucursal_id), horario=horario_obj,
-                    dia_especifico_id=int(dia), hora_entrada_especifica=horario_obj.hora_entrada,
-                    hora_salida_especifica=horario_obj.hora_salida,
-                    hora_salida_especifica_cruza_medianoche=horario_obj.cruza_medianoche,
-                )
+
+        with transaction.atomic():
+            deseadas = _construir_asignaciones(empleado, sucursales, horarios, dias)
+            _sincronizar_asignaciones(empleado, deseadas)
         return empleado
 
     except Exception as e:
-        raise ValidationError(f"Error al guardar horarios: {e}")
\ No newline at end of file
+        raise ValidationError(f"Error al guardar horarios: {e}")
+
+# Campos que definen el horario de una asignación por día específico
+CAMPOS_ASIGNACION = (
+    "horario", "tipo_turno", "es_primera_quincena", "hora_entrada_especifica",
+    "hora_salida_especifica", "hora_salida_especifica_cruza_medianoche",
+)
+
+def _construir_asignaciones(empleado, sucursales, horarios, dias) -> List[AsignacionHorario]:
+    """Arma en memoria las asignaciones por día del formulario con un solo in_bulk de Horario."""
+    horarios_por_id = Horario.objects.in_bulk({int(h) for h in horarios if h})
+    asignaciones = []
+    for sucursal_id, horario_id, dias_str in zip(sucursales, horarios, dias):
+        horario = horarios_por_id.get(int(horario_id)) if horario_id else None
+        if horario is None:
+            print(f"[ERROR] Horario con ID {horario_id} no existe, saltando asignación.")
+            continue
+        for dia in filter(None, dias_str.split(",")):
+            asignaciones.append(AsignacionHorario(
+                empleado=empleado,
+                sucursal_id=int(sucursal_id),
+                horario=horario,
+                dia_especifico_id=int(dia),
+                hora_entrada_especifica=horario.hora_entrada,
+                hora_salida_especifica=horario.hora_salida,
+                hora_salida_especifica_cruza_medianoche=horario.cruza_medianoche,
+            ))
+    return asignaciones
+
+def _sincronizar_asignaciones(empleado, deseadas: List[AsignacionHorario]) -> None:
+    """
+    Aplica la diferencia entre las asignaciones actuales y las deseadas, emparejando por
+    (sucursal, día): las iguales no se tocan, las que cambiaron se actualizan en bloque y
+    el resto se inserta o se borra. Debe llamarse dentro de transaction.atomic().
+    """
+    actuales = {}
+    for a in AsignacionHorario.objects.select_for_update().filter(empleado=empleado):
+        actuales.setdefault((a.sucursal_id, a.dia_especifico_id), []).append(a)
+
+    def valores(a):
+        return tuple(getattr(a, f"{campo}_id" if campo in ("horario", "tipo_turno") else campo) for campo in CAMPOS_ASIGNACION)
+
+    por_insertar, por_actualizar = [], []
+    for nueva in deseadas:
+        candidatas = actuales.get((nueva.sucursal_id, nueva.dia_especifico_id))
+        if not candidatas:
+            por_insertar.append(nueva)
+            continue
+        # Se prefiere la fila idéntica; si no, se reutiliza la primera y se actualiza
+        existente = next((a for a in candidatas if valores(a) == valores(nueva)), candidatas[0])
+        candidatas.remove(existente)
+        if valores(existente) != valores(nueva):
+            for campo in CAMPOS_ASIGNACION:
+                setattr(existente, campo, getattr(nueva, campo))
+            por_actualizar.append(existente)
+
+    por_borrar = [a.pk for restantes in actuales.values() for a in restantes]
+
+    if por_borrar:
+        AsignacionHorario.objects.filter(pk__in=por_borrar).delete()
+    if por_actualizar:
+        AsignacionHorario.objects.bulk_update(por_actualizar, list(CAMPOS_ASIGNACION))
+    if por_insertar:
+        AsignacionHorario.objects.bulk_create(por_insertar)
+    if por_borrar or por_actualizar or por_insertar:
+        # bulk_create/bulk_update no emiten señales: se programa el refresco una sola vez
+        programar_refresco_horarios([empleado.pk])
+# =================================================================
+# === IMPORTACIÓN MASIVA DE EMPLEADOS Y HORARIOS (XLSX / CSV) ===
+# =================================================================
+
+# Columnas esperadas; cada fila es un empleado + una asignación (sucursal, horario, días).
+# Un empleado con varias asignaciones se repite en varias filas con el mismo codigo_frappe.
+COLUMNAS_IMPORTACION = [
+    "codigo_frappe", "codigo_checador", "nombre", "apellido_paterno",
+    "apellido_materno", "email", "sucursal", "horario", "dias",
+]
+LOTE_IMPORTACION = 500
+MAX_SMALLINT = 32767
+
+def _leer_archivo_importacion(archivo, nombre_archivo: str) -> pd.DataFrame:
+    """Lee el xlsx/csv como texto, con encabezados normalizados a minúsculas."""
+    if nombre_archivo.lower().endswith(".csv"):
+        df = pd.read_csv(archivo, dtype=str, keep_default_na=False)
+    else:
+        df = pd.read_excel(archivo, dtype=str, keep_default_na=False)
+    df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
+    faltantes = [c for c in COLUMNAS_IMPORTACION if c not in df.columns and c not in ("apellido_materno", "email")]
+    if faltantes:
+        raise ValidationError(f"Faltan columnas en el archivo: {', '.join(faltantes)}")
+    for columna in COLUMNAS_IMPORTACION:
+        df[columna] = df[columna].astype(str).str.strip() if columna in df.columns else ""
+    return df
+
+def _dias_importacion(texto: str) -> List[int]:
+    """'1,2,3' (dia_id) o un código de turno ('L-V', 'X,J,V') -> lista de dia_id."""
+    texto = texto.replace(" ", "")
+    if texto and all(p.isdigit() for p in texto.split(",")):
+        dias = sorted({int(p) for p in texto.split(",")})
+        return dias if all(1 <= d <= 7 for d in dias) else []
+    mascara = calcular_mascara_dias(texto)
+    return [d for d in range(1, 8) if mascara & (1 << (d - 1))]
+
+def importar_empleados_service(archivo, nombre_archivo: str, simular: bool = False) -> Dict:
+    """
+    Importa empleados y sus asignaciones desde un xlsx/csv.
+
+    Las restricciones de unicidad (codigo_frappe, codigo_checador, email) se validan
+    contra la BD con una consulta por campo y dentro del propio archivo. Un empleado
+    con cualquier fila inválida no se importa; el resto se inserta con bulk_create por
+    lotes en una sola transacción. Con simular=True solo se valida.
+
+    Devuelve {"empleados_creados", "asignaciones_creadas", "errores": [{"fila", "errores"}]}.
+    """
+    df = _leer_archivo_importacion(archivo, nombre_archivo)
+    df["fila"] = df.index + 2  # Fila 1 = encabezados
+
+    # --- Catálogos y valores existentes (consultas por conjunto, no por fila) ---
+    sucursales = {n.casefold(): pk for pk, n in Sucursal.objects.values_list("sucursal_id", "nombre_sucursal")}
+    horarios = {}
+    for pk, desc, entrada, salida in Horario.objects.values_list("horario_id", "descripcion_horario", "hora_entrada", "hora_salida"):
+        horarios[str(pk)] = horarios[f"{entrada:%H:%M}-{salida:%H:%M}"] = pk
+        if desc: horarios[desc.casefold()] = pk
+
+    def existentes(campo, valores):
+        valores = [v for v in valores if v not in ("", None)]
+        return set(Empleado.all_objects.filter(**{f"{campo}__in": valores}).values_list(campo, flat=True))
+
+    codigos = pd.to_numeric(df["codigo_frappe"], errors="coerce")
+    checadores = pd.to_numeric(df["codigo_checador"], errors="coerce")
+    frappe_en_bd = existentes("codigo_frappe", codigos.dropna().astype(int).unique().tolist())
+    checador_en_bd = existentes("codigo_checador", checadores.dropna().astype(int).unique().tolist())
+    email_en_bd = {e.casefold() for e in existentes("email", df["email"].unique().tolist())}
+
+    # Un mismo checador/email no puede aparecer en dos empleados distintos del archivo
+    # (el checador se compara ya convertido a número: "0100" y "100" son el mismo)
+    por_empleado = df.assign(codigo=codigos, checador=checadores).drop_duplicates("codigo")
+    con_checador = por_empleado[por_empleado["checador"].notna()]
+    checador_repetido = set(con_checador.loc[con_checador.duplicated("checador", keep=False), "checador"])
+    con_email = por_empleado[por_empleado["email"] != ""]
+    email_repetido = set(con_email.loc[con_email["email"].str.casefold().duplicated(keep=False), "email"].str.casefold())
+
+    errores = []
+    empleados_validos = {}
+    empleados_invalidos = set()
+    for fila, codigo, checador in zip(df.to_dict("records"), codigos, checadores):
+        problemas = []
+        if pd.isna(codigo) or codigo % 1 or not 0 < codigo <= MAX_SMALLINT:
+            problemas.append("codigo_frappe inválido")
+        elif int(codigo) in frappe_en_bd:
+            problemas.append("codigo_frappe ya existe")
+        if pd.isna(checador) or checador % 1 or not 0 < checador <= MAX_SMALLINT:
+            problemas.append("codigo_checador inválido")
+        elif int(checador) in checador_en_bd:
+            problemas.append("codigo_checador ya existe")
+        elif checador in checador_repetido:
+            problemas.append("codigo_checador repetido en el archivo")
+        if fila["email"] and fila["email"].casefold() in email_en_bd:
+            problemas.append("email ya existe")
+        elif fila["email"] and fila["email"].casefold() in email_repetido:
+            problemas.append("email repetido en el archivo")
+        if not fila["nombre"] or not fila["apellido_paterno"]:
+            problemas.append("nombre y apellido_paterno son obligatorios")
+
+        sucursal_id = sucursales.get(fila["sucursal"].casefold())
+        horario_id = horarios.get(fila["horario"].casefold())
+        dias = _dias_importacion(fila["dias"])
+        if fila["sucursal"] or fila["horario"] or fila["dias"]:
+            if sucursal_id is None: problemas.append(f"sucursal '{fila['sucursal']}' no existe")
+            if horario_id is None: problemas.append(f"horario '{fila['horario']}' no existe")
+            if not dias: problemas.append(f"días '{fila['dias']}' inválidos")
+
+        if problemas:
+            errores.append({"fila": fila["fila"], "errores": problemas})
+            if not pd.isna(codigo): empleados_invalidos.add(int(codigo))
+            continue
+
+        codigo = int(codigo)
+        if codigo not in empleados_validos:
+            empleados_validos[codigo] = {"datos": fila, "asignaciones": []}
+        if sucursal_id is not None:
+            empleados_validos[codigo]["asignaciones"].append((sucursal_id, horario_id, dias))
+
+    # Un empleado con alguna fila inválida se descarta completo
+    for codigo in empleados_invalidos:
+        empleados_validos.pop(codigo, None)
+
+    if simular or not empleados_validos:
+        return {
+            "empleados_creados": len(empleados_validos),
+            "asignaciones_creadas": sum(len(d) for e in empleados_validos.values() for _, _, d in e["asignaciones"]),
+            "errores": errores,
+        }
+
+    with transaction.atomic():
+        empleados = Empleado.objects.bulk_create([
+            Empleado(
+                codigo_frappe=codigo,
+                codigo_checador=int(e["datos"]["codigo_checador"]),
+                nombre=e["datos"]["nombre"],
+                apellido_paterno=e["datos"]["apellido_paterno"],
+                apellido_materno=e["datos"]["apellido_materno"] or None,
+                email=e["datos"]["email"] or None,
+                tiene_horario_asignado=bool(e["asignaciones"]),
+            )
+            for codigo, e in empleados_validos.items()
+        ], batch_size=LOTE_IMPORTACION)
+
+        horarios_por_id = Horario.objects.in_bulk({h for e in empleados_validos.values() for _, h, _ in e["asignaciones"]})
+        asignaciones = []
+        for empleado in empleados:
+            for sucursal_id, horario_id, dias in empleados_validos[empleado.codigo_frappe]["asignaciones"]:
+                horario = horarios_por_id[horario_id]
+                asignaciones.extend(
+                    AsignacionHorario(
+                        empleado=empleado, sucursal_id=sucursal_id, horario=horario, dia_especifico_id=dia,
+                        hora_entrada_especifica=horario.hora_entrada,
+                        hora_salida_especifica=horario.hora_salida,
+                        hora_salida_especifica_cruza_medianoche=horario.cruza_medianoche,
+                    )
+                    for dia in dias
+                )
+        AsignacionHorario.objects.bulk_create(asignaciones, batch_size=LOTE_IMPORTACION * 2)
+        programar_refresco_horarios([e.pk for e in empleados])
+
+    print(f"[INFO] Importación: {len(empleados)} empleados, {len(asignaciones)} asignaciones, {len(errores)} filas con error")
+    return {"empleados_creados": len(empleados), "asignaciones_creadas": len(asignaciones), "errores": errores}
+
+# =================================================================
+# === REASIGNACIÓN MASIVA DE HORARIOS ===
+# =================================================================
+
+def reasignar_horarios_service(nuevo_horario_id, sucursal_id=None, horario_id=None, tipo_turno_id=None, aplicar: bool = False) -> Dict:
+    """
+    Cambia a `nuevo_horario_id` todas las asignaciones de empleados activos que
+    coinciden con los filtros (sucursal / horario / tipo de turno; al menos uno).
+
+    Sin aplicar=True solo devuelve la diferencia (simulación). Al aplicar se ejecuta
+    un único UPDATE y se programa un solo refresco de horarios para los afectados.
+    """
+    filtros = {k: v for k, v in (("sucursal_id", sucursal_id), ("horario_id", horario_id), ("tipo_turno_id", tipo_turno_id)) if v}
+    if not filtros:
+        raise ValidationError("Indica al menos un filtro: sucursal, horario o tipo de turno.")
+    try:
+        nuevo = Horario.objects.get(pk=nuevo_horario_id)
+    except Horario.DoesNotExist:
+        raise ValidationError("El horario nuevo no existe.")
+
+    asignaciones = AsignacionHorario.objects.filter(empleado__is_deleted=False, **filtros).exclude(
+        horario=nuevo, dia_especifico__isnull=True
+    ).exclude(
+        horario=nuevo, hora_entrada_especifica=nuevo.hora_entrada, hora_salida_especifica=nuevo.hora_salida,
+        hora_salida_especifica_cruza_medianoche=nuevo.cruza_medianoche,
+    )
+
+    cambios = list(asignaciones.order_by("empleado_id", "sucursal_id", "dia_especifico_id").values(
+        "asignacion_id", "empleado_id", "empleado__nombre", "empleado__apellido_paterno",
+        "sucursal__nombre_sucursal", "dia_especifico__nombre_dia", "tipo_turno__descripcion",
+        "horario__descripcion_horario",
+    ))
+    nuevo_texto = nuevo.descripcion_horario or f"{nuevo.hora_entrada:%H:%M}-{nuevo.hora_salida:%H:%M}"
+    diferencia = [{
+        "asignacion_id": c["asignacion_id"],
+        "empleado_id": c["empleado_id"],
+        "nombre": f"{c['empleado__nombre']} {c['empleado__apellido_paterno']}",
+        "sucursal": c["sucursal__nombre_sucursal"],
+        "dias": c["dia_especifico__nombre_dia"] or c["tipo_turno__descripcion"] or "General",
+        "horario_actual": c["horario__descripcion_horario"] or "—",
+        "horario_nuevo": nuevo_texto,
+    } for c in cambios]
+    empleados = sorted({c["empleado_id"] for c in cambios})
+
+    resultado = {"aplicado": False, "asignaciones": len(diferencia), "empleados": len(empleados), "cambios": diferencia}
+    if not aplicar or not cambios:
+        return resultado
+
+    with transaction.atomic():
+        # Un solo UPDATE; las asignaciones por día también llevan copia de las horas
+        es_especifica = Q(dia_especifico__isnull=False)
+        actualizadas = AsignacionHorario.objects.filter(pk__in=[c["asignacion_id"] for c in cambios]).update(
+            horario=nuevo,
+            hora_entrada_especifica=Case(When(es_especifica, then=Value(nuevo.hora_entrada)), default=F("hora_entrada_especifica")),
+            hora_salida_especifica=Case(When(es_especifica, then=Value(nuevo.hora_salida)), default=F("hora_salida_especifica")),
+            hora_salida_especifica_cruza_medianoche=Case(
+                When(es_especifica, then=Value(nuevo.cruza_medianoche)), default=F("hora_salida_especifica_cruza_medianoche")
+            ),
+        )
+        programar_refresco_horarios(empleados)
+
+    print(f"[INFO] Reasignación: {actualizadas} asignaciones de {len(empleados)} empleados -> {nuevo_texto}")
+    resultado.update(aplicado=True, asignaciones=actualizadas)
+    return resultado
@@ -0,0 +1,60 @@
+"""
+Señales que mantienen consistentes la vista materializada de horarios semanales
+y el calendario por fecha (CalendarioHorario) cuando cambian asignaciones,
+horarios o tipos de turno, y que invalidan los datos en caché.
+"""
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .cache_manager import invalidar, invalidar_catalogos, CLAVE_MAPA_ROLES
+
+from .models import AsignacionHorario, DiaSemana, Horario, Sucursal, TipoTurno
+from .db_postgres_connection import programar_refresco_horarios as _invalidar_al_confirmar
+
+
+@receiver([post_save, post_delete], sender=AsignacionHorario)
+def asignacion_modificada(sender, instance, **kwargs):
+    _invalidar_al_confirmar([instance.empleado_id])
+
+
+@receiver(post_save, sender=Horario)
+def horario_guardado(sender, instance, **kwargs):
+    empleados = list(instance.asignaciones.values_list('empleado_id', flat=True).distinct())
+    if empleados:
+        _invalidar_al_confirmar(empleados)
+
+
+@receiver(post_save, sender=TipoTurno)
+def tipo_turno_guardado(sender, instance, **kwargs):
+    empleados = list(instance.asignaciones.values_list('empleado_id', flat=True).distinct())
+    if empleados:
+        _invalidar_al_confirmar(empleados)
+
+
+@receiver(post_delete, sender=Horario)
+@receiver(post_delete, sender=TipoTurno)
+def catalogo_eliminado(sender, instance, **kwargs):
+    # Al borrar, las asignaciones ya quedaron en NULL (SET_NULL): se recalcula todo
+    _invalidar_al_confirmar()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=User)
+def roles_modificados(sender, **kwargs):
+    # Cambió la membresía (o el propio grupo): el mapa de roles en caché ya no es válido.
+    # En m2m_changed solo interesan las acciones post_add / post_remove / post_clear.
+    if kwargs.get('action', 'post_').startswith('post_'):
+        transaction.on_commit(lambda: invalidar(CLAVE_MAPA_ROLES))
+
+
+@receiver([post_save, post_delete], sender=DiaSemana)
+@receiver([post_save, post_delete], sender=Sucursal)
+@receiver([post_save, post_delete], sender=Horario)
+@receiver([post_save, post_delete], sender=TipoTurno)
+def catalogo_modificado(sender, **kwargs):
+    # Sube la versión en BD para que todos los workers recarguen su copia en memoria
+    transaction.on_commit(invalidar_catalogos)
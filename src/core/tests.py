@@ -1,3 +1,1258 @@
-from django.test import TestCase
+import asyncio
+import contextvars
+import io
+import json
+import os
+import threading
+import unittest
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, time
+from types import SimpleNamespace
+from unittest import mock
+
+import openpyxl
+import pandas as pd
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from . import api_client, cache_manager, db_postgres_connection, main, views
+from .api_client import APIClient, CircuitBreaker, ERPRequestError, ERPUnavailableError
+from .config import MAX_CHECADAS_DETALLE
+from .db_postgres_connection import (CONTADORES_ROLLUP, _periodos_rollup, guardar_rollups_asistencia,
+                                     invalidar_rollups_por_permisos, resumen_desde_rollups)
+from .main import ventanas_mensuales
+from .models import AsignacionHorario, CalendarioHorario, DiaSemana, Empleado, Horario, RollupAsistencia, Sucursal, calcular_mascara_dias
+from .procesos_reporte import exportar_dataframe, leer_dataframe
+from .services import (COLUMNAS_IMPORTACION, AttendanceProcessor, _construir_asignaciones, _sincronizar_asignaciones,
+                       calcular_kpis, listar_empleados, obtener_roles_service,
+                       importar_empleados_service, reasignar_horarios_service)
+from .utils import dataframe_to_json, normalizar_codigos_empleado, normalizar_texto_busqueda
+from .views import _lista_parametro, api_lista_horarios, api_lista_sucursales, exportar_lista_empleados_excel
+
+
+def _dias(mascara):
+    return [d for d in range(1, 8) if mascara & (1 << (d - 1))]
+
+
+class CalcularMascaraDiasTests(SimpleTestCase):
+    def test_rangos_conocidos(self):
+        self.assertEqual(_dias(calcular_mascara_dias("L-V")), [1, 2, 3, 4, 5])
+        self.assertEqual(_dias(calcular_mascara_dias("L-J")), [1, 2, 3, 4])
+        self.assertEqual(_dias(calcular_mascara_dias("m-v")), [2, 3, 4, 5])
+
+    def test_listas_de_letras(self):
+        self.assertEqual(_dias(calcular_mascara_dias("X,J,V")), [3, 4, 5])
+        self.assertEqual(_dias(calcular_mascara_dias("LXV")), [1, 3, 5])
+        self.assertEqual(_dias(calcular_mascara_dias(" s , d ")), [6, 7])
+
+    def test_otros_guiones_se_leen_por_letra(self):
+        # Igual que la vista materializada 0019: "L-S" no es un rango
+        self.assertEqual(_dias(calcular_mascara_dias("L-S")), [1, 6])
+
+    def test_vacio(self):
+        self.assertEqual(calcular_mascara_dias(""), 0)
+        self.assertEqual(calcular_mascara_dias(None), 0)
+
+
+class MallaEmpleadoDiaTests(SimpleTestCase):
+    def test_malla_empleado_por_dia(self):
+        malla = AttendanceProcessor.construir_malla_empleado_dia([7, 3], "2025-01-14", "2025-01-17")
+
+        self.assertEqual(len(malla), 8)
+        self.assertEqual(malla["employee"].tolist(), [7] * 4 + [3] * 4)
+        self.assertEqual(malla["dia"].dt.day.tolist(), [14, 15, 16, 17] * 2)
+        # 14/01/2025 es martes (0 = Lunes)
+        self.assertEqual(malla["dia_semana_num"].tolist(), [1, 2, 3, 4] * 2)
+        self.assertEqual(str(malla["dia_semana_num"].dtype), "int8")
+        self.assertEqual(malla["es_primera_quincena"].tolist(), [True, True, False, False] * 2)
+
+    def test_sin_empleados(self):
+        self.assertTrue(AttendanceProcessor.construir_malla_empleado_dia([], "2025-01-01", "2025-01-31").empty)
+
+
+class PeriodosRollupTests(SimpleTestCase):
+    def _periodo(self, fecha, nivel):
+        inicio, fin = _periodos_rollup(pd.Series(pd.to_datetime([fecha])))[nivel]
+        return inicio.iloc[0].date(), fin.iloc[0].date()
+
+    def test_semana_se_corta_en_la_quincena(self):
+        # La semana del lunes 13/01/2025 al domingo 19 cruza el día 15
+        self.assertEqual(self._periodo("2025-01-15", "semana"), (date(2025, 1, 13), date(2025, 1, 15)))
+        self.assertEqual(self._periodo("2025-01-16", "semana"), (date(2025, 1, 16), date(2025, 1, 19)))
+        self.assertEqual(self._periodo("2025-01-16", "quincena"), (date(2025, 1, 16), date(2025, 1, 31)))
+
+    def test_semana_se_corta_en_el_mes(self):
+        # La semana del 24/02/2025 termina el 02/03: se parte en el fin de mes
+        self.assertEqual(self._periodo("2025-02-28", "semana"), (date(2025, 2, 24), date(2025, 2, 28)))
+        self.assertEqual(self._periodo("2025-03-01", "semana"), (date(2025, 3, 1), date(2025, 3, 2)))
+        self.assertEqual(self._periodo("2025-02-28", "mes"), (date(2025, 2, 1), date(2025, 2, 28)))
+
+    def test_dia(self):
+        self.assertEqual(self._periodo("2025-01-16", "dia"), (date(2025, 1, 16), date(2025, 1, 16)))
+
+
+class VentanasMensualesTests(SimpleTestCase):
+    def test_recorta_los_extremos(self):
+        self.assertEqual(ventanas_mensuales("2025-01-20", "2025-03-05"), [
+            ("2025-01-20", "2025-01-31"), ("2025-02-01", "2025-02-28"), ("2025-03-01", "2025-03-05"),
+        ])
+
+    def test_un_solo_mes(self):
+        self.assertEqual(ventanas_mensuales("2024-02-01", "2024-02-29"), [("2024-02-01", "2024-02-29")])
+        self.assertEqual(ventanas_mensuales("2024-02-10", "2024-02-10"), [("2024-02-10", "2024-02-10")])
+
+
+def _contadores(codigo, inicio, fin, sucursal="Villas", **valores):
+    """Contadores diarios como los de services.contadores_diarios, iguales para todo el rango."""
+    dias = pd.date_range(inicio, fin, freq="D")
+    datos = {c: valores.get(c, 0) for c in CONTADORES_ROLLUP}
+    return pd.DataFrame({"employee": codigo, "Sucursal": sucursal, "dia": dias, **datos})
+
+
+class RollupsAsistenciaTests(TestCase):
+    OCHO_HORAS = 8 * 3600
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empleado = Empleado.objects.create(codigo_frappe=9401, codigo_checador=9401, nombre="Ana", apellido_paterno="López")
+
+    def _enero(self, alcance="Todas", **valores):
+        valores.setdefault("segundos_esperados", self.OCHO_HORAS)
+        valores.setdefault("faltas", 1)
+        return guardar_rollups_asistencia(_contadores(9401, "2025-01-01", "2025-01-31", **valores), alcance)
+
+    def test_cada_sucursal_lee_sus_rollups(self):
+        self.assertEqual(self._enero("Villas"), 31)
+
+        resumen = resumen_desde_rollups([9401], "2025-01-01", "2025-01-31", "Villas")
+        self.assertEqual(resumen["faltas_del_periodo"].tolist(), [31])
+        # El general no reutiliza lo que calculó un dashboard de sucursal
+        self.assertIsNone(resumen_desde_rollups([9401], "2025-01-01", "2025-01-31"))
+        self.assertTrue(RollupAsistencia.objects.filter(alcance="Villas", nivel="mes", inicio=date(2025, 1, 1)).exists())
+
+    def test_dia_modificado_se_reescribe(self):
+        self._enero()
+        self.assertEqual(self._enero(), 0)
+
+        cambio = _contadores(9401, "2025-01-10", "2025-01-10", segundos_esperados=self.OCHO_HORAS,
+                             segundos_permiso=self.OCHO_HORAS, permisos=1)
+        self.assertEqual(guardar_rollups_asistencia(cambio), 1)
+
+        resumen = resumen_desde_rollups([9401], "2025-01-01", "2025-01-31")
+        self.assertEqual((resumen["faltas_del_periodo"].iloc[0], resumen["permisos"].iloc[0]), (30, 1))
+        self.assertEqual(RollupAsistencia.objects.filter(nivel="dia").count(), 31)
+        self.assertEqual(RollupAsistencia.objects.filter(nivel="mes").count(), 1)
+
+    def test_permiso_aprobado_despues_invalida(self):
+        self._enero()
+        self.assertEqual(invalidar_rollups_por_permisos({}, [9401], "2025-01-01", "2025-01-31"), 0)
+
+        permisos = {"9401": {date(2025, 1, 10): {"is_half_day": False}}}
+        self.assertEqual(invalidar_rollups_por_permisos(permisos, [9401], "2025-01-01", "2025-01-31"), 1)
+        self.assertFalse(RollupAsistencia.objects.filter(empleado=self.empleado).exists())
+
+    def test_permiso_de_medio_dia(self):
+        self._enero()
+        guardar_rollups_asistencia(_contadores(9401, "2025-01-10", "2025-01-10", segundos_esperados=self.OCHO_HORAS,
+                                               segundos_permiso=self.OCHO_HORAS // 2, permisos=1))
+        medio_dia = {"9401": {date(2025, 1, 10): {"is_half_day": True}}}
+        completo = {"9401": {date(2025, 1, 10): {"is_half_day": False}}}
+
+        self.assertEqual(invalidar_rollups_por_permisos(medio_dia, [9401], "2025-01-01", "2025-01-31"), 0)
+        self.assertEqual(invalidar_rollups_por_permisos(completo, [9401], "2025-01-01", "2025-01-31"), 1)
+
+
+def _respuesta(status_code, data=()):
+    return SimpleNamespace(status_code=status_code, text="", json=lambda: {"data": list(data)})
+
+
+class CircuitoERPTests(SimpleTestCase):
+    def setUp(self):
+        self.ahora = 1000.0
+        reloj = mock.patch.object(api_client, "time", SimpleNamespace(monotonic=lambda: self.ahora))
+        reloj.start()
+        self.addCleanup(reloj.stop)
+        self.circuito = CircuitBreaker(failure_threshold=2, cooldown_seconds=60)
+
+    def _abrir(self):
+        self.circuito.record_failure()
+        self.circuito.record_failure()
+
+    def _admitido(self):
+        # Cada llamada corre en un contexto nuevo, como otra petición
+        def entrar():
+            with self.circuito.guard():
+                return True
+        try:
+            return contextvars.Context().run(entrar)
+        except ERPUnavailableError:
+            return False
+
+    def test_se_abre_tras_fallas_consecutivas(self):
+        self.circuito.record_failure()
+        self.assertTrue(self._admitido())
+        self.circuito.record_failure()
+        self.assertFalse(self._admitido())
+        self.ahora += 59
+        self.assertFalse(self._admitido())
+
+    def test_una_sola_peticion_de_prueba(self):
+        self._abrir()
+        self.ahora += 61
+        with self.circuito.guard():
+            # Las llamadas de la petición de prueba no se vuelven a revisar
+            with self.circuito.guard():
+                pass
+            self.assertFalse(self._admitido())
+            self.circuito.record_success()
+        self.assertTrue(self._admitido())
+
+    def test_prueba_fallida_reabre(self):
+        self._abrir()
+        self.ahora += 61
+        with self.circuito.guard():
+            self.circuito.record_failure()
+        self.ahora += 30
+        self.assertFalse(self._admitido())
+        self.ahora += 31
+        self.assertTrue(self._admitido())
+
+    def test_patrones_concurrentes_en_una_prueba(self):
+        circuito = CircuitBreaker(failure_threshold=1, cooldown_seconds=60)
+        circuito.record_failure()
+        self.ahora += 61
+        pedidos = []
+
+        class Cliente:
+            async def get(self, url, headers=None, params=None):
+                pedidos.append(params["filters"])
+                return _respuesta(200, [{"employee": "1", "time": "2025-01-14T08:00:00Z", "device_id": "Villas"}])
+
+        with mock.patch.object(api_client, "erp_circuit", circuito), \
+                mock.patch.object(api_client, "get_api_headers", lambda: {}):
+            registros = asyncio.run(APIClient().afetch_checkins(Cliente(), "2025-01-14", "2025-01-14", "Villas"))
+
+        self.assertEqual(len(pedidos), len(APIClient.DEVICE_PATTERNS["Villas"]))
+        self.assertEqual(len(registros), 1)
+        self.assertEqual(circuito._failures, 0)
+
+    def test_solo_las_caidas_cuentan(self):
+        circuito = CircuitBreaker(failure_threshold=1, cooldown_seconds=60)
+        with mock.patch.object(api_client, "erp_circuit", circuito), \
+                mock.patch.object(api_client, "get_api_headers", lambda: {}):
+            with mock.patch.object(api_client.requests, "get", return_value=_respuesta(401)):
+                with self.assertRaises(ERPRequestError):
+                    APIClient().fetch_leave_applications("2025-01-01", "2025-01-31")
+            self.assertEqual(circuito._failures, 0)
+
+            with mock.patch.object(api_client.requests, "get", return_value=_respuesta(503)):
+                with self.assertRaises(ERPUnavailableError):
+                    APIClient().fetch_leave_applications("2025-01-01", "2025-01-31")
+            with self.assertRaises(ERPUnavailableError):
+                with circuito.guard():
+                    pass
+
+
+class MemoriaCompartidaTests(SimpleTestCase):
+    def test_ida_y_vuelta(self):
+        df = pd.DataFrame({
+            "employee": pd.array([5, 6, 5, 7], dtype="int64"),
+            "time": pd.to_datetime(["2025-01-14 08:00", "2025-01-14 09:00", "2025-01-14 17:00", "2025-01-15 08:00"])
+                      .tz_localize("America/Mexico_City"),
+            "dia": pd.to_datetime(["2025-01-14", "2025-01-14", "2025-01-14", "2025-01-15"]),
+            "device_id": ["Villas-1", None, "Villas-1", "Nave"],
+            "Sucursal": pd.array(["Villas", "Villas", "Villas", "Nave"], dtype="string"),
+            "medio_dia": [True, False, True, False],
+        }, index=[10, 11, 12, 13])
+
+        bloque, meta = exportar_dataframe(df)
+        try:
+            leido = leer_dataframe(meta, "employee", [5, 7])
+        finally:
+            bloque.close()
+            bloque.unlink()
+
+        pd.testing.assert_frame_equal(leido, df.loc[[10, 12, 13]])
+
+    def test_sin_coincidencias(self):
+        bloque, meta = exportar_dataframe(pd.DataFrame({"employee": pd.Series([1, 2], dtype="int64"), "x": ["a", "b"]}))
+        try:
+            leido = leer_dataframe(meta, "employee", [9])
+        finally:
+            bloque.close()
+            bloque.unlink()
+
+        self.assertTrue(leido.empty)
+        self.assertEqual(list(leido.columns), ["employee", "x"])
+
+
+def _crear_dias_semana():
+    nombres = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+    for dia_id, nombre in enumerate(nombres, start=1):
+        DiaSemana.objects.get_or_create(dia_id=dia_id, defaults={"nombre_dia": nombre})
+
+
+class ImportarEmpleadosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _crear_dias_semana()
+        cls.sucursal = Sucursal.objects.create(nombre_sucursal="Sucursal Prueba")
+        cls.horario = Horario.objects.create(hora_entrada=time(8), hora_salida=time(16), descripcion_horario="Prueba 8-16")
+        Empleado.objects.create(codigo_frappe=9001, codigo_checador=9001, nombre="Ya", apellido_paterno="Existe",
+                                email="ya@ejemplo.com")
+
+    def _archivo(self, *filas):
+        return io.BytesIO("\n".join([",".join(COLUMNAS_IMPORTACION), *filas]).encode())
+
+    def _importar(self, *filas, simular=False):
+        return importar_empleados_service(self._archivo(*filas), "empleados.csv", simular=simular)
+
+    FILAS = (
+        "9101,9101,Ana,López,,ana@ejemplo.com,Sucursal Prueba,Prueba 8-16,L-V",
+        "9001,9102,Beto,Ruiz,,,,,",
+        "9103,9103,Caro,Díaz,,ya@ejemplo.com,,,",
+        "9104,9104,Dani,Paz,,,Otra,08:00-16:00,X",
+    )
+
+    def test_simular_no_escribe(self):
+        total = Empleado.all_objects.count()
+        resultado = self._importar(*self.FILAS, simular=True)
+
+        self.assertEqual(resultado["empleados_creados"], 1)
+        self.assertEqual(resultado["asignaciones_creadas"], 5)
+        self.assertEqual(resultado["errores"], [
+            {"fila": 3, "errores": ["codigo_frappe ya existe"]},
+            {"fila": 4, "errores": ["email ya existe"]},
+            {"fila": 5, "errores": ["sucursal 'Otra' no existe"]},
+        ])
+        self.assertEqual(Empleado.all_objects.count(), total)
+        self.assertFalse(AsignacionHorario.objects.exists())
+
+    def test_importar_crea_empleados_y_asignaciones(self):
+        resultado = self._importar(*self.FILAS)
+
+        self.assertEqual((resultado["empleados_creados"], resultado["asignaciones_creadas"]), (1, 5))
+        empleado = Empleado.objects.get(codigo_frappe=9101)
+        self.assertTrue(empleado.tiene_horario_asignado)
+        self.assertIsNone(empleado.apellido_materno)
+        asignaciones = AsignacionHorario.objects.filter(empleado=empleado).order_by("dia_especifico_id")
+        self.assertEqual([a.dia_especifico_id for a in asignaciones], [1, 2, 3, 4, 5])
+        self.assertTrue(all(a.horario_id == self.horario.pk and a.hora_entrada_especifica == time(8)
+                            and a.hora_salida_especifica == time(16) for a in asignaciones))
+        self.assertFalse(Empleado.all_objects.filter(codigo_frappe__in=[9103, 9104]).exists())
+
+    def test_empleado_con_una_fila_invalida_no_se_importa(self):
+        resultado = self._importar(
+            "9105,9105,Eva,Sol,,,Sucursal Prueba,Prueba 8-16,\"1,2\"",
+            "9105,9105,Eva,Sol,,,Sucursal Prueba,Nocturno,6",
+        )
+
+        self.assertEqual(resultado["empleados_creados"], 0)
+        self.assertEqual(resultado["errores"], [{"fila": 3, "errores": ["horario 'Nocturno' no existe"]}])
+        self.assertFalse(Empleado.all_objects.filter(codigo_frappe=9105).exists())
+
+    def test_repetidos_dentro_del_archivo(self):
+        resultado = self._importar(
+            "9106,9200,Fer,Gil,,f@ejemplo.com,,,",
+            "9107,9200,Gus,Gil,,F@ejemplo.com,,,",
+            "9108,9108,Hugo,,,,,,",
+        )
+
+        self.assertEqual(resultado["empleados_creados"], 0)
+        self.assertEqual(resultado["errores"], [
+            {"fila": 2, "errores": ["codigo_checador repetido en el archivo", "email repetido en el archivo"]},
+            {"fila": 3, "errores": ["codigo_checador repetido en el archivo", "email repetido en el archivo"]},
+            {"fila": 4, "errores": ["nombre y apellido_paterno son obligatorios"]},
+        ])
+
+    def test_checador_con_ceros_a_la_izquierda(self):
+        resultado = self._importar(
+            "9109,0100,Iris,Mar,,,,,",
+            "9110,100,Juan,Mar,,,,,",
+        )
+
+        self.assertEqual(resultado["empleados_creados"], 0)
+        self.assertEqual([e["errores"] for e in resultado["errores"]], [["codigo_checador repetido en el archivo"]] * 2)
+
+    def test_faltan_columnas(self):
+        with self.assertRaises(ValidationError):
+            importar_empleados_service(io.BytesIO(b"codigo_frappe,nombre\n1,Ana"), "empleados.csv")
+
+
+class ReasignarHorariosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _crear_dias_semana()
+        cls.sucursal = Sucursal.objects.create(nombre_sucursal="Sucursal Prueba")
+        cls.otra_sucursal = Sucursal.objects.create(nombre_sucursal="Otra Sucursal")
+        cls.viejo = Horario.objects.create(hora_entrada=time(8), hora_salida=time(16), descripcion_horario="Prueba 8-16")
+        cls.nuevo = Horario.objects.create(hora_entrada=time(9), hora_salida=time(17), descripcion_horario="Prueba 9-17")
+        cls.empleado = Empleado.objects.create(codigo_frappe=9301, codigo_checador=9301, nombre="Ana", apellido_paterno="López")
+        baja = Empleado.objects.create(codigo_frappe=9302, codigo_checador=9302, nombre="Beto", apellido_paterno="Ruiz",
+                                       is_deleted=True)
+
+        def asignar(empleado, sucursal, horario, dia=None):
+            return AsignacionHorario.objects.create(
+                empleado=empleado, sucursal=sucursal, horario=horario, dia_especifico_id=dia,
+                hora_entrada_especifica=horario.hora_entrada if dia else None,
+                hora_salida_especifica=horario.hora_salida if dia else None,
+            )
+
+        cls.lunes = asignar(cls.empleado, cls.sucursal, cls.viejo, 1)
+        cls.general = asignar(cls.empleado, cls.sucursal, cls.viejo)
+        cls.ya_nuevo = asignar(cls.empleado, cls.sucursal, cls.nuevo, 2)
+        cls.otra = asignar(cls.empleado, cls.otra_sucursal, cls.viejo, 3)
+        cls.de_baja = asignar(baja, cls.sucursal, cls.viejo, 1)
+
+    def test_requiere_filtro(self):
+        with self.assertRaises(ValidationError):
+            reasignar_horarios_service(self.nuevo.pk)
+        with self.assertRaises(ValidationError):
+            reasignar_horarios_service(0, sucursal_id=self.sucursal.pk)
+
+    def test_simulacion_no_modifica(self):
+        resultado = reasignar_horarios_service(self.nuevo.pk, sucursal_id=self.sucursal.pk)
+
+        self.assertFalse(resultado["aplicado"])
+        self.assertEqual((resultado["asignaciones"], resultado["empleados"]), (2, 1))
+        self.assertEqual({c["asignacion_id"] for c in resultado["cambios"]}, {self.lunes.pk, self.general.pk})
+        cambio = next(c for c in resultado["cambios"] if c["asignacion_id"] == self.lunes.pk)
+        self.assertEqual(cambio["nombre"], "Ana López")
+        self.assertEqual(cambio["dias"], "Lunes")
+        self.assertEqual((cambio["horario_actual"], cambio["horario_nuevo"]), ("Prueba 8-16", "Prueba 9-17"))
+        self.lunes.refresh_from_db()
+        self.assertEqual(self.lunes.horario_id, self.viejo.pk)
+
+    def test_aplicar(self):
+        resultado = reasignar_horarios_service(self.nuevo.pk, sucursal_id=self.sucursal.pk, aplicar=True)
+
+        self.assertTrue(resultado["aplicado"])
+        self.assertEqual(resultado["asignaciones"], 2)
+        for asignacion in (self.lunes, self.general, self.otra, self.de_baja):
+            asignacion.refresh_from_db()
+        self.assertEqual(self.lunes.horario_id, self.nuevo.pk)
+        self.assertEqual((self.lunes.hora_entrada_especifica, self.lunes.hora_salida_especifica), (time(9), time(17)))
+        # La asignación general no lleva horas específicas
+        self.assertEqual(self.general.horario_id, self.nuevo.pk)
+        self.assertIsNone(self.general.hora_entrada_especifica)
+        self.assertEqual(self.otra.horario_id, self.viejo.pk)
+        self.assertEqual(self.de_baja.horario_id, self.viejo.pk)
+
+
+def _checadas(empleado, dia, horas):
+    return [{"employee": str(empleado), "time": f"{dia} {hora}", "device_id": None} for hora in horas]
+
+
+class PivotChecadasTests(SimpleTestCase):
+    def setUp(self):
+        self.processor = AttendanceProcessor()
+
+    def test_columnas_por_orden_de_hora(self):
+        checadas = self.processor.preparar_checadas(
+            _checadas(5, "2025-01-14", ["13:00:00", "08:00:00"]) + _checadas(6, "2025-01-14", ["09:30:00"])
+        )
+        pivot = self.processor.pivot_checkins(checadas).set_index("employee")
+
+        self.assertEqual(pivot.loc[5, "checado_1"], time(8))
+        self.assertEqual(pivot.loc[5, "checado_2"], time(13))
+        self.assertEqual(pivot.loc[6, "checado_1"], time(9, 30))
+        self.assertTrue(pd.isna(pivot.loc[6, "checado_2"]))
+
+    def test_limite_de_columnas(self):
+        horas = [f"{h:02d}:00:00" for h in range(7, 7 + MAX_CHECADAS_DETALLE + 2)]
+        pivot = self.processor.pivot_checkins(self.processor.preparar_checadas(_checadas(5, "2025-01-14", horas)))
+
+        columnas = [c for c in pivot.columns if c.startswith("checado_")]
+        self.assertEqual(columnas, [f"checado_{i}" for i in range(1, MAX_CHECADAS_DETALLE + 1)])
+        self.assertEqual(pivot.loc[0, f"checado_{MAX_CHECADAS_DETALLE}"], time(6 + MAX_CHECADAS_DETALLE))
+
+    def test_descarta_filas_sin_hora(self):
+        checadas = self.processor.preparar_checadas(_checadas(5, "2025-01-14", ["08:00:00"]))
+        checadas = pd.concat([checadas, checadas.assign(time=pd.NaT)], ignore_index=True)
+        pivot = self.processor.pivot_checkins(checadas)
+
+        self.assertEqual(len(pivot), 1)
+        self.assertEqual([c for c in pivot.columns if c.startswith("checado_")], ["checado_1"])
+
+
+class ReporteDetalleTests(TestCase):
+    def test_checados_extra(self):
+        # Empleado sin registro en la BD: el día queda sin horario esperado
+        horas = [f"{h:02d}:00:00" for h in range(7, 7 + MAX_CHECADAS_DETALLE + 2)]
+        detalle = AttendanceProcessor().procesar_reporte_detalle(
+            _checadas(9999, "2025-01-14", horas), {}, "2025-01-14", "2025-01-15", [9999]
+        ).set_index("dia")
+
+        self.assertEqual(detalle.loc["2025-01-14", "checados_count"], MAX_CHECADAS_DETALLE + 2)
+        self.assertEqual(detalle.loc["2025-01-14", "checados_extra"], 2)
+        self.assertEqual(detalle.loc["2025-01-14", f"checado_{MAX_CHECADAS_DETALLE}"], f"{6 + MAX_CHECADAS_DETALLE:02d}:00:00")
+        self.assertNotIn(f"checado_{MAX_CHECADAS_DETALLE + 1}", detalle.columns)
+        self.assertEqual(detalle.loc["2025-01-15", "checados_extra"], 0)
+
+
+class SincronizarAsignacionesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _crear_dias_semana()
+        cls.sucursal = Sucursal.objects.create(nombre_sucursal="Sucursal Prueba")
+        cls.manana = Horario.objects.create(hora_entrada=time(8), hora_salida=time(16), descripcion_horario="Prueba 8-16")
+        cls.tarde = Horario.objects.create(hora_entrada=time(14), hora_salida=time(22), descripcion_horario="Prueba 14-22")
+        cls.empleado = Empleado.objects.create(codigo_frappe=9501, codigo_checador=9501, nombre="Ana", apellido_paterno="López")
+
+    def setUp(self):
+        _sincronizar_asignaciones(self.empleado, self._deseadas((self.manana, "1,2,3")))
+        self.actuales = {a.dia_especifico_id: a.pk for a in AsignacionHorario.objects.filter(empleado=self.empleado)}
+
+    def _deseadas(self, *bloques):
+        sucursales = [str(self.sucursal.pk)] * len(bloques)
+        return _construir_asignaciones(self.empleado, sucursales, [str(h.pk) for h, _ in bloques], [d for _, d in bloques])
+
+    def _asignaciones(self):
+        return {a.dia_especifico_id: (a.pk, a.horario_id, a.hora_entrada_especifica)
+                for a in AsignacionHorario.objects.filter(empleado=self.empleado)}
+
+    def test_solo_se_tocan_las_filas_que_cambian(self):
+        with mock.patch("core.services.programar_refresco_horarios") as refresco:
+            _sincronizar_asignaciones(self.empleado, self._deseadas((self.manana, "1"), (self.tarde, "2,4")))
+
+        asignaciones = self._asignaciones()
+        self.assertEqual(sorted(asignaciones), [1, 2, 4])
+        # Lunes igual y Martes actualizado conservan su fila; Miércoles se borra y Jueves es nueva
+        self.assertEqual(asignaciones[1], (self.actuales[1], self.manana.pk, time(8)))
+        self.assertEqual(asignaciones[2], (self.actuales[2], self.tarde.pk, time(14)))
+        self.assertNotIn(asignaciones[4][0], self.actuales.values())
+        refresco.assert_called_once_with([self.empleado.pk])
+
+    def test_sin_cambios_no_escribe(self):
+        deseadas = self._deseadas((self.manana, "1,2,3"))
+        with mock.patch("core.services.programar_refresco_horarios") as refresco, self.assertNumQueries(1):
+            _sincronizar_asignaciones(self.empleado, deseadas)
+
+        refresco.assert_not_called()
+        self.assertEqual({d: pk for d, (pk, _, _) in self._asignaciones().items()}, self.actuales)
+
+
+class _HiloInmediato:
+    """Sustituto de threading.Thread que ejecuta el objetivo al arrancar."""
+
+    def __init__(self, target, daemon=None):
+        self.target = target
+
+    def start(self):
+        self.target()
+
+
+class RevalidacionTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.reloj = 1000.0
+        reloj = mock.patch.object(cache_manager, "time", SimpleNamespace(time=lambda: self.reloj))
+        hilo = mock.patch.object(cache_manager.threading, "Thread", _HiloInmediato)
+        reloj.start(), hilo.start()
+        self.addCleanup(reloj.stop), self.addCleanup(hilo.stop)
+
+    def _obtener(self, calcular, version=1, **kwargs):
+        return cache_manager.obtener_con_revalidacion("reporte:prueba", calcular, version=version, **kwargs)
+
+    def test_reciente_no_recalcula(self):
+        self.assertEqual(self._obtener(lambda: "v1"), ("v1", 0.0))
+        self.reloj += 10
+        calcular = mock.Mock(return_value="v2")
+
+        self.assertEqual(self._obtener(calcular, segundos_fresco=60), ("v1", 10))
+        calcular.assert_not_called()
+
+    def test_obsoleto_se_sirve_y_se_refresca(self):
+        self._obtener(lambda: "v1")
+        self.reloj += 120
+
+        # Se sirve lo anterior y el refresco deja el nuevo valor para la siguiente consulta
+        self.assertEqual(self._obtener(lambda: "v2", segundos_fresco=60), ("v1", 120))
+        self.assertEqual(self._obtener(lambda: "v3", segundos_fresco=60), ("v2", 0))
+        self.assertIsNone(cache.get("reporte:prueba:revalidando"))
+
+    def test_refresco_fallido_conserva_el_anterior(self):
+        self._obtener(lambda: "v1")
+        self.reloj += 120
+
+        self._obtener(mock.Mock(side_effect=ERPUnavailableError("caído")), segundos_fresco=60)
+        self.assertEqual(self._obtener(lambda: "v3", segundos_fresco=600), ("v1", 120))
+
+    def test_otra_version_recalcula(self):
+        self._obtener(lambda: "v1")
+        self.reloj += 10
+
+        self.assertEqual(self._obtener(lambda: "v2", version=2), ("v2", 0.0))
+
+    def test_resultado_no_cacheable_sirve_el_ultimo_bueno(self):
+        self._obtener(lambda: "v1")
+        self.reloj += 30
+
+        # Cambió la versión pero el ERP no respondió: se sirve lo último bueno con su edad
+        self.assertEqual(self._obtener(lambda: "", version=2), ("v1", 30))
+        self.assertEqual(self._obtener(lambda: "", version=3, es_cacheable=lambda v: False), ("v1", 30))
+
+    def test_sin_entrada_no_cacheable(self):
+        self.assertEqual(self._obtener(lambda: ""), ("", None))
+        self.assertIsNone(cache.get("reporte:prueba"))
+
+
+class CalcularUnaVezTests(SimpleTestCase):
+    SEGUNDOS = 5
+
+    def _concurrentes(self, calcular, seguidores=3):
+        """Lanza un líder que se bloquea en calcular() y varios seguidores con la misma clave."""
+        dentro, liberar, esperando = threading.Event(), threading.Event(), threading.Semaphore(0)
+
+        class FuturoContado(Future):
+            def result(self, timeout=None):
+                esperando.release()
+                return super().result(timeout)
+
+        def lider():
+            dentro.set()
+            liberar.wait(self.SEGUNDOS)
+            return calcular()
+
+        with mock.patch.object(cache_manager, "Future", FuturoContado), \
+                ThreadPoolExecutor(max_workers=seguidores + 1) as executor:
+            futuros = [executor.submit(cache_manager.calcular_una_vez, "reporte:clave", lider)]
+            self.assertTrue(dentro.wait(self.SEGUNDOS))
+            futuros += [executor.submit(cache_manager.calcular_una_vez, "reporte:clave", calcular)
+                        for _ in range(seguidores)]
+            # Los seguidores ya esperan al líder antes de que termine
+            for _ in range(seguidores):
+                self.assertTrue(esperando.acquire(timeout=self.SEGUNDOS))
+            liberar.set()
+        return futuros
+
+    def test_una_sola_ejecucion_para_todos(self):
+        calcular = mock.Mock(return_value={"filas": 3})
+        futuros = self._concurrentes(calcular)
+
+        calcular.assert_called_once_with()
+        self.assertEqual([f.result() for f in futuros], [{"filas": 3}] * 4)
+        self.assertNotIn("reporte:clave", cache_manager._en_vuelo)
+
+    def test_el_error_llega_a_todos(self):
+        calcular = mock.Mock(side_effect=ERPUnavailableError("caído"))
+        futuros = self._concurrentes(calcular)
+
+        calcular.assert_called_once_with()
+        for futuro in futuros:
+            self.assertRaises(ERPUnavailableError, futuro.result)
+        # La siguiente llamada vuelve a calcular
+        self.assertEqual(cache_manager.calcular_una_vez("reporte:clave", lambda: "ok"), "ok")
+
+
+class DescargasConcurrentesTests(TestCase):
+    SEGUNDOS = 5
+
+    def setUp(self):
+        Empleado.objects.create(codigo_frappe=9601, codigo_checador=9601, nombre="Ana", apellido_paterno="López")
+        credenciales = mock.patch.dict(os.environ, {"ASIATECH_API_KEY": "k", "ASIATECH_API_SECRET": "s"})
+        credenciales.start()
+        self.addCleanup(credenciales.stop)
+        self.circuito = CircuitBreaker(failure_threshold=1, cooldown_seconds=60)
+
+    def test_checadas_y_permisos_a_la_vez(self):
+        # Cada descarga espera a la otra: si corrieran en serie la barrera se rompería
+        barrera = threading.Barrier(2, timeout=self.SEGUNDOS)
+        admitidas = []
+
+        def descarga(resultado):
+            def fetch(*args):
+                admitidas.append(api_client._erp_admitted.get())
+                barrera.wait()
+                return resultado
+            return fetch
+
+        manager = main.AttendanceReportManager()
+        checadas = [{"employee": "9601", "time": "2025-01-14 08:00:00", "device_id": None}]
+        with mock.patch.object(main, "erp_circuit", self.circuito), \
+                mock.patch.object(self.circuito, "before_call", wraps=self.circuito.before_call) as revision, \
+                mock.patch.object(manager.api_client, "fetch_checkins", descarga(checadas)), \
+                mock.patch.object(manager.api_client, "fetch_leave_applications", descarga([])):
+            codigos, checkin_records, permisos = manager._prepare_report_data("2025-01-14", "2025-01-14", "Todas")
+
+        self.assertEqual((codigos, checkin_records, permisos), ([9601], checadas, {}))
+        # Una sola revisión del circuito para la petición, heredada por los dos hilos
+        revision.assert_called_once_with()
+        self.assertEqual(admitidas, [True, True])
+
+    def test_error_de_una_descarga_se_propaga(self):
+        manager = main.AttendanceReportManager()
+        with mock.patch.object(main, "erp_circuit", self.circuito), \
+                mock.patch.object(manager.api_client, "fetch_checkins", side_effect=ERPUnavailableError("caído")), \
+                mock.patch.object(manager.api_client, "fetch_leave_applications", return_value=[]):
+            with self.assertRaises(ERPUnavailableError):
+                manager._prepare_report_data("2025-01-14", "2025-01-14", "Todas")
+
+
+class ProyeccionDashboardTests(SimpleTestCase):
+    RESULTADO = {
+        "success": True,
+        "data": {
+            "period_summary": {"total_empleados": 2},
+            "branches": [{"sucursal": "Villas"}],
+            "employee_summary_kpis": [{"employee": 1, "nombre": "Ana", "faltas": 0, "retardos": 2}],
+            "employee_performance_kpis": [{"employee": 1, "nombre": "Ana", "puntualidad": 0.9}],
+        },
+    }
+
+    def test_secciones(self):
+        proyectado = main.proyectar_dashboard(self.RESULTADO, secciones=("branches", "period_summary"))
+
+        self.assertEqual(proyectado["data"], {"period_summary": {"total_empleados": 2}, "branches": [{"sucursal": "Villas"}]})
+        self.assertTrue(proyectado["success"])
+
+    def test_campos_solo_en_tablas_por_empleado(self):
+        proyectado = main.proyectar_dashboard(self.RESULTADO, campos=("employee", "faltas"))
+
+        self.assertEqual(proyectado["data"]["employee_summary_kpis"], [{"employee": 1, "faltas": 0}])
+        self.assertEqual(proyectado["data"]["employee_performance_kpis"], [{"employee": 1}])
+        self.assertEqual(proyectado["data"]["period_summary"], {"total_empleados": 2})
+
+    def test_no_modifica_el_resultado_en_cache(self):
+        main.proyectar_dashboard(self.RESULTADO, secciones=("employee_summary_kpis",), campos=("nombre",))
+
+        self.assertEqual(len(self.RESULTADO["data"]), 4)
+        self.assertEqual(self.RESULTADO["data"]["employee_summary_kpis"][0]["retardos"], 2)
+
+    def test_sin_proyeccion_o_con_error(self):
+        self.assertIs(main.proyectar_dashboard(self.RESULTADO), self.RESULTADO)
+        error = {"success": False, "error": "ERP caído"}
+        self.assertIs(main.proyectar_dashboard(error, secciones=("branches",)), error)
+
+    def test_parametros_de_la_peticion(self):
+        peticion = RequestFactory().get("/", {"sections": " period_summary,branches,,branches", "fields": ""})
+        self.assertEqual(_lista_parametro(peticion, "sections"), ("branches", "period_summary"))
+        self.assertIsNone(_lista_parametro(peticion, "fields"))
+
+
+def _horas(*horas):
+    return pd.to_timedelta(list(horas), unit="h")
+
+
+def _kpis_por_empleado_anterior(df_resumen, df_detalle):
+    """Tabla de rendimiento como la armaba generar_datos_dashboard_general antes del motor único."""
+    horas = df_resumen.groupby('employee').agg(
+        total_horas_trabajadas_td=('total_horas_trabajadas_td', 'sum'),
+        total_horas_td=('total_horas_td', 'sum'),
+    ).reset_index()
+    dias_laborables_total = df_detalle[df_detalle['horas_esperadas'].dt.total_seconds() > 0].groupby('employee').size()
+    dias_laborables_total.name = 'dias_laborables_total'
+
+    df = df_resumen.groupby('employee').agg(
+        Faltas=('faltas_del_periodo', 'sum'),
+        Retardos=('total_retardos', 'sum'),
+        Salidas=('total_salidas_anticipadas', 'sum'),
+    ).reset_index()
+    df = df.merge(horas, on='employee', how='left').merge(dias_laborables_total, on='employee', how='left').fillna(0)
+
+    mask_dlp = df['dias_laborables_total'] > 0
+    trabajadas_s = df['total_horas_trabajadas_td'].dt.total_seconds()
+    netas_s = df['total_horas_td'].dt.total_seconds()
+    mask_hnp = netas_s > 0
+    denom = df.loc[mask_dlp, 'dias_laborables_total']
+
+    df['Eficiencia Horas (%)'] = 100.0
+    df.loc[mask_hnp, 'Eficiencia Horas (%)'] = trabajadas_s[mask_hnp] / netas_s[mask_hnp] * 100
+    df['Índice Puntualidad (%)'] = 100.0
+    df.loc[mask_dlp, 'Índice Puntualidad (%)'] = (denom - df.loc[mask_dlp, 'Retardos']).clip(lower=0) / denom * 100
+    df['SIC'] = 100.0
+    df.loc[mask_dlp, 'SIC'] = (denom - (df.loc[mask_dlp, 'Faltas'] + df.loc[mask_dlp, 'Retardos']
+                                        + df.loc[mask_dlp, 'Salidas'])).clip(lower=0) / denom * 100
+    df['Tasa Ausentismo (%)'] = 0.0
+    df.loc[mask_dlp, 'Tasa Ausentismo (%)'] = df.loc[mask_dlp, 'Faltas'] / denom * 100
+    return df.set_index('employee')
+
+
+class CalcularKpisTests(SimpleTestCase):
+    KPIS = ['Eficiencia Horas (%)', 'Índice Puntualidad (%)', 'SIC', 'Tasa Ausentismo (%)']
+
+    def setUp(self):
+        # 1: dos sucursales; 2: más retardos que días laborables; 3: sin horas esperadas ni días laborables
+        self.resumen = pd.DataFrame({
+            "employee": [1, 1, 2, 3],
+            "Nombre": ["Ana", "Ana", "Luis", "Eva"],
+            "Sucursal": ["Villas", "Nave", "Villas", "Nave"],
+            "total_horas_trabajadas_td": _horas(30, 7.5, 20, 4),
+            "total_horas_esperadas_td": _horas(32, 8, 24, 0),
+            "total_horas_td": _horas(32, 8, 24, 0),
+            "total_retardos": [1, 0, 5, 0],
+            "faltas_del_periodo": [1, 0, 0, 0],
+            "total_salidas_anticipadas": [0, 1, 1, 0],
+            "faltas_justificadas": [0, 1, 0, 0],
+        })
+        self.detalle = pd.DataFrame({
+            "employee": [1] * 5 + [2] * 4 + [3] * 2,
+            "Sucursal": ["Villas"] * 4 + ["Nave"] + ["Villas"] * 4 + ["Nave"] * 2,
+            "horas_esperadas": _horas(8, 8, 8, 8, 8, 8, 8, 8, 0, 0, 0),
+        })
+
+    def test_igual_que_las_tablas_por_empleado_anteriores(self):
+        nuevo = calcular_kpis(self.resumen, self.detalle).set_index("employee")
+        anterior = _kpis_por_empleado_anterior(self.resumen, self.detalle)
+
+        pd.testing.assert_frame_equal(nuevo[self.KPIS], anterior.loc[nuevo.index, self.KPIS], check_names=False)
+        self.assertEqual(nuevo["dias_laborables"].tolist(), [5, 3, 0])
+        self.assertEqual(nuevo.loc[2, "Índice Puntualidad (%)"], 0.0)
+        self.assertEqual(nuevo.loc[3, "Eficiencia Horas (%)"], 100.0)
+
+    def test_por_sucursal(self):
+        kpis = calcular_kpis(self.resumen, self.detalle, por=("employee", "Sucursal")).set_index(["employee", "Sucursal"])
+
+        self.assertEqual(kpis.loc[(1, "Villas"), "dias_laborables"], 4)
+        self.assertEqual(kpis.loc[(1, "Nave"), "dias_laborables"], 1)
+        self.assertAlmostEqual(kpis.loc[(1, "Villas"), "Tasa Ausentismo (%)"], 25.0)
+        self.assertAlmostEqual(kpis.loc[(1, "Nave"), "SIC"], 0.0)
+
+    def test_dias_laborables_desde_rollups(self):
+        # Sin detalle, los días laborables vienen sumados en el resumen
+        resumen = self.resumen.assign(dias_laborables=[4, 1, 3, 0])
+
+        nuevo = calcular_kpis(resumen).set_index("employee")
+        anterior = calcular_kpis(self.resumen, self.detalle).set_index("employee")
+        pd.testing.assert_frame_equal(nuevo, anterior)
+
+
+class EtagCatalogosTests(TestCase):
+    def setUp(self):
+        cache_manager.invalidar_catalogos()
+        self.factory = RequestFactory()
+        self.usuario = SimpleNamespace(is_authenticated=True)
+
+    def _get(self, vista, etag=None):
+        encabezados = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        peticion = self.factory.get("/", **encabezados)
+        peticion.user = self.usuario
+        return vista(peticion)
+
+    def test_304_mientras_no_cambie_el_catalogo(self):
+        for vista in (api_lista_sucursales, api_lista_horarios):
+            with self.subTest(vista=vista.__name__):
+                respuesta = self._get(vista)
+                self.assertEqual(respuesta.status_code, 200)
+                self.assertTrue(respuesta["ETag"])
+
+                repetida = self._get(vista, respuesta["ETag"])
+                self.assertEqual(repetida.status_code, 304)
+                self.assertEqual(repetida.content, b"")
+
+    def test_cambio_en_catalogo_cambia_el_etag(self):
+        anterior = self._get(api_lista_sucursales)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Sucursal.objects.create(nombre_sucursal="Sucursal Nueva")
+
+        respuesta = self._get(api_lista_sucursales, anterior)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta["ETag"], anterior)
+        self.assertIn("Sucursal Nueva", respuesta.content.decode())
+        # Otras vistas del catálogo tampoco responden 304 con el ETag viejo
+        self.assertEqual(self._get(api_lista_horarios, anterior).status_code, 200)
+
+
+class ListarEmpleadosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _crear_dias_semana()
+        sucursal = Sucursal.objects.create(nombre_sucursal="Sucursal Prueba")
+        horario = Horario.objects.create(hora_entrada=time(8), hora_salida=time(16), descripcion_horario="Prueba 8-16")
+        cls.empleados = [
+            Empleado.objects.create(codigo_frappe=9700 + i, codigo_checador=9700 + i, nombre=f"Empleado {i}",
+                                    apellido_paterno="Prueba")
+            for i in range(5)
+        ]
+        # El 1 no tiene horario y el 3 está dado de baja
+        for empleado in cls.empleados[:1] + cls.empleados[2:]:
+            # Varias asignaciones por empleado no deben repetirlo en la lista
+            for dia in (1, 2):
+                AsignacionHorario.objects.create(empleado=empleado, sucursal=sucursal, horario=horario,
+                                                 dia_especifico_id=dia)
+        cls.empleados[3].delete()
+
+    def _ids(self, *posiciones):
+        return [self.empleados[p].pk for p in posiciones]
+
+    def _paginas(self, **kwargs):
+        paginas, despues_de = [], None
+        while True:
+            pagina = listar_empleados(limite=2, despues_de=despues_de, **kwargs)
+            paginas.append([e["empleado_id"] for e in pagina["empleados"]])
+            despues_de = pagina["siguiente"]
+            if despues_de is None:
+                return paginas
+
+    def test_pagina_por_llave_sin_repetidos(self):
+        self.assertEqual(self._paginas(), [self._ids(0, 2), self._ids(4)])
+
+    def test_ultima_pagina_completa_no_tiene_siguiente(self):
+        pagina = listar_empleados(limite=3)
+        self.assertEqual([e["empleado_id"] for e in pagina["empleados"]], self._ids(0, 2, 4))
+        self.assertIsNone(pagina["siguiente"])
+
+    def test_gestion_incluye_bajas_y_sin_horario(self):
+        paginas = self._paginas(incluir_bajas=True, solo_con_horario=False)
+
+        self.assertEqual(paginas, [self._ids(0, 1), self._ids(2, 3), self._ids(4)])
+        baja = listar_empleados(limite=1, despues_de=self.empleados[2].pk, incluir_bajas=True)["empleados"][0]
+        self.assertEqual((baja["empleado_id"], baja["is_deleted"]), (self.empleados[3].pk, True))
+
+
+class CalendarioHorariosTests(TestCase):
+    # Turnos ya resueltos por la vista semanal: (es_primera_quincena, dia_id) -> (entrada, salida, cruza, horas)
+    SEMANA = {
+        (True, 3): (time(8), time(16), False, 8.0),
+        (False, 3): (time(22), time(6), True, 8.0),
+        (False, 4): (time(9), time(13, 30), False, 4.5),
+    }
+
+    def setUp(self):
+        self.empleado = Empleado.objects.create(codigo_frappe=9801, codigo_checador=9801, nombre="Ana",
+                                                apellido_paterno="López")
+        semanas = mock.patch.object(db_postgres_connection, "obtener_semanas_empleados",
+                                    side_effect=lambda ids: {e: self.SEMANA for e in ids})
+        self.semanas = semanas.start()
+        self.addCleanup(semanas.stop)
+
+    def test_turno_segun_quincena_y_dia(self):
+        # Miércoles 15 y 22 de enero de 2025, jueves 16
+        calendario = db_postgres_connection.obtener_calendario_horarios([9801], "2025-01-15", "2025-01-22")
+
+        self.assertEqual(calendario["employee"].tolist(), [9801] * 3)
+        self.assertEqual(calendario["dia"].dt.day.tolist(), [15, 16, 22])
+        self.assertEqual(calendario["horario_entrada"].tolist(), [time(8), time(9), time(22)])
+        self.assertEqual(calendario["horas_esperadas"].dt.total_seconds().tolist(), [28800, 16200, 28800])
+        # Los días sin turno quedan materializados sin horario
+        self.assertEqual(CalendarioHorario.objects.filter(empleado=self.empleado, tiene_horario=False).count(), 5)
+
+    def test_solo_se_calculan_las_fechas_faltantes(self):
+        self.assertEqual(db_postgres_connection.materializar_calendario([self.empleado.pk], "2025-01-15", "2025-01-22"), 8)
+        self.assertEqual(db_postgres_connection.materializar_calendario([self.empleado.pk], "2025-01-15", "2025-01-22"), 0)
+        self.assertEqual(db_postgres_connection.materializar_calendario([self.empleado.pk], "2025-01-13", "2025-01-23"), 3)
+        self.assertEqual(self.semanas.call_count, 2)
+
+        db_postgres_connection.invalidar_calendario_horarios([self.empleado.pk])
+        self.assertEqual(db_postgres_connection.materializar_calendario([self.empleado.pk], "2025-01-15", "2025-01-22"), 8)
+
+
+class HorarioEmpleadoTests(TestCase):
+    def setUp(self):
+        _crear_dias_semana()
+        cache_manager.invalidar_catalogos()
+        self.empleado = Empleado.objects.create(codigo_frappe=9802, codigo_checador=9802, nombre="Ana",
+                                                apellido_paterno="López")
+        semana = {
+            (True, 1): (time(8), time(16), False, 8.0),
+            (True, 2): (time(22), time(6), True, 8.0),
+            (False, 1): (time(9), time(13), False, 4.0),
+        }
+        semanas = mock.patch.object(db_postgres_connection, "obtener_semanas_empleados",
+                                    return_value={self.empleado.pk: semana})
+        self.semanas = semanas.start()
+        self.addCleanup(semanas.stop)
+
+    def test_turnos_de_la_vista_semanal(self):
+        horario = db_postgres_connection.obtener_horario_empleado_completo(9802, "2025-01-06")
+
+        self.semanas.assert_called_once_with([self.empleado.pk])
+        detalle = horario["horarios_detallados"]
+        self.assertEqual(horario["dias_con_horario"], 2)
+        self.assertEqual((detalle["Lunes"]["entrada"], detalle["Lunes"]["horas_totales"]), (time(8), 8.0))
+        self.assertEqual(detalle["Martes"]["horas_totales"], 8.0)
+        self.assertFalse(detalle["Miércoles"]["tiene_horario"])
+
+    def test_segunda_quincena(self):
+        horario = db_postgres_connection.obtener_horario_empleado_completo(9802, "2025-01-20")
+
+        self.assertEqual(horario["dias_con_horario"], 1)
+        self.assertEqual(horario["horarios_detallados"]["Lunes"]["entrada"], time(9))
+        self.assertEqual(horario["horas_por_dia"], 4.0)
+
+    def test_empleado_sin_turnos_o_inexistente(self):
+        self.semanas.return_value = {}
+        self.assertEqual(db_postgres_connection.obtener_horario_empleado_completo(9802), {"dias_con_horario": 0})
+        self.assertEqual(db_postgres_connection.obtener_horario_empleado_completo(1), {"dias_con_horario": 0})
+
+
+class ObtenerRolesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin, self.manager = Group.objects.create(name="Admin"), Group.objects.create(name="Manager")
+        self.usuarios = {}
+        for i, grupos in enumerate([[self.admin], [self.admin, self.manager], [self.manager], []]):
+            usuario = User.objects.create_user(f"usuario{i}", f"usuario{i}@example.com")
+            usuario.groups.set(grupos)
+            Empleado.objects.create(codigo_frappe=9900 + i, codigo_checador=9900 + i, nombre=f"Empleado {i}",
+                                    apellido_paterno="Prueba", user=usuario)
+            self.usuarios[9900 + i] = usuario
+        Empleado.objects.create(codigo_frappe=9999, codigo_checador=9999, nombre="Sin", apellido_paterno="Usuario")
+
+    def _roles(self):
+        return {r["codigo_frappe"]: r["rol"] for r in obtener_roles_service()}
+
+    def test_rol_por_empleado_con_usuario(self):
+        with self.assertNumQueries(2):
+            roles = self._roles()
+
+        self.assertEqual(roles, {9900: "Admin", 9901: "Admin", 9902: "Manager", 9903: "—"})
+        # El mapa de roles queda en caché: solo se consulta la lista de empleados
+        with self.assertNumQueries(1):
+            self._roles()
+
+    def test_cambio_de_grupos_invalida_el_mapa(self):
+        self._roles()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuarios[9903].groups.add(self.manager)
+            self.usuarios[9900].groups.remove(self.admin)
+
+        self.assertEqual(self._roles(), {9900: "—", 9901: "Admin", 9902: "Manager", 9903: "Manager"})
+
+
+class NormalizarBusquedaTests(SimpleTestCase):
+    def test_sin_acentos_minusculas_y_espacios_simples(self):
+        self.assertEqual(normalizar_texto_busqueda("  José   MUÑOZ\tPéña "), "jose munoz pena")
+        self.assertEqual(normalizar_texto_busqueda(1234), "1234")
+        self.assertEqual(normalizar_texto_busqueda(None), "")
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "La búsqueda usa pg_trgm y unaccent")
+class BuscarEmpleadosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.jose = Empleado.objects.create(codigo_frappe=9951, codigo_checador=9951, nombre="José",
+                                           apellido_paterno="Muñoz", apellido_materno="Pérez")
+        cls.josefina = Empleado.objects.create(codigo_frappe=9952, codigo_checador=9952, nombre="Josefina",
+                                               apellido_paterno="Ruiz", email="josefina@example.com")
+        cls.baja = Empleado.objects.create(codigo_frappe=9953, codigo_checador=9953, nombre="Jose",
+                                           apellido_paterno="Muñoz")
+        cls.baja.delete()
+
+    def _ids(self, texto, **kwargs):
+        return [r["empleado_id"] for r in db_postgres_connection.buscar_empleados(texto, **kwargs)["resultados"]]
+
+    def test_sin_acentos_y_por_palabras(self):
+        self.assertEqual(self._ids("JOSE munoz"), [self.jose.pk])
+        self.assertEqual(self._ids("perez"), [self.jose.pk])
+        self.assertEqual(self._ids("9952"), [self.josefina.pk])
+
+    def test_orden_por_similitud_y_paginas(self):
+        self.assertEqual(self._ids("jose"), [self.jose.pk, self.josefina.pk])
+
+        primera = db_postgres_connection.buscar_empleados("jose", limite=1)
+        self.assertTrue(primera["hay_mas"])
+        self.assertEqual(self._ids("jose", limite=1, pagina=2), [self.josefina.pk])
+
+    def test_bajas_solo_si_se_piden(self):
+        self.assertNotIn(self.baja.pk, self._ids("munoz"))
+        self.assertIn(self.baja.pk, self._ids("munoz", incluir_bajas=True))
+
+
+class ExportarEmpleadosExcelTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _crear_dias_semana()
+        cls.sucursal = Sucursal.objects.create(nombre_sucursal="Sucursal Prueba")
+        cls.horario = Horario.objects.create(hora_entrada=time(8), hora_salida=time(16), descripcion_horario="Prueba 8-16")
+
+    def _crear_empleados(self, cantidad, desde):
+        for i in range(desde, desde + cantidad):
+            empleado = Empleado.objects.create(codigo_frappe=9960 + i, codigo_checador=9960 + i, nombre=f"Empleado {i}",
+                                               apellido_paterno="Prueba")
+            for dia in (1, 2):
+                AsignacionHorario.objects.create(empleado=empleado, sucursal=self.sucursal, horario=self.horario,
+                                                 dia_especifico_id=dia)
+
+    def _exportar(self):
+        peticion = RequestFactory().get("/")
+        peticion.user = SimpleNamespace(is_authenticated=True)
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = exportar_lista_empleados_excel(peticion)
+        filas = list(openpyxl.load_workbook(io.BytesIO(respuesta.content)).active.iter_rows(values_only=True))
+        return filas, len(consultas)
+
+    def test_consultas_no_crecen_con_los_empleados(self):
+        self._crear_empleados(2, desde=0)
+        _, consultas_pocos = self._exportar()
+        self._crear_empleados(4, desde=2)
+        filas, consultas_muchos = self._exportar()
+
+        self.assertEqual(consultas_muchos, consultas_pocos)
+        self.assertEqual(len(filas), 7)
+
+    def test_contenido_de_las_filas(self):
+        self._crear_empleados(1, desde=0)
+        baja = Empleado.objects.create(codigo_frappe=9999, codigo_checador=9999, nombre="Baja", apellido_paterno="Prueba")
+        baja.delete()
+
+        encabezados, activo, dado_de_baja = self._exportar()[0]
+        self.assertEqual(encabezados[:3], ("ID", "Cód. Frappe", "Cód. Checador"))
+        self.assertEqual((activo[1], activo[7], activo[10]), (9960, "Sucursal Prueba", "ACTIVO"))
+        self.assertEqual(activo[8], "• Sucursal Prueba: 08:00-16:00 (Lunes)\n• Sucursal Prueba: 08:00-16:00 (Martes)")
+        self.assertEqual((dado_de_baja[8], dado_de_baja[10]), ("Sin horario asignado", "BAJA DEFINITIVA"))
+
+
+class DataframeToJsonTests(SimpleTestCase):
+    DURACIONES = [
+        pd.Timedelta(hours=7, minutes=5, seconds=9), pd.Timedelta(days=1, hours=2, minutes=3, seconds=4),
+        pd.Timedelta(minutes=-30), pd.Timedelta(seconds=1, microseconds=500), pd.Timedelta(0),
+    ]
+
+    def test_duraciones_como_django(self):
+        df = pd.DataFrame({"diferencia": self.DURACIONES})
+
+        esperado = [{"diferencia": json.loads(json.dumps(td.to_pytimedelta(), cls=DjangoJSONEncoder))}
+                    for td in self.DURACIONES]
+        self.assertEqual(json.loads(dataframe_to_json(df)), esperado)
+
+    def test_nulos_enteros_y_texto(self):
+        df = pd.DataFrame({
+            "employee": pd.array([7, 8], dtype="int64"),
+            "Nombre": ["Peña", None],
+            "faltas": [1.5, float("nan")],
+            "horas": [pd.Timedelta(hours=8), pd.NaT],
+        })
+
+        self.assertEqual(json.loads(dataframe_to_json(df)), [
+            {"employee": 7, "Nombre": "Peña", "faltas": 1.5, "horas": "P0DT08H00M00S"},
+            {"employee": 8, "Nombre": None, "faltas": None, "horas": None},
+        ])
+        self.assertIn("Peña", dataframe_to_json(df))
+
+    def test_formato_por_columnas(self):
+        df = pd.DataFrame({"employee": [7, 8], "horas": [pd.Timedelta(hours=8), pd.Timedelta(minutes=-5)]})
+
+        columnar = json.loads(dataframe_to_json(df, columnar=True))
+        self.assertEqual(columnar["columns"], ["employee", "horas"])
+        registros = [dict(zip(columnar["columns"], fila)) for fila in columnar["data"]]
+        self.assertEqual(registros, json.loads(dataframe_to_json(df)))
+
+
+class ReportesAsyncTests(SimpleTestCase):
+    SEGUNDOS = 5
+
+    def setUp(self):
+        cache.clear()
+        version = mock.patch.object(views, "_version_reportes", return_value=(1, 1))
+        version.start()
+        self.addCleanup(version.stop)
+
+    def _peticion(self, autenticado=True, **params):
+        peticion = RequestFactory().get("/api/reporte_horas/", params)
+
+        async def auser():
+            return SimpleNamespace(is_authenticated=autenticado)
+        peticion.auser = auser
+        return peticion
+
+    @override_settings(LOGIN_URL="/login/")
+    async def test_requiere_sesion(self):
+        respuesta = await views.api_reporte_horas(self._peticion(autenticado=False, startDate="2025-01-01"))
+        self.assertEqual((respuesta.status_code, respuesta.url), (302, "/login/?next=/api/reporte_horas/%3FstartDate%3D2025-01-01"))
+
+    async def test_faltan_fechas(self):
+        respuesta = await views.api_reporte_horas(self._peticion(startDate="2025-01-01"))
+        self.assertEqual(respuesta.status_code, 400)
+
+    async def test_no_bloquea_el_event_loop(self):
+        # El reporte solo termina cuando otra corrutina corre mientras se calcula
+        otra_corrutina = threading.Event()
+
+        def generar(start_date, end_date, sucursal):
+            self.assertTrue(otra_corrutina.wait(self.SEGUNDOS))
+            return {"success": True, "data": [{"employee": 7, "sucursal": sucursal}]}
+
+        async def marcar():
+            otra_corrutina.set()
+
+        with mock.patch.object(views, "generar_reporte_completo", side_effect=generar) as generar_mock:
+            respuesta, _ = await asyncio.gather(
+                views.api_reporte_horas(self._peticion(startDate="2025-01-01", endDate="2025-01-15")), marcar())
+            repetida = await views.api_reporte_horas(self._peticion(startDate="2025-01-01", endDate="2025-01-15"))
+
+        self.assertEqual(json.loads(respuesta.content)["data"], [{"employee": 7, "sucursal": "Todas"}])
+        # La segunda petición sale de la caché, con su edad
+        generar_mock.assert_called_once_with(start_date="2025-01-01", end_date="2025-01-15", sucursal="Todas")
+        self.assertEqual(repetida.content, respuesta.content)
+        self.assertIn("Age", repetida)
+
+
+class CatalogosEnMemoriaTests(TestCase):
+    def setUp(self):
+        cache_manager.invalidar_catalogos()
+        self.reloj = 1000.0
+        reloj = mock.patch.object(cache_manager, "time", SimpleNamespace(monotonic=lambda: self.reloj))
+        reloj.start()
+        self.addCleanup(reloj.stop)
+        self.sucursal = Sucursal.objects.create(nombre_sucursal="Sucursal Prueba")
+
+    def _nombres(self):
+        return [s.nombre_sucursal for s in cache_manager.obtener_sucursales()]
+
+    def test_sin_consultas_dentro_del_intervalo(self):
+        self._nombres()
+        self.reloj += cache_manager.SEGUNDOS_VERIFICACION_CATALOGOS - 1
+        with self.assertNumQueries(0):
+            self.assertEqual(cache_manager.obtener_sucursal(self.sucursal.pk).nombre_sucursal, "Sucursal Prueba")
+
+        # Vencido el intervalo solo se lee la fila de versión
+        self.reloj += 1
+        with self.assertNumQueries(1):
+            self._nombres()
+
+    def test_otro_worker_cambia_la_version(self):
+        self.assertEqual(self._nombres(), ["Sucursal Prueba"])
+        # Cambio hecho por otro worker: la señal no corre aquí, solo sube la versión en BD
+        Sucursal.objects.filter(pk=self.sucursal.pk).update(nombre_sucursal="Renombrada")
+        cache_manager.incrementar_version(cache_manager.NOMBRE_VERSION_CATALOGOS)
+
+        self.assertEqual(self._nombres(), ["Sucursal Prueba"])
+        self.reloj += cache_manager.SEGUNDOS_VERIFICACION_CATALOGOS
+        self.assertEqual(self._nombres(), ["Renombrada"])
+
+    def test_la_senal_invalida_al_confirmar(self):
+        version = cache_manager.obtener_version_catalogos()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Horario.objects.create(hora_entrada=time(8), hora_salida=time(16), descripcion_horario="Prueba 8-16")
+
+        self.assertEqual(cache_manager.obtener_version_catalogos(), version + 1)
+        self.assertEqual([h.descripcion_horario for h in cache_manager.obtener_horarios()], ["Prueba 8-16"])
+
+
+class LlaveEmpleadoEnteraTests(SimpleTestCase):
+    def test_normalizar_codigos(self):
+        codigos = normalizar_codigos_empleado(["123", 123.0, 124, "12.5", "abc", None])
+
+        self.assertEqual(str(codigos.dtype), "Int64")
+        self.assertEqual(codigos.tolist(), [123, 123, 124, pd.NA, pd.NA, pd.NA])
+
+    def test_checadas_con_llave_entera(self):
+        checadas = AttendanceProcessor().preparar_checadas(
+            _checadas("0007", "2025-01-14", ["08:00:00"]) + _checadas("sin-codigo", "2025-01-14", ["09:00:00"])
+        )
+
+        self.assertEqual(str(checadas["employee"].dtype), "int64")
+        self.assertEqual(checadas["employee"].tolist(), [7])
+
+    def test_permisos_del_erp_cruzan_con_la_llave_entera(self):
+        # El ERP manda el código como texto; el detalle ya trae la llave entera
+        permisos = {"7": {date(2025, 1, 14): {"is_half_day": False}, date(2025, 1, 15): {"is_half_day": True}}}
+        detalle = pd.DataFrame({
+            "employee": pd.array([7, 7, 7, 8], dtype="int64"),
+            "dia": pd.to_datetime(["2025-01-14", "2025-01-15", "2025-01-16", "2025-01-14"]),
+            "horas_esperadas": _horas(8, 8, 8, 8),
+        })
+
+        detalle = AttendanceProcessor().aplicar_permisos_detallados(detalle, permisos)
+        self.assertEqual(detalle["tiene_permiso"].tolist(), [True, True, False, False])
+        self.assertEqual(detalle["horas_permiso"].tolist(), _horas(8, 4, 0, 0).tolist())
 
-# Create your tests here.
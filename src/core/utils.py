@@ -3,6 +3,7 @@ Utility functions for the attendance reporting system.
 Contains helper functions for data manipulation, calculations, and formatting.
 """
 
+import json
 import re
 import unicodedata
 import pandas as pd
@@ -42,6 +43,58 @@ def normalize_leave_type(leave_type: str) -> str:
     return aliases.get(cleaned, cleaned)
 
 
+def normalizar_texto_busqueda(texto: str) -> str:
+    """
+    Normalizes free text for accent-insensitive search (lowercase, no accents, single spaces).
+    Mirrors the f_unaccent(lower(...)) expression used by the employee search index.
+    """
+    if not texto:
+        return ""
+    return re.sub(r"\s+", " ", _strip_accents(str(texto)).lower()).strip()
+
+
+def _duraciones_iso(serie: pd.Series) -> pd.Series:
+    """
+    Spells timedeltas the way DjangoJSONEncoder does ('P1DT02H03M04S', '-P0DT00H30M00S'),
+    vectorized, so report payloads keep the format they had before; NaT becomes None.
+    """
+    componentes = serie.abs().dt.components.fillna(0).astype('int64')
+
+    def dos_digitos(columna):
+        return componentes[columna].astype(str).str.zfill(2)
+
+    micros = componentes['milliseconds'] * 1000 + componentes['microseconds']
+    fraccion = ('.' + micros.astype(str).str.zfill(6)).where(micros > 0, '')
+    texto = ('P' + componentes['days'].astype(str) + 'DT' + dos_digitos('hours') + 'H'
+             + dos_digitos('minutes') + 'M' + dos_digitos('seconds') + fraccion + 'S')
+    texto = texto.where(serie >= pd.Timedelta(0), '-' + texto)
+    return texto.astype(object).where(serie.notna(), None)
+
+
+def dataframe_to_json(df: pd.DataFrame, columnar: bool = False) -> str:
+    """
+    Serializes a DataFrame straight to JSON text with pandas' C encoder,
+    without building a dict per row or boxing NumPy scalars.
+
+    Args:
+        df: DataFrame to serialize
+        columnar: If True, returns {"columns": [...], "data": [[...], ...]} so column
+            names are not repeated in every row; otherwise a list of records
+
+    Returns:
+        JSON text (NaN/NaT become null, timedeltas ISO 8601 durations as Django spells them)
+    """
+    duraciones = [c for c, tipo in df.dtypes.items() if tipo.kind == 'm']
+    if duraciones:
+        df = df.assign(**{c: _duraciones_iso(df[c]) for c in duraciones})
+    opciones = dict(date_format="iso", double_precision=15, force_ascii=False)
+    if columnar:
+        # orient="values" is much faster than orient="split" on object columns
+        columnas = json.dumps([str(c) for c in df.columns], ensure_ascii=False)
+        return f'{{"columns": {columnas}, "data": {df.to_json(orient="values", **opciones)}}}'
+    return df.to_json(orient="records", **opciones)
+
+
 def calcular_proximidad_horario(checada: str, hora_prog: str) -> float:
     """
     Calculates proximity in minutes between a check-in and a scheduled time.
@@ -204,6 +257,41 @@ def truncate_name(name: str, max_length: int = 20) -> str:
     return name[:max_length] + "…" if len(name) > max_length else name
 
 
+def normalizar_codigos_empleado(valores) -> pd.Series:
+    """
+    Converts raw employee identifiers ("123", 123.0, 123) to a canonical int64 key.
+
+    Args:
+        valores: Iterable or Series with the identifiers received from the API
+
+    Returns:
+        Nullable Int64 Series; identifiers that are not numeric become <NA>
+    """
+    serie = valores if isinstance(valores, pd.Series) else pd.Series(list(valores), dtype=object)
+    numeros = pd.to_numeric(serie, errors="coerce")
+    return numeros.where(numeros % 1 == 0).astype("Int64")
+
+
+def permisos_por_dia(permisos_dict: dict) -> pd.DataFrame:
+    """
+    Flattens the leave dict of procesar_permisos_empleados into one row per day.
+
+    Args:
+        permisos_dict: {employee: {date: info}} as returned by procesar_permisos_empleados
+
+    Returns:
+        DataFrame with employee (int64), dia (datetime64) and medio_dia (bool),
+        one row per (employee, dia)
+    """
+    registros = [(emp_code, fecha, bool(info.get("is_half_day", False)))
+                 for emp_code, permisos in permisos_dict.items() for fecha, info in permisos.items()]
+    df = pd.DataFrame(registros, columns=["employee", "dia", "medio_dia"])
+    df["employee"] = normalizar_codigos_empleado(df["employee"])
+    df = df.dropna(subset=["employee"]).astype({"employee": "int64"})
+    df["dia"] = pd.to_datetime(df["dia"])
+    return df.drop_duplicates(["employee", "dia"], keep="last")
+
+
 def obtener_codigos_empleados_api(checkin_data: list) -> list:
     """
     Extracts employee codes from API check-in data.
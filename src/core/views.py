@@ -6,11 +6,16 @@ from django.utils import timezone
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
+from asgiref.sync import sync_to_async
+from functools import wraps
 from django.views.decorators.http import require_http_methods
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
-from django.db.models import Q # Para el filtro en exportar_lista_empleados_excel
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch # Para la exportación a Excel
 from django.utils.encoding import escape_uri_path # Para manejar nombres de archivo
+from django.utils.dateparse import parse_date
 import traceback # Para un mejor manejo de errores en debug
 from django.contrib.auth import update_session_auth_hash
 
@@ -20,10 +25,12 @@ from django.template.loader import render_to_string
 from django.views.decorators.csrf import csrf_exempt
 # Imports de librerías externas
 import json
+import pandas as pd
 from io import BytesIO
 import openpyxl
 from openpyxl.styles import PatternFill, Border, Side, Alignment, Font, colors
 from openpyxl.utils import get_column_letter
+from openpyxl.cell import WriteOnlyCell
 
 # Imports de tus propios archivos de la aplicación
 from .services import (
@@ -32,14 +39,140 @@ from .services import (
     asignar_rol_service,
     eliminar_admin_service,
     obtener_admin_por_id_service,
-    actualizar_datos_basicos_empleado_service # Si se usa en otra vista
+    actualizar_datos_basicos_empleado_service, # Si se usa en otra vista
+    listar_empleados,
+    importar_empleados_service,
+    reasignar_horarios_service
 )
-from .models import Sucursal, Horario, Empleado, AsignacionHorario, DiaSemana
+from .models import Horario, Empleado, AsignacionHorario
+from .db_postgres_connection import filtrar_busqueda_empleados, buscar_empleados
+from .cache_manager import (
+    obtener_dias_semana, obtener_sucursales, obtener_horarios,
+    obtener_version, obtener_version_catalogos, NOMBRE_VERSION_ASIGNACIONES,
+    obtener_con_revalidacion, SEGUNDOS_REPORTE_FRESCO
+)
+from .utils import dataframe_to_json
 from .main import generar_reporte_completo, generar_reporte_detalle_completo, generar_datos_dashboard_general,generar_datos_dashboard_31pte,generar_datos_dashboard_villas,generar_datos_dashboard_nave
-from django.views.decorators.http import require_POST
+from .main import aiterar_reporte_detalle, requiere_ventanas, proyectar_dashboard
+from django.views.decorators.http import require_POST, condition
 from django.views.decorators.csrf import csrf_protect
 # Asegurar la importación de Q si no se hace al inicio
 
+# =======================================================
+# === ETAGS (GET condicional, 304 si no hubo cambios) ===
+# =======================================================
+def etag_catalogos(request, *args, **kwargs):
+    return f"catalogos-{obtener_version_catalogos()}"
+
+def etag_horarios_empleado(request, empleado_id, *args, **kwargs):
+    return f"horarios-{empleado_id}-{obtener_version_catalogos()}-{obtener_version(NOMBRE_VERSION_ASIGNACIONES)}"
+
+# =======================================================
+# === REPORTES (último resultado bueno + refresco en segundo plano) ===
+# =======================================================
+def _normalizar_parametros_reporte(params):
+    """'2025-1-5' y '2025-01-05', o ' Villas' y 'Villas', deben dar la misma llave."""
+    normalizados = {}
+    for nombre, valor in params.items():
+        valor = valor.strip() if isinstance(valor, str) else valor
+        if nombre in ("start_date", "end_date"):
+            try:
+                fecha = parse_date(valor)
+            except ValueError:
+                fecha = None
+            valor = fecha.isoformat() if fecha else valor
+        normalizados[nombre] = valor
+    return normalizados
+
+def _lista_parametro(request, nombre):
+    """'?sections=branches,period_summary' -> ('branches', 'period_summary'); None si no viene."""
+    valores = {v.strip() for v in request.GET.get(nombre, "").split(",") if v.strip()}
+    return tuple(sorted(valores)) or None
+
+def _proyeccion_dashboard(request):
+    """?sections= y ?fields= se aplican al dashboard completo ya en caché (no forman parte de la llave)."""
+    secciones, campos = _lista_parametro(request, "sections"), _lista_parametro(request, "fields")
+    return lambda resultado: proyectar_dashboard(resultado, secciones, campos)
+
+def _clave_reporte(nombre, params):
+    return f"core:reporte:{nombre}:" + ":".join(f"{k}={v}" for k, v in sorted(params.items()))
+
+def _version_reportes():
+    return (obtener_version_catalogos(), obtener_version(NOMBRE_VERSION_ASIGNACIONES))
+
+def _es_reporte_cacheable(resultado):
+    return bool(resultado.get("success"))
+
+def _serializar_reporte(resultado, columnar=False):
+    """
+    JSON del resultado; si 'data' es un DataFrame se escribe directo con pandas.
+    columnar=True (?formato=columnas) envía {"columns": [...], "data": [[...]]}.
+    """
+    datos = resultado.get("data")
+    if not isinstance(datos, pd.DataFrame):
+        if columnar and isinstance(datos, list) and not datos:
+            resultado = {**resultado, "data": {"columns": [], "data": []}}
+        return json.dumps(resultado, cls=DjangoJSONEncoder)
+    resto = {k: v for k, v in resultado.items() if k != "data"}
+    return json.dumps(resto, cls=DjangoJSONEncoder)[:-1] + ', "data": ' + dataframe_to_json(datos, columnar) + "}"
+
+def _json_con_edad(resultado, edad, columnar=False):
+    respuesta = HttpResponse(_serializar_reporte(resultado, columnar), content_type="application/json")
+    if edad is not None:
+        respuesta['Age'] = str(int(edad))
+        if edad >= SEGUNDOS_REPORTE_FRESCO:
+            respuesta['X-Datos-Obsoletos'] = 'true'
+    return respuesta
+
+def _obtener_reporte(nombre, generar, params):
+    return obtener_con_revalidacion(
+        _clave_reporte(nombre, params), lambda: generar(**params),
+        version=_version_reportes(), es_cacheable=_es_reporte_cacheable
+    )
+
+async def _arespuesta_reporte(nombre, generar, columnar=False, proyectar=None, **params):
+    """
+    Sirve el reporte desde caché aunque esté vencido (con su edad en el header Age) y lo
+    refresca en segundo plano, para no bloquear el worker cuando el ERP está lento o caído.
+    Peticiones idénticas simultáneas comparten un solo cálculo (llave con parámetros
+    normalizados), también entre workers gracias al advisory lock de calcular_una_vez.
+    El cálculo corre en un hilo del executor (no en el hilo compartido de la petición),
+    así varios reportes avanzan en paralelo sin bloquear el event loop.
+    'proyectar' recorta el resultado ya cacheado antes de serializarlo.
+    """
+    params = _normalizar_parametros_reporte(params)
+    resultado, edad = await sync_to_async(_obtener_reporte, thread_sensitive=False)(nombre, generar, params)
+    if proyectar is not None:
+        resultado = proyectar(resultado)
+    return _json_con_edad(resultado, edad, columnar)
+
+async def _json_por_ventanas(resultados):
+    """
+    JSON de un reporte largo escrito conforme llega cada ventana de fechas. Siempre en
+    registros (no columnar): las columnas checado_N cambian de una ventana a otra.
+    """
+    yield '{"data": ['
+    separador = ''
+    async for resultado in resultados:
+        if not resultado.get("success"):
+            yield '], ' + json.dumps({"success": False, "error": resultado.get("error")})[1:]
+            return
+        datos = resultado.get("data")
+        if isinstance(datos, pd.DataFrame) and not datos.empty:
+            yield separador + dataframe_to_json(datos)[1:-1]
+            separador = ', '
+    yield '], "success": true}'
+
+def _login_requerido_async(vista):
+    """login_required para vistas async (el de Django 5.0 solo envuelve vistas síncronas)."""
+    @wraps(vista)
+    async def envoltura(request, *args, **kwargs):
+        usuario = await request.auser()
+        if not usuario.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await vista(request, *args, **kwargs)
+    return envoltura
+
 # =======================================================
 # === VISTAS PRINCIPALES ===
 # =======================================================
@@ -115,12 +248,10 @@ def manager_page(request):
 # =======================================================
 @login_required
 def gestion_empleados(request):
-    # CRUCIAL: Usar Empleado.all_objects para listar activos y eliminados.
-    empleados = Empleado.all_objects.all() 
-    sucursales = Sucursal.objects.all()
-    horarios = Horario.objects.all()
+    # La tabla (activos y eliminados) se carga por páginas desde /api/lista_empleados/
+    sucursales = obtener_sucursales()
+    horarios = obtener_horarios()
     return render(request, "gestion_empleados.html", {
-        "empleados": empleados,
         "sucursales": sucursales,
         "horarios": horarios,
     })
@@ -133,21 +264,18 @@ def exportar_lista_empleados_excel(request):
     try:
         search_term = request.GET.get('q', '').strip()
         
-        empleados = Empleado.all_objects.all().order_by('empleado_id')
+        # Empleados y sus asignaciones en una sola pasada (sin consultas por empleado)
+        empleados = Empleado.all_objects.select_related('user').prefetch_related(
+            Prefetch('asignaciones', queryset=AsignacionHorario.objects.select_related('sucursal', 'horario', 'dia_especifico', 'tipo_turno'))
+        ).order_by('empleado_id')
 
         if search_term:
-            empleados = empleados.filter(
-                Q(nombre__icontains=search_term) |
-                Q(apellido_paterno__icontains=search_term) |
-                Q(apellido_materno__icontains=search_term) |
-                Q(email__icontains=search_term) |
-                Q(codigo_frappe__icontains=search_term) |
-                Q(codigo_checador__icontains=search_term)
-            )
+            # Búsqueda sin acentos sobre el índice trigram (nombre, apellidos, email y códigos)
+            empleados = filtrar_busqueda_empleados(empleados, search_term)
 
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Reporte RH"
+        # Libro en modo streaming: cada fila se escribe y se libera
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(title="Reporte RH")
 
         # =========================================
         # 🎨 DEFINICIÓN DE ESTILOS (Fondo Blanco)
@@ -172,6 +300,17 @@ def exportar_lista_empleados_excel(request):
         status_baja_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
         status_baja_font = Font(color="9C0006", name='Calibri')
 
+        align_left = Alignment(horizontal='left', vertical='center')
+        align_top_wrap = Alignment(horizontal='left', vertical='top', wrap_text=True)
+        align_center = Alignment(horizontal='center', vertical='center')
+
+        # En modo streaming, anchos y paneles se definen antes de escribir filas
+        column_widths = [6, 9, 10, 18, 15, 15, 25, 18, 55, 15, 15, 12, 15]
+        for i, width in enumerate(column_widths, 1):
+            ws.column_dimensions[get_column_letter(i)].width = width
+
+        ws.freeze_panes = 'A2'
+
         # =========================================
         # ENCABEZADOS
         # =========================================
@@ -180,18 +319,20 @@ def exportar_lista_empleados_excel(request):
             'Apellido Materno', 'Email', 'Sucursal(es)', 'Resumen de Horarios', 
             'Usuario Sistema', 'Estatus', 'Fecha Baja', 'Baja Por'
         ]
-        ws.append(headers)
-
-        for cell in ws[1]:
+        header_cells = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
             cell.border = thin_border
             cell.fill = header_fill
             cell.font = header_font
             cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+            header_cells.append(cell)
+        ws.append(header_cells)
 
         # =========================================
-        # PROCESAR DATOS
+        # PROCESAR DATOS (cursor del servidor por bloques)
         # =========================================
-        for i, emp in enumerate(empleados, start=2):
+        for emp in empleados.iterator(chunk_size=500):
             
             # --- A) Datos ---
             if emp.is_deleted: estatus = "BAJA DEFINITIVA"
@@ -202,7 +343,7 @@ def exportar_lista_empleados_excel(request):
             baja_por = emp.deleted_by if emp.deleted_by else '-'
             usuario_sis = emp.user.username if emp.user else ''
 
-            asignaciones = emp.asignaciones.select_related('sucursal', 'horario', 'dia_especifico', 'tipo_turno').all()
+            asignaciones = emp.asignaciones.all()
             sucursales_set = set()
             detalles_horario = []
 
@@ -236,40 +377,34 @@ def exportar_lista_empleados_excel(request):
                 sucursales_str, celda_horario_final, usuario_sis,
                 estatus, fecha_baja, baja_por
             ]
-            ws.append(row_data)
-            current_row = ws.max_row
 
             # --- C) Estilos (Sin fondo gris) ---
-            for col_idx, cell in enumerate(ws[current_row], start=1):
+            row_cells = []
+            for col_idx, value in enumerate(row_data, start=1):
+                cell = WriteOnlyCell(ws, value=value)
                 cell.font = standard_font
                 cell.border = thin_border
-                # Ya NO aplicamos cell.fill = row_even_fill
 
                 if col_idx in [4, 5, 6, 7]: 
-                     cell.alignment = Alignment(horizontal='left', vertical='center')
+                     cell.alignment = align_left
                 elif col_idx == 9: 
-                     cell.alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
+                     cell.alignment = align_top_wrap
                 else: 
-                     cell.alignment = Alignment(horizontal='center', vertical='center')
-
-            # Semáforo Estatus
-            status_cell = ws.cell(row=current_row, column=11)
-            if status_cell.value == "ACTIVO":
-                status_cell.fill = status_active_fill
-                status_cell.font = status_active_font
-            elif "SUSPENDIDO" in status_cell.value:
-                status_cell.fill = status_suspend_fill
-                status_cell.font = status_suspend_font
-            elif "BAJA" in status_cell.value:
-                status_cell.fill = status_baja_fill
-                status_cell.font = status_baja_font
-    
-        # Ajustar anchos
-        column_widths = [6, 9, 10, 18, 15, 15, 25, 18, 55, 15, 15, 12, 15]
-        for i, width in enumerate(column_widths, 1):
-            ws.column_dimensions[get_column_letter(i)].width = width
-
-        ws.freeze_panes = 'A2'
+                     cell.alignment = align_center
+
+                # Semáforo Estatus
+                if col_idx == 11:
+                    if estatus == "ACTIVO":
+                        cell.fill = status_active_fill
+                        cell.font = status_active_font
+                    elif "SUSPENDIDO" in estatus:
+                        cell.fill = status_suspend_fill
+                        cell.font = status_suspend_font
+                    elif "BAJA" in estatus:
+                        cell.fill = status_baja_fill
+                        cell.font = status_baja_font
+                row_cells.append(cell)
+            ws.append(row_cells)
 
         buffer = BytesIO()
         wb.save(buffer)
@@ -303,6 +438,31 @@ def crear_empleado(request):
         return redirect('admin-gestion-empleados')
     return render(request, "gestion_empleados.html")
 
+@login_required
+@require_http_methods(["POST"])
+def api_importar_empleados(request):
+    """
+    Importa empleados y horarios desde un xlsx/csv (campo 'archivo').
+    Con simular=1 solo valida. Responde con el reporte de errores por fila.
+    """
+    if not request.user.groups.filter(name="Admin").exists():
+        return JsonResponse({"success": False, "error": "Solo un administrador puede importar empleados."}, status=403)
+    archivo = request.FILES.get('archivo')
+    if not archivo:
+        return JsonResponse({"error": "No se recibió ningún archivo."}, status=400)
+    if not archivo.name.lower().endswith(('.xlsx', '.csv')):
+        return JsonResponse({"error": "El archivo debe ser .xlsx o .csv."}, status=400)
+
+    try:
+        simular = request.POST.get('simular') in ('1', 'true', 'si')
+        resultado = importar_empleados_service(archivo, archivo.name, simular=simular)
+        return JsonResponse({"success": True, "simulacion": simular, **resultado})
+    except ValidationError as e:
+        return JsonResponse({"success": False, "error": " ".join(e.messages)}, status=400)
+    except Exception as e:
+        traceback.print_exc()
+        return JsonResponse({"success": False, "error": f"Error al importar: {str(e)}"}, status=500)
+
 # =======================================================
 # 10. VISTA DE ELIMINACIÓN (CORREGIDA: Usa el método .delete() del modelo)
 # =======================================================
@@ -383,43 +543,45 @@ def gestion_usuarios(request):
 
 @login_required
 def reporte_horas(request):
-    sucursales = Sucursal.objects.all()
+    sucursales = obtener_sucursales()
     return render(request, "reporte_horas.html", {"sucursales": sucursales})
 
 @login_required
 def lista_asistencias(request):
-    sucursales = Sucursal.objects.all()
+    sucursales = obtener_sucursales()
     return render(request, "lista_asistencias.html", {"sucursales": sucursales})
 
 @require_http_methods(["GET"])
 def health_check(request):
     return JsonResponse({'status': 'healthy'}, status=200)
 
-@login_required
+@_login_requerido_async
 @require_http_methods(["GET"])
-def api_reporte_horas(request):
+async def api_reporte_horas(request):
     try:
         start_date = request.GET.get("startDate")
         end_date = request.GET.get("endDate") 
         sucursal = request.GET.get("sucursal", "Todas")
         if not start_date or not end_date:
             return JsonResponse({"error": "Debe proporcionar fecha de inicio y fin."}, status=400)
-        resultado = generar_reporte_completo(start_date=start_date, end_date=end_date, sucursal=sucursal)
-        return JsonResponse(resultado)
+        return await _arespuesta_reporte("reporte_horas", generar_reporte_completo, columnar=request.GET.get("formato") == "columnas", start_date=start_date, end_date=end_date, sucursal=sucursal)
     except Exception as e:
         return JsonResponse({"success": False, "error": f"Error interno del servidor: {str(e)}"}, status=500)
 
-@login_required
+@_login_requerido_async
 @require_http_methods(["GET"])
-def api_reporte_detalle(request):
+async def api_reporte_detalle(request):
     try:
         start_date = request.GET.get("startDate")
         end_date = request.GET.get("endDate")
         sucursal = request.GET.get("sucursal", "Todas")
         if not start_date or not end_date:
             return JsonResponse({"success": False, "error": "Debe proporcionar fecha de inicio y fin."}, status=400)
-        resultado = generar_reporte_detalle_completo(start_date=start_date, end_date=end_date, sucursal=sucursal)
-        return JsonResponse(resultado)
+        if requiere_ventanas(start_date, end_date):
+            # Rango largo: se envía mes por mes en lugar de armar (y cachear) todo en memoria
+            return StreamingHttpResponse(_json_por_ventanas(aiterar_reporte_detalle(start_date, end_date, sucursal)),
+                                         content_type="application/json")
+        return await _arespuesta_reporte("reporte_detalle", generar_reporte_detalle_completo, columnar=request.GET.get("formato") == "columnas", start_date=start_date, end_date=end_date, sucursal=sucursal)
     except Exception as e:
         return JsonResponse({"success": False, "error": f"Error interno del servidor: {str(e)}"}, status=500)
 
@@ -432,17 +594,17 @@ def grafica_general(request):
     }
     return render(request, "grafica_general.html", context) 
 
-@login_required
+@_login_requerido_async
 @require_http_methods(["GET"])
-def api_dashboard_general(request):
+async def api_dashboard_general(request):
     try:
         start_date = request.GET.get("startDate")
         end_date = request.GET.get("endDate")
         if not start_date or not end_date:
             return JsonResponse({"success": False, "error": "Fechas de inicio y fin son requeridas."}, status=400)
         
-        resultado = generar_datos_dashboard_general(start_date=start_date, end_date=end_date)
-        return JsonResponse(resultado)
+        return await _arespuesta_reporte("dashboard_general", generar_datos_dashboard_general,
+            proyectar=_proyeccion_dashboard(request), start_date=start_date, end_date=end_date)
 
     except Exception as e:
         return JsonResponse({"success": False, "error": f"Error interno del servidor: {str(e)}"}, status=500)
@@ -798,17 +960,17 @@ def grafica_31pte(request):
     }
     return render(request, "grafica_31pte.html", context)
 
-@login_required
+@_login_requerido_async
 @require_http_methods(["GET"])
-def api_dashboard_31pte(request):
+async def api_dashboard_31pte(request):
     try:
         start_date = request.GET.get("startDate")
         end_date = request.GET.get("endDate")
         if not start_date or not end_date:
             return JsonResponse({"success": False, "error": "Fechas de inicio y fin son requeridas."}, status=400)
         
-        resultado = generar_datos_dashboard_31pte(start_date=start_date, end_date=end_date)
-        return JsonResponse(resultado)
+        return await _arespuesta_reporte("dashboard_31pte", generar_datos_dashboard_31pte,
+            proyectar=_proyeccion_dashboard(request), start_date=start_date, end_date=end_date)
 
     except Exception as e:
         return JsonResponse({"success": False, "error": f"Error interno del servidor: {str(e)}"}, status=500)
@@ -822,17 +984,17 @@ def grafica_villas(request):
     }
     return render(request, "grafica_villas.html", context) 
 
-@login_required
+@_login_requerido_async
 @require_http_methods(["GET"])
-def api_dashboard_villas(request):
+async def api_dashboard_villas(request):
     try:
         start_date = request.GET.get("startDate")
         end_date = request.GET.get("endDate")
         if not start_date or not end_date:
             return JsonResponse({"success": False, "error": "Fechas de inicio y fin son requeridas."}, status=400)
         
-        resultado = generar_datos_dashboard_villas(start_date=start_date, end_date=end_date)
-        return JsonResponse(resultado)
+        return await _arespuesta_reporte("dashboard_villas", generar_datos_dashboard_villas,
+            proyectar=_proyeccion_dashboard(request), start_date=start_date, end_date=end_date)
 
     except Exception as e:
         return JsonResponse({"success": False, "error": f"Error interno del servidor: {str(e)}"}, status=500)
@@ -846,26 +1008,27 @@ def grafica_nave(request):
     }
     return render(request, "grafica_nave.html", context) 
 
-@login_required
+@_login_requerido_async
 @require_http_methods(["GET"])
-def api_dashboard_nave(request):
+async def api_dashboard_nave(request):
     try:
         start_date = request.GET.get("startDate")
         end_date = request.GET.get("endDate")
         if not start_date or not end_date:
             return JsonResponse({"success": False, "error": "Fechas de inicio y fin son requeridas."}, status=400)
         
-        resultado = generar_datos_dashboard_nave(start_date=start_date, end_date=end_date)
-        return JsonResponse(resultado)
+        return await _arespuesta_reporte("dashboard_nave", generar_datos_dashboard_nave,
+            proyectar=_proyeccion_dashboard(request), start_date=start_date, end_date=end_date)
 
     except Exception as e:
         return JsonResponse({"success": False, "error": f"Error interno del servidor: {str(e)}"}, status=500)
 
 @login_required
 @require_http_methods(["GET"])
+@condition(etag_func=etag_catalogos)
 def api_lista_sucursales(request):
     try:
-        sucursales = Sucursal.objects.all()
+        sucursales = obtener_sucursales()
         data = [
             {"id": s.sucursal_id, "nombre": s.nombre_sucursal} 
             for s in sucursales
@@ -877,14 +1040,61 @@ def api_lista_sucursales(request):
 
 @login_required
 @require_http_methods(["GET"])
+def api_lista_empleados(request):
+    """
+    Una página de empleados activos con horario asignado.
+    Parámetros: q (búsqueda), limite (máx. 200), despues_de (empleado_id de la página anterior),
+    bajas=1 (incluye dados de baja) y con_horario=0 (incluye los que no tienen horario).
+    """
+    try:
+        limite = min(max(int(request.GET.get('limite', 50)), 1), 200)
+        despues_de = request.GET.get('despues_de')
+        despues_de = int(despues_de) if despues_de else None
+    except ValueError:
+        return JsonResponse({"error": "Parámetros de paginación inválidos."}, status=400)
+
+    try:
+        data = listar_empleados(
+            request.GET.get('q', '').strip(), limite, despues_de,
+            incluir_bajas=request.GET.get('bajas') == '1',
+            solo_con_horario=request.GET.get('con_horario') != '0',
+        )
+        return JsonResponse(data)
+    except Exception as e:
+        return JsonResponse({"error": f"Error en API empleados: {str(e)}"}, status=500)
+
+
+@login_required
+@require_http_methods(["GET"])
+def api_buscar_empleados(request):
+    """
+    Búsqueda mientras se escribe: ?q=texto&pagina=1&limite=20&bajas=1 (incluye dados de baja).
+    Resultados ordenados por similitud, sin distinguir acentos ni mayúsculas.
+    """
+    try:
+        pagina = max(int(request.GET.get('pagina', 1)), 1)
+        limite = min(max(int(request.GET.get('limite', 20)), 1), 100)
+    except ValueError:
+        return JsonResponse({"error": "Parámetros de paginación inválidos."}, status=400)
+
+    try:
+        data = buscar_empleados(request.GET.get('q', ''), limite, pagina, incluir_bajas=request.GET.get('bajas') == '1')
+        return JsonResponse(data)
+    except Exception as e:
+        return JsonResponse({"error": f"Error en la búsqueda: {str(e)}"}, status=500)
+
+
+@login_required
+@require_http_methods(["GET"])
+@condition(etag_func=etag_catalogos)
 def api_lista_horarios(request):
     """
     Envía una lista de todos los horarios en formato JSON
     para rellenar los <select> del modal de edición.
     """
     try:
-        # Tus modelos ya están importados al inicio del archivo
-        horarios = Horario.objects.all().order_by('hora_entrada') # Ordenar para mejor UX
+        # Catálogo en memoria (ya viene ordenado por hora de entrada para mejor UX)
+        horarios = obtener_horarios()
         
         data = []
         for h in horarios:
@@ -919,6 +1129,7 @@ def api_lista_horarios(request):
 
 @login_required
 @require_http_methods(["GET"])
+@condition(etag_func=etag_horarios_empleado)
 def get_horarios_empleado(request, empleado_id):
     try:
         empleado = get_object_or_404(Empleado.all_objects, empleado_id=empleado_id)
@@ -928,14 +1139,8 @@ def get_horarios_empleado(request, empleado_id):
         ).select_related('sucursal', 'horario', 'dia_especifico', 'tipo_turno')
         
         # Cargamos todos los días (1=Lunes ... 7=Domingo)
-        todos_los_dias = list(DiaSemana.objects.all().order_by('dia_id'))
+        todos_los_dias = obtener_dias_semana()
         
-        # 🗺️ MAPA DE DECODIFICACIÓN (Igual que tu SQL)
-        # X es Miércoles en tu sistema
-        mapa_dias = {
-            'L': 1, 'M': 2, 'X': 3, 'J': 4, 'V': 5, 'S': 6, 'D': 7
-        }
-
         grupos_de_horarios = {}
 
         for a in asignaciones:
@@ -943,7 +1148,7 @@ def get_horarios_empleado(request, empleado_id):
                 continue
 
             # =========================================================
-            # 🧩 DECODIFICADOR DE TURNOS (Lógica de tu SQL portada a Python)
+            # 🧩 DÍAS DEL TURNO (máscara de bits precalculada en TipoTurno)
             # =========================================================
             dias_permitidos = [] # Aquí guardaremos los IDs de días (1, 2, 3...)
 
@@ -953,34 +1158,12 @@ def get_horarios_empleado(request, empleado_id):
             
             # CASO B: Es un Turno General (L-V, X,J,V, etc.)
             elif a.tipo_turno:
-                codigo = a.tipo_turno.descripcion.upper().replace(" ", "") # Ej: "L-V" o "X,J,V"
-                
-                # Sub-caso 1: Rangos con guión (Ej: "L-V" o "L-J")
-                if '-' in codigo:
-                    try:
-                        inicio_letra, fin_letra = codigo.split('-')
-                        inicio = mapa_dias.get(inicio_letra, 1)
-                        fin = mapa_dias.get(fin_letra, 7)
-                        # Creamos el rango (ej. de 1 a 5)
-                        dias_permitidos = list(range(inicio, fin + 1))
-                    except:
-                        # Si falla, por seguridad damos Lunes a Sábado
-                        dias_permitidos = [1, 2, 3, 4, 5, 6]
-
-                # Sub-caso 2: Listas con comas o letras juntas (Ej: "L,X,V" o "LXV")
-                else:
-                    for letra, id_dia in mapa_dias.items():
-                        if letra in codigo:
-                            dias_permitidos.append(id_dia)
+                dias_permitidos = [dia.dia_id for dia in todos_los_dias if a.tipo_turno.incluye_dia(dia.dia_id)]
             
             # CASO C: No tiene nada (Backup de seguridad)
             else:
                 dias_permitidos = [1, 2, 3, 4, 5, 6] # L-S por defecto
 
-            # =========================================================
-            # FIN DEL DECODIFICADOR
-            # =========================================================
-
             # Definir Texto del Horario
             if a.horario:
                 h_id = a.horario.horario_id
@@ -1036,6 +1219,33 @@ def get_horarios_empleado(request, empleado_id):
         traceback.print_exc() 
         return JsonResponse({"error": f"Error interno: {str(e)}"}, status=500)
 
+@login_required
+@require_http_methods(["POST"])
+def api_reasignar_horarios(request):
+    """
+    Reasignación masiva: {sucursal_id, horario_id, tipo_turno_id, nuevo_horario_id, aplicar}.
+    Sin "aplicar": true solo devuelve la diferencia para revisarla.
+    """
+    if not request.user.groups.filter(name="Admin").exists():
+        return JsonResponse({"success": False, "error": "Solo un administrador puede reasignar horarios."}, status=403)
+    try:
+        data = json.loads(request.body or "{}")
+        resultado = reasignar_horarios_service(
+            data.get("nuevo_horario_id"),
+            sucursal_id=data.get("sucursal_id"),
+            horario_id=data.get("horario_id"),
+            tipo_turno_id=data.get("tipo_turno_id"),
+            aplicar=bool(data.get("aplicar")),
+        )
+        return JsonResponse({"success": True, **resultado})
+    except json.JSONDecodeError:
+        return JsonResponse({"success": False, "error": "JSON inválido."}, status=400)
+    except ValidationError as e:
+        return JsonResponse({"success": False, "error": " ".join(e.messages)}, status=400)
+    except Exception as e:
+        traceback.print_exc()
+        return JsonResponse({"success": False, "error": f"Error en la reasignación: {str(e)}"}, status=500)
+
 @login_required
 @require_http_methods(["DELETE"])
 def api_eliminar_horario_flexible(request, horario_id):
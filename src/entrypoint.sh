@@ -9,5 +9,5 @@ echo "Recolectando archivos estáticos..."
 python manage.py collectstatic --noinput
 
 # Iniciando Gunicorn
-echo "Iniciando Gunicorn..."
-exec gunicorn asistencias.wsgi:application --bind 0.0.0.0:8000 --workers=3
\ No newline at end of file
+echo "Iniciando Gunicorn (workers ASGI de uvicorn)..."
+exec gunicorn asistencias.asgi:application --bind 0.0.0.0:8000 --workers=3 --worker-class=uvicorn_worker.UvicornWorker
\ No newline at end of file
@@ -46,27 +46,91 @@ document.addEventListener("DOMContentLoaded", () => {
     // --- Elementos del DOM: Botones de Exportación ---
     const btnExportExcel = document.getElementById("btnExportExcel");
     const btnExportPDF = document.getElementById("btnExportPDF");
-  // =================================================================
-  // LÓGICA DE BÚSQUEDA EN TABLA
-  // =================================================================
-  searchInput.addEventListener("keyup", function () {
-    const filter = searchInput.value.toLowerCase();
-    const rows = tableBody.getElementsByTagName("tr");
-    for (let i = 0; i < rows.length; i++) {
-      const cells = rows[i].getElementsByTagName("td");
-      let match = false;
-      for (let j = 0; j < cells.length; j++) {
-        if (cells[j]) {
-          const text = cells[j].textContent || cells[j].innerText;
-          if (text.toLowerCase().indexOf(filter) > -1) {
-            match = true;
-            break;
-          }
-        }
-      }
-      rows[i].style.display = match ? "" : "none";
-    }
-  });
+  // =================================================================
+  // LISTA PAGINADA DE EMPLEADOS (activos y eliminados, desde la API)
+  // =================================================================
+  const btnCargarMas = document.getElementById("btnCargarMas");
+  // Siguiente página: empleado_id (lista) o número de página (búsqueda); null si no hay más
+  let siguientePagina = null;
+  let consultaActual = 0; // Descarta respuestas de búsquedas anteriores
+  let temporizadorBusqueda = null;
+
+  function escaparHTML(valor) {
+    const reemplazos = { "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;" };
+    return String(valor ?? "").replace(/[&<>"']/g, (c) => reemplazos[c]);
+  }
+
+  function filaEmpleado(emp) {
+    const e = escaparHTML;
+    const acciones = emp.is_deleted
+      ? `<a href="/empleados/restaurar/${emp.empleado_id}/" class="btn btn-warning"
+            onclick="return confirm('¿Estás seguro de que deseas restaurar este empleado?');"
+            title="Restaurar Empleado"><i class="fas fa-undo"></i></a>`
+      : `<a href="#" class="btn btn-success btn-editar" data-id="${emp.empleado_id}"
+            data-frappe="${e(emp.codigo_frappe)}" data-checador="${e(emp.codigo_checador)}"
+            data-nombre="${e(emp.nombre)}" data-paterno="${e(emp.apellido_paterno)}"
+            data-materno="${e(emp.apellido_materno)}" data-email="${e(emp.email)}"><i class="fas fa-edit"></i></a>
+         <a href="/empleados/eliminar/${emp.empleado_id}/" class="btn btn-danger"
+            onclick="return confirm('¿Estás seguro de que deseas eliminar este empleado?');"><i class="fas fa-trash"></i></a>`;
+    return `<tr class="${emp.is_deleted ? "deleted-row" : ""}">
+        <td>${emp.empleado_id}</td><td>${e(emp.codigo_frappe)}</td><td>${e(emp.codigo_checador)}</td>
+        <td>${e(emp.nombre)}</td><td>${e(emp.apellido_paterno)} ${e(emp.apellido_materno)}</td>
+        <td>${e(emp.email)}</td><td class="actions">${acciones}</td></tr>`;
+  }
+
+  // Sin texto: lista completa por empleado_id. Con texto: búsqueda ordenada por
+  // similitud (sin acentos, índice trigram), paginada por número de página.
+  function urlEmpleados(busqueda, reiniciar) {
+    const continuar = !reiniciar && siguientePagina !== null;
+    if (busqueda) {
+      const params = new URLSearchParams({ q: busqueda, bajas: "1", limite: "50", pagina: continuar ? siguientePagina : 1 });
+      return `/api/empleados/buscar/?${params}`;
+    }
+    const params = new URLSearchParams({ bajas: "1", con_horario: "0", limite: "50" });
+    if (continuar) params.set("despues_de", siguientePagina);
+    return `/api/lista_empleados/?${params}`;
+  }
+
+  async function cargarEmpleados(reiniciar) {
+    const consulta = ++consultaActual;
+    const busqueda = searchInput.value.trim();
+
+    btnCargarMas.disabled = true;
+    try {
+      const response = await fetch(urlEmpleados(busqueda, reiniciar));
+      const data = await response.json();
+      if (!response.ok) throw new Error(data.error || "Error al cargar empleados");
+      if (consulta !== consultaActual) return;
+
+      const empleados = busqueda ? data.resultados : data.empleados;
+      const filas = empleados.map(filaEmpleado).join("");
+      if (reiniciar) {
+        tableBody.innerHTML = filas || `<tr><td colspan="9" style="text-align: center">No hay datos</td></tr>`;
+      } else {
+        tableBody.insertAdjacentHTML("beforeend", filas);
+      }
+      siguientePagina = busqueda ? (data.hay_mas ? data.pagina + 1 : null) : data.siguiente;
+    } catch (error) {
+      console.error("Error al cargar empleados:", error);
+      if (reiniciar && consulta === consultaActual) {
+        tableBody.innerHTML = `<tr><td colspan="9" style="text-align: center">Error: ${escaparHTML(error.message)}</td></tr>`;
+        siguientePagina = null;
+      }
+    } finally {
+      if (consulta === consultaActual) {
+        btnCargarMas.style.display = siguientePagina === null ? "none" : "";
+        btnCargarMas.disabled = false;
+      }
+    }
+  }
+
+  // La búsqueda se resuelve en el servidor (mientras se escribe), no sobre las filas ya cargadas
+  searchInput.addEventListener("input", () => {
+    clearTimeout(temporizadorBusqueda);
+    temporizadorBusqueda = setTimeout(() => cargarEmpleados(true), 300);
+  });
+  btnCargarMas.addEventListener("click", () => cargarEmpleados(false));
+  cargarEmpleados(true);
 
   // =================================================================
   // ABRIR MODAL DE AGREGAR (Botón flotante '+')
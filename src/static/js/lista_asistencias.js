@@ -123,6 +123,7 @@ document.addEventListener("DOMContentLoaded", function () {
             startDate: fechaInicio.value,
             endDate: fechaFin.value,
             sucursal: sucursalSelect.value,
+            formato: 'columnas', // columnas + filas: sin repetir nombres de columna por fila
         };
         
         if (!params.startDate || !params.endDate || !params.sucursal) {
@@ -136,7 +137,7 @@ document.addEventListener("DOMContentLoaded", function () {
             const response = await fetch(url);
             const resultado = await response.json();
             if (!resultado.success) throw new Error(resultado.error || 'Error desconocido del servidor');
-            todasLasAsistencias = resultado.data || [];
+            todasLasAsistencias = filasAObjetos(resultado.data);
             filtrarYRenderizar();
         } catch (error) {
             const errorMsg = `<tr><td colspan="10" style="text-align: center;">Error: ${error.message}</td></tr>`;
@@ -145,6 +146,17 @@ document.addEventListener("DOMContentLoaded", function () {
         }
     }
 
+    function filasAObjetos(datos) {
+        if (!datos) return [];
+        if (Array.isArray(datos)) return datos;
+        const { columns, data } = datos;
+        return data.map(fila => {
+            const registro = {};
+            columns.forEach((columna, i) => { registro[columna] = fila[i]; });
+            return registro;
+        });
+    }
+
     function filtrarYRenderizar() {
         const busqueda = buscarEmpleado.value.toLowerCase().trim();
         let datosFiltrados = todasLasAsistencias.filter(item => {